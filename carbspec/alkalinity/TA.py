@@ -1,7 +1,9 @@
 import numpy as np
 import scipy.optimize as opt
 from .species import calc_KF, calc_TF, calc_KS, calc_TS
+from carbspec.profiling import profiled
 
+@profiled()
 def TA_from_pH(pH, m_sample, m_acid, sal, temp, C_acid):
     """
     Calculate alkalinity from titration end-point pH.
@@ -0,0 +1,88 @@
+import datetime as dt
+import threading
+import time
+
+class Clock:
+    """
+    The system clock.
+
+    Sessions and instruments get the time, and wait, through a clock so
+    that it can be replaced with a SimulatedClock (see set_clock).
+    """
+    # whether time passes in real time, so threads can wait for it
+    realtime = True
+
+    def now(self):
+        return dt.datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class SimulatedClock(Clock):
+    """
+    A clock that advances instantly when sleeping.
+
+    Time only passes when something sleeps (e.g. a dummy spectrometer
+    integrating), so simulated timestamps reflect how long a workflow
+    would take on real instruments, but it runs as fast as the computation
+    allows.
+
+    Parameters
+    ----------
+    start : datetime.datetime
+        The simulated time at creation. Defaults to now.
+    """
+    realtime = False
+
+    def __init__(self, start=None):
+        self.start = dt.datetime.now() if start is None else start
+        self.elapsed = 0.
+        self._lock = threading.Lock()
+
+    def now(self):
+        return self.start + dt.timedelta(seconds=self.elapsed)
+
+    def monotonic(self):
+        return self.elapsed
+
+    def perf_counter(self):
+        return self.elapsed
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        with self._lock:
+            self.elapsed += max(seconds, 0)
+
+_clock = Clock()
+
+def get_clock():
+    """
+    Return the clock used by sessions and instruments.
+    """
+    return _clock
+
+def set_clock(clock=None):
+    """
+    Set the clock used by sessions and instruments.
+
+    Parameters
+    ----------
+    clock : Clock
+        The new clock. If None, the system clock is restored.
+
+    Returns
+    -------
+    Clock : the previous clock.
+    """
+    global _clock
+    previous = _clock
+    _clock = Clock() if clock is None else clock
+    return previous
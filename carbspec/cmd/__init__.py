@@ -1 +1,2 @@
-from .session import pHMeasurementSession, TAMeasurementSession
\ No newline at end of file
+from .session import pHMeasurementSession, TAMeasurementSession
+from .manager import SessionManager
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+from configparser import ConfigParser
+from importlib.resources import files
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from .session import pHMeasurementSession, TAMeasurementSession
+
+def _savedirs(sections, config_file=None):
+    """
+    The output directory of each bench, from its config section.
+    """
+    if config_file is None:
+        config_file = str(files('carbspec').joinpath('cmd/resources/carbspec.cfg'))
+    config = ConfigParser()
+    config.read(config_file)
+    
+    # missing sections are left for the sessions to report
+    return {name: os.path.abspath(config[section]['savedir']) for name, section in sections.items() if section in config}
+
+class SessionManager:
+    """
+    Run several measurement sessions (benches) side by side in one process.
+
+    Each bench is a pipelined measurement session with its own instruments,
+    config section and output directory (the `savedir` of its section), and
+    its own acquisition thread, so benches acquire concurrently. Fitting and
+    saving are shared between benches on a common pool of workers.
+
+    Parameters
+    ----------
+    benches : dict
+        Bench names and the keyword arguments of their sessions, e.g.
+        {'bench1': {'section': 'bench1', 'instruments': ReplaySource(...)}}.
+        `section` defaults to the bench name. Spectrometers are selected by
+        the `spec_serialnumber` of each section.
+    config_file : str
+        The config file shared by all benches.
+    fit_workers : int
+        The number of workers fitting and saving samples. Defaults to the
+        number of benches.
+    session_class : class
+        The session run on each bench: pHMeasurementSession, or a subclass
+        that can be pipelined. TAMeasurementSession waits for sample
+        weights to be entered, so cannot be run by the manager.
+    **kwargs
+        Passed to every session.
+    """
+    def __init__(self, benches, config_file=None, fit_workers=None, session_class=pHMeasurementSession, **kwargs):
+        if len(benches) == 0:
+            raise ValueError('At least one bench is required.')
+        if not issubclass(session_class, pHMeasurementSession) or issubclass(session_class, TAMeasurementSession):
+            raise ValueError(f'{session_class.__name__} cannot be pipelined, so cannot be run by SessionManager. Use pHMeasurementSession.')
+        
+        # benches writing to the same directory would overwrite each other's summaries
+        savedirs = {}
+        sections = {name: {'section': name, **kwargs, **bench}['section'] for name, bench in benches.items()}
+        for name, savedir in _savedirs(sections, config_file).items():
+            if savedir in savedirs:
+                raise ValueError(f'Benches {savedirs[savedir]} and {name} both save to {savedir}. Set a different savedir in the config section of each bench.')
+            savedirs[savedir] = name
+
+        self.fit_pool = ThreadPoolExecutor(max_workers=fit_workers or len(benches), thread_name_prefix='carbspec-fit')
+        self._acquisition = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'carbspec-{name}') for name in benches}
+
+        kwargs.setdefault('plotting', False)
+
+        # sessions connect to their instruments concurrently
+        starting = {}
+        for name, bench in benches.items():
+            options = {'section': name, **kwargs, **bench, 'config_file': config_file, 'pipeline': True, 'executor': self.fit_pool}
+            starting[name] = self._acquisition[name].submit(session_class, **options)
+        self.sessions = {name: f.result() for name, f in starting.items()}
+
+    def __getitem__(self, name):
+        return self.sessions[name]
+
+    def __iter__(self):
+        return iter(self.sessions)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def submit(self, name, method, *args, **kwargs):
+        """
+        Call a method of a bench's session on its acquisition thread.
+
+        Returns
+        -------
+        concurrent.futures.Future : the return value of the method.
+        """
+        session = self.sessions[name]
+        return self._acquisition[name].submit(getattr(session, method), *args, **kwargs)
+
+    def run(self, method, *args, **kwargs):
+        """
+        Call a method of every session concurrently, and wait for them all.
+
+        Returns
+        -------
+        dict : the return value for each bench.
+        """
+        futures = {name: self.submit(name, method, *args, **kwargs) for name in self.sessions}
+        return {name: f.result() for name, f in futures.items()}
+
+    def measure(self, name, sample_name=None, **kwargs):
+        """
+        Measure a sample on a bench.
+
+        Returns as soon as the measurement is queued. The returned future
+        completes with (F, K, pH, fit_p) once the sample has been acquired
+        on the bench and fitted on the shared pool.
+
+        Returns
+        -------
+        concurrent.futures.Future
+        """
+        result = Future()
+
+        def chain(acquired):
+            if acquired.exception() is not None:
+                result.set_exception(acquired.exception())
+                return
+            fitted = acquired.result()
+            fitted.add_done_callback(lambda f: result.set_exception(f.exception()) if f.exception() is not None else result.set_result(f.result()))
+
+        self.submit(name, 'measure_sample', sample_name=sample_name, **kwargs).add_done_callback(chain)
+        return result
+
+    def outputs(self):
+        """
+        The output directory of each bench.
+        """
+        return {name: os.path.abspath(s.savedir) for name, s in self.sessions.items()}
+
+    def end(self):
+        """
+        Wait for all benches to finish, end their sessions and shut down the workers.
+        """
+        self.run('end_session')
+        for executor in self._acquisition.values():
+            executor.shutdown()
+        self.fit_pool.shutdown()
@@ -1,10 +1,14 @@
-import datetime as dt
 import os
+import asyncio
 import numpy as np
 import pandas as pd
 from configparser import ConfigParser
 from importlib.resources import files
-import time
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 import pyperclip
 
 try:
@@ -15,19 +19,65 @@ except:
     from carbspec.instruments.dummy import BeamSwitch, Spectrometer, TempProbe
     dummy = True
 
-from carbspec.spectro.spectrum import Spectrum, calc_pH
+default_instruments = SimpleNamespace(Spectrometer=Spectrometer, BeamSwitch=BeamSwitch, TempProbe=TempProbe, dummy=dummy)
+
+# sessions sharing a config file write to it one at a time
+_config_lock = threading.Lock()
+
+from carbspec.spectro.spectrum import Spectrum, LazySpectrum, SpectrumCache, calc_pH
+from carbspec.spectro.dark import DarkModel
+from carbspec.spectro.drift import DriftMonitor
 from carbspec.alkalinity import calc_acid_strength, TA_from_pH
+from carbspec.results import ResultBuffer
+from carbspec.clock import get_clock
+from carbspec.timing import StageTimer, no_timings
+from carbspec.profiling import profiled
+from carbspec.spectro.fitserver import FitClient
+from carbspec.instruments.acquisition import ScanAccumulator
+from carbspec.instruments.aio import AsyncInstrument
+from carbspec.instruments.discovery import DeviceCache
+from uncertainties.unumpy import nominal_values
 from .plot import plot_spectrum
+from .summary import SummaryStore
+from .weights import SampleWeights
 
 class pHMeasurementSession:
-    def __init__(self, dye='MCP', config_file=None, save=True, plotting=True, use_last_setup=False):
+    result_columns = {
+        'sample': 'object',
+        'temp': 'float',
+        'temp_std': 'float',
+        'sal': 'float',
+        'F': 'ufloat',
+        'K': 'ufloat',
+        'pH': 'ufloat',
+        'spectra': 'object',
+        'dat_file': 'object',
+        'pkl_file': 'object',
+    }
+    
+    def __init__(self, dye='MCP', config_file=None, save=True, plotting=True, use_last_setup=False, pipeline=False, pipeline_depth=2, instruments=None, section=None, executor=None):
         
         self.dye = dye
+        # the config section of this session. Sessions running side by side (see cmd.manager) each have their own.
+        self.section = dye if section is None else section
+        self.last_section = 'LAST' if section is None else section
+        # where instrument calibrations (integration time, scans, switch latency) are written
+        self.calibration_section = 'DEFAULT' if section is None else section
+        self.clock = get_clock()
+        
+        # time taken by each stage of starting the session, see startup_report
+        self.startup_times = {}
+        startup_start = self.clock.perf_counter()
+        
+        # anything providing Spectrometer, BeamSwitch and TempProbe factories, e.g. instruments.replay.ReplaySource
+        self.instruments = default_instruments if instruments is None else instruments
+        self.dummy = getattr(self.instruments, 'dummy', False)
         
         if config_file is None:
             config_file = str(files('carbspec').joinpath('cmd/resources/carbspec.cfg'))
         self.config_file = config_file
-        self.readConfig()
+        with self._startup_stage('config'):
+            self.readConfig()
         
         print('Starting Measurement Session')
         print(f'  > Config file: {self.config_file}')
@@ -35,15 +85,24 @@ class pHMeasurementSession:
         self.plotting = plotting
         
         # set up variables
-        self.timestamp = dt.datetime.now().replace(microsecond=0)
+        self.timestamp = self.clock.now().replace(microsecond=0)
         self.sample = None
         self.sal = self.config.getfloat('salinity')
         self.temp = None
+        self.temp_std = None
         self.wv = None
         self.dark = None
+        self.dark_var = None
+        self.dark_model = None
+        self.setup_file = None
+        self.drift_monitor = None
         self.light_reference_raw = None
         self.light_sample_raw = None
         self.scale_factor = None
+        # the cell the beam switch was last moved to
+        self.cell = None
+        # asynchronous access to the instruments, see async_instruments
+        self._aio = None
         
         self.boxcar_width = self.config.getint('spec_boxcarwidth')
         self.splines = self.config.get('splines')
@@ -62,84 +121,229 @@ class pHMeasurementSession:
         self._pkl_outfile = None
         self._dat_outfile = None
         
+        # scans and timings of each acquisition
+        self.acquisition_file = os.path.join(self.savedir, f"{self.dye}_acquisition.dat")
+        self._acquisition_log = []
+        
+        # time taken by each stage of each sample, see timings
+        self.timer = StageTimer(
+            enabled=self.config.getboolean('timing', fallback=False),
+            jsonl=os.path.join(self.savedir, f"{self.dye}_timings.jsonl") if self.config.getboolean('timing_log', fallback=False) else None,
+            clock=self.clock)
+        self._timing = no_timings
+        
         # Summary File Saving
         self.summary_dat = os.path.join(self.savedir, f"{self.dye}_summary.dat")
         self.summary_pkl = os.path.join(self.savedir, f"{self.dye}_summary.pkl")
+        self.summary_db = os.path.join(self.savedir, f"{self.dye}_summary.sqlite")
         
-        if os.path.exists(self.summary_pkl):
-            self.load_data_table(self.summary_pkl)
-            self._new_data_table = False
-        elif os.path.exists(self.summary_dat):
-            self.load_data_table(self.summary_dat)
-            self._new_data_table = False
-        else:
-            self.make_data_table()
-            self._new_data_table = True
+        # spectra from previous measurements are loaded on demand
+        self.spectrum_cache = SpectrumCache(maxsize=self.config.getint('spectra_cachesize', fallback=50))
+        
+        with self._startup_stage('summary'):
+            self.summary_store = SummaryStore(self.summary_db)
+            journalled = len(self.summary_store) > 0
+            
+            if journalled:
+                self.load_data_table(self.summary_db)
+                self._new_data_table = False
+            elif os.path.exists(self.summary_pkl):
+                self.load_data_table(self.summary_pkl)
+                self._new_data_table = False
+            elif os.path.exists(self.summary_dat):
+                self.load_data_table(self.summary_dat)
+                self._new_data_table = False
+            else:
+                self.make_data_table()
+                self._new_data_table = True
+            
+            if not journalled and not self._new_data_table:
+                # journal existing summary so that subsequent loads are complete
+                self.summary_store.extend(self.data_table)
         
         # load last dark and scale_factor, if given
         self.use_last_setup = use_last_setup
         if self.use_last_setup:
-            self.load_last_dark_and_scale_factor()        
+            with self._startup_stage('last setup'):
+                self.load_last_dark_and_scale_factor()        
+
+        # Pipelined processing: fitting, saving and plotting of a sample run
+        # on a background worker while the next sample is acquired
+        self.pipeline = pipeline
+        self._pending = []
+        self._plot_queue = queue.SimpleQueue()
+        self._save_lock = threading.Lock()
+        if self.pipeline:
+            # an executor may be shared with other sessions
+            self._owns_executor = executor is None
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='carbspec-pipeline') if executor is None else executor
+            self._pipeline_slots = threading.BoundedSemaphore(pipeline_depth)
+            print(f'  > Pipelined processing (depth {pipeline_depth})')
 
+        # fits are done on a fit server, if configured (see spectro.fitserver)
+        self.fit_client = None
+        with self._startup_stage('fit server'):
+            self.connect_FitServer()
+        
+        # where instruments were last found, so they can be reconnected without searching
+        device_cache = self.config.get('device_cache', fallback='')
+        if not device_cache:
+            device_cache = os.path.join(os.path.dirname(os.path.abspath(self.config_file)), 'carbspec_devices.json')
+        self.device_cache = DeviceCache(device_cache)
+        
         # Connect to instruments
-        self.connect_Instruments()
+        with self._startup_stage('instruments'):
+            self.connect_Instruments()
+        
+        self.startup_times['total'] = self.clock.perf_counter() - startup_start
+        if self.config.getboolean('startup_report', fallback=False):
+            self.print_startup_report()
+
+        print(f"  --> Ready! ({self.startup_times['total']:.2f} s)")
+    
+    @contextmanager
+    def _startup_stage(self, stage):
+        start = self.clock.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_times[stage] = self.clock.perf_counter() - start
+    
+    def startup_report(self):
+        """
+        The time taken by each stage of starting the session.
+
+        Instruments are connected concurrently, so the time of each
+        instrument overlaps the others, and 'instruments' is the time taken
+        to connect them all.
+
+        Returns
+        -------
+        pandas.Series : times in seconds.
+        """
+        return pd.Series(self.startup_times, name='time (s)')
+    
+    def print_startup_report(self):
+        print('  > Startup time:')
+        for stage, time in self.startup_times.items():
+            print(f'      {stage:<14} {time:6.3f} s')
 
-        print('  --> Ready!')
+    @property
+    def data_table(self):
+        """
+        The results as a DataFrame, built from `results` on each access.
 
+        Changes to the DataFrame are not kept. Change a result with
+        `results.update(timestamp, column=value)`, or assign a changed
+        DataFrame to `data_table` to replace all results.
+        """
+        return self.results.to_dataframe()
+    
+    @data_table.setter
+    def data_table(self, data_table):
+        with self.results._lock:
+            self.results.clear()
+            self.results.extend(data_table)
+    
     def make_data_table(self):
-        dat = pd.DataFrame(index=None, columns=['sample', 'temp', 'sal', 'F', 'K', 'pH', 'spectra', 'dat_file', 'pkl_file'])
-        dat = dat.astype({
-            'temp': float, 
-            'sal': float, 
-            'K': float, 
-        })
-        dat.index.name = 'timestamp'
-        self.data_table = dat
+        self.results = ResultBuffer(self.result_columns, index_name='timestamp')
         
     def load_data_table(self, file):
-        if '.pkl' in file:
-            self.data_table = pd.read_pickle(file)
+        if '.sqlite' in file:
+            dat = self.summary_store.load()
+            dat['spectra'] = [LazySpectrum(f, self.spectrum_cache) for f in dat['pkl_file']]
+        elif '.pkl' in file:
+            dat = pd.read_pickle(file)
+            for s in dat['spectra']:
+                if isinstance(s, LazySpectrum):
+                    s.cache = self.spectrum_cache
         elif '.dat' in file:
             dat = pd.read_csv(file, parse_dates=['timestamp'])
             dat.set_index('timestamp', inplace=True)
-            for i, r in dat.iterrows():
-                dat.loc[i, 'spectra'] = Spectrum.load(r['pkl_file'])
-            self.data_table = dat
+            dat['spectra'] = [LazySpectrum(f, self.spectrum_cache) for f in dat['pkl_file']]
         else:
-            ValueError('File must be a .dat or .pkl file.')
+            raise ValueError('File must be a .sqlite, .dat or .pkl file.')
+        
+        self.results = ResultBuffer.from_dataframe(dat, self.result_columns)
 
         print(f'  > Loaded existing data table from {file}')
             
     def readConfig(self):
         self._config = ConfigParser()
         self._config.read(self.config_file)
-        self.config = self._config[self.dye]
+        self.config = self._config[self.section]
+        self._config_changes = set()
         
     def writeConfig(self):
-        with open(self.config_file, 'w') as f:
-            self._config.write(f)
+        with _config_lock:
+            if not os.path.exists(self.config_file):
+                config = self._config
+            else:
+                # only write the changes made by this session, so that sessions sharing the file don't undo each other's
+                config = ConfigParser()
+                config.read(self.config_file)
+                for section, parameter in self._config_changes:
+                    if section != 'DEFAULT' and not config.has_section(section):
+                        config.add_section(section)
+                    config.set(section, parameter, self._config.get(section, parameter, raw=True))
+            
+            with open(self.config_file, 'w') as f:
+                config.write(f)
+    
+    def setConfig(self, parameter, value, section=None):
+        if section is None:
+            section = self.section
+        if section != self._config.default_section and not self._config.has_section(section):
+            # e.g. the LAST section, before a setup has been saved
+            self._config.add_section(section)
+        self._config.set(section, parameter, str(value))
+        self._config_changes.add((section, parameter))
     
-    def updateConfig(self, parameter, value, section=None):
+    def updateConfig(self, parameter, value, section=None, write=True):
         if section is None:
-            section = self.dye
+            section = self.section
         if parameter in self._config[section]:
-            self._config.set(section, parameter, str(value))
-        self.writeConfig()
+            self.setConfig(parameter, value, section)
+        if write:
+            self.writeConfig()
             
     def connect_TempProbe(self):
-        self.temp_probe = TempProbe(
+        self.temp_probe = self.instruments.TempProbe(
             averaging_period=self.config.getint('temp_integrationtime'),
             m=self.config.getfloat('temp_m'), 
-            c=self.config.getfloat('temp_c')
+            c=self.config.getfloat('temp_c'),
+            cache=self.device_cache
             )
         
+        if self.config.getboolean('temp_background', fallback=False):
+            if self.clock.realtime:
+                self.temp_probe.start_sampling(interval=self.config.getfloat('temp_sampleinterval', fallback=0.5))
+            else:
+                print('  > Background temperature sampling is not supported with a simulated clock: reading the temperature between spectra.')
+        
     def connect_BeamSwitch(self):
-        self.beam_switch = BeamSwitch(
+        self.beam_switch = self.instruments.BeamSwitch(
             reverse_sides=self.config.getboolean('beamswitch_reversechannels')
             )
     
     def connect_Spectrometer(self):
-        self.spectrometer = Spectrometer()
+        Spectrometer = self.instruments.Spectrometer
+        serial_number = self.config.get('spec_serialnumber', fallback='')
+        cached = self.device_cache.get(f'spectrometer {self.section}')
+        if serial_number and hasattr(Spectrometer, 'from_serial_number'):
+            self.spectrometer = Spectrometer.from_serial_number(serial_number)
+        elif cached is not None and hasattr(Spectrometer, 'from_serial_number'):
+            # the spectrometer this session used last time, if it is still connected
+            try:
+                self.spectrometer = Spectrometer.from_serial_number(cached['serial_number'])
+            except Exception:
+                self.device_cache.forget(f'spectrometer {self.section}')
+                self.spectrometer = Spectrometer()
+        else:
+            self.spectrometer = Spectrometer()
+        
+        if hasattr(Spectrometer, 'from_serial_number') and getattr(self.spectrometer, 'serial_number', None):
+            self.device_cache.set(f'spectrometer {self.section}', serial_number=self.spectrometer.serial_number)
         
         self.spectrometer.set_integration_time_ms(self.config.getint('spec_integrationtime'))
                 
@@ -148,44 +352,242 @@ class pHMeasurementSession:
 
         self.wv = self._wv[self._wv_filter]
     
+    def connect_FitServer(self):
+        address = self.config.get('fit_server', fallback='')
+        if not address:
+            return
+        try:
+            self.fit_client = FitClient(address)
+            print(f'  > Fitting on server at {address}')
+        except OSError:
+            print(f'  > No fit server at {address}, fitting locally.')
+    
+    def fit_pH(self, spectrum, p0=None):
+        """
+        Calculate the pH of a spectrum (see calc_pH), on the fit server if there is one.
+
+        If the fit server cannot be reached, it is dropped and spectra are
+        fitted locally from then on.
+        """
+        client = self.fit_client
+        if client is not None:
+            try:
+                return calc_pH(spectrum, p0=p0, client=client)
+            except OSError as e:
+                print(f'  > Lost fit server ({e!r}), fitting locally.')
+                self.fit_client = None
+                client.close()
+        return calc_pH(spectrum, p0=p0)
+    
     def connect_Instruments(self):
-        self.connect_TempProbe()
-        self.connect_BeamSwitch()
-        self.connect_Spectrometer()
+        """
+        Connect to the temperature probe, beam switch and spectrometer concurrently.
+        """
+        connections = {'temp probe': self.connect_TempProbe, 'beam switch': self.connect_BeamSwitch, 'spectrometer': self.connect_Spectrometer}
+        
+        def connect(stage, connection):
+            with self._startup_stage(stage):
+                connection()
+        
+        with ThreadPoolExecutor(max_workers=len(connections), thread_name_prefix='carbspec-connect') as pool:
+            futures = [pool.submit(connect, stage, connection) for stage, connection in connections.items()]
+        
+        # raise the first error, once all connections have finished
+        for future in futures:
+            future.result()
         
     def disconnect_Instruments(self):
+        if self._aio is not None:
+            for aio in vars(self._aio).values():
+                aio.close()
+            self._aio = None
         for instrument in [self.spectrometer, self.beam_switch, self.temp_probe]:
             if hasattr(instrument, 'disconnect'):
                 instrument.disconnect()
+    
+    @property
+    def async_instruments(self):
+        """
+        The instruments wrapped for asynchronous use (see instruments.aio), each with its own I/O thread.
+        """
+        if self._aio is None:
+            self._aio = SimpleNamespace(
+                temp_probe=AsyncInstrument(self.temp_probe), 
+                beam_switch=AsyncInstrument(self.beam_switch), 
+                spectrometer=AsyncInstrument(self.spectrometer))
+        return self._aio
+            
+    def find_saturation_time(self, target=5.5e4, max_reads=10, probe_time=10, max_integration_time=10000):
+        """
+        Find the shortest integration time (ms) at which the spectrometer counts reach `target`.
+
+        Counts are modelled as linear in integration time from reads at 1 ms
+        and `probe_time` ms. The model prediction is then refined by bisection,
+        using at most `max_reads` spectrometer reads.
+
+        Returns
+        -------
+        tuple : (integration time, number of reads)
+        """
+        counts = {}
+        
+        def read_counts(t):
+            self.spectrometer.set_integration_time_ms(t)
+            counts[t] = self.spectrometer.read()[self._wv_filter].max()
+            return counts[t]
+        
+        def predict():
+            # linear model between the bracketing reads, or through the two longest reads
+            if hi is None:
+                t1, t2 = sorted(counts)[-2:]
+            else:
+                t1, t2 = lo, hi
+            c1, c2 = counts[t1], counts[t2]
+            rate = (c2 - c1) / (t2 - t1)
+            if rate <= 0:
+                raise ValueError('Spectrometer counts do not increase with integration time. Is the light on?')
+            return int(np.ceil(t1 + (target - c1) / rate))
+        
+        lo = 0  # longest time known to be below target
+        hi = None  # shortest time known to reach target
+        
+        for t in [1, probe_time]:
+            if read_counts(t) >= target:
+                hi = t
+                break
+            lo = t
+        
+        bisect = False
+        while len(counts) < max_reads:
+            if hi is not None and hi - lo <= 1:
+                break
+            
+            if bisect:
+                t = (lo + hi) // 2
+            else:
+                t = min(max(predict(), lo + 1), max_integration_time if hi is None else hi - 1)
+            
+            width = None if hi is None else hi - lo
+            if read_counts(t) >= target:
+                hi = t
+            elif t == max_integration_time:
+                raise ValueError(f'Spectrometer counts do not reach {target} within {max_integration_time} ms.')
+            else:
+                lo = t
             
-    def find_max_integration_time(self, maintain_total_collection_time=True):
+            # bisect next if the model prediction did not halve the bracket
+            bisect = width is not None and hi - lo > width / 2
         
-        total_collection_time = self.config.getint('spec_nscans') * self.config.getint('spec_integrationtime')
+        if hi is None:
+            print(f'  > Warning: counts did not reach {target} in {max_reads} reads.')
+            hi = lo
+        
+        return hi, len(counts)
+    
+    def _switch_to(self, cell, mode=None):
+        """
+        Move the beam switch to the 'reference' or 'sample' cell, and wait for it to settle.
+        """
+        if cell == 'reference':
+            self.beam_switch.reference_cell()
+            if self.dummy:
+                self.spectrometer.reference_cell()  # for dummy
+        elif cell == 'sample':
+            self.beam_switch.sample_cell()
+            if self.dummy:
+                self.spectrometer.sample_cell()  # for dummy
+        else:
+            raise ValueError(f"cell must be 'reference' or 'sample', not {cell}")
         
-        ref_integration_time = 1
-        sample_integration_time = 1
+        self.cell = cell
+        return self.settle(mode)
+    
+    def settle(self, mode=None):
+        """
+        Wait for the beam switch to settle after a toggle.
+
+        The mode is `beamswitch_settling` (default 'fixed'). In 'fixed'
+        mode, waits for `beamswitch_latency` seconds. In 'adaptive'
+        mode, takes short probe reads (`beamswitch_probetime` ms) until 
+        consecutive reads differ by less than `beamswitch_tolerance` (relative 
+        to total counts), or `beamswitch_maxsettle` seconds have passed.
 
-        self.beam_switch.reference_cell()
-        time.sleep(0.1)
+        Returns
+        -------
+        float : the time taken to settle (s).
+        """
+        if mode is None:
+            mode = self.config.get('beamswitch_settling', fallback='fixed')
+        latency = self.config.getfloat('beamswitch_latency', fallback=0.1)
+        
+        start = self.clock.monotonic()
+        
+        if mode == 'fixed':
+            self.clock.sleep(latency)
+            return self.clock.monotonic() - start
+        elif mode != 'adaptive':
+            raise ValueError(f"beamswitch_settling must be 'fixed' or 'adaptive', not {mode}")
+        
+        tolerance = self.config.getfloat('beamswitch_tolerance', fallback=0.01)
+        max_settle = self.config.getfloat('beamswitch_maxsettle', fallback=max(1., 5 * latency))
+        
+        self.spectrometer.set_integration_time_ms(self.config.getint('beamswitch_probetime', fallback=5))
+        
+        last = self.spectrometer.read()[self._wv_filter].sum()
+        stable = False
+        while self.clock.monotonic() - start < max_settle:
+            counts = self.spectrometer.read()[self._wv_filter].sum()
+            if abs(counts - last) <= tolerance * abs(last):
+                stable = True
+                break
+            last = counts
         
-        self.spectrometer.set_integration_time_ms(ref_integration_time)
-        trans = self.spectrometer.read()[self._wv_filter]
+        self.spectrometer.set_integration_time_ms(self.config.getint('spec_integrationtime'))
+        
+        if not stable:
+            print(f'  > Warning: beam switch did not settle within {max_settle} s.')
+        
+        return self.clock.monotonic() - start
+    
+    def characterise_switch_latency(self, repeats=5, write=True):
+        """
+        Measure the time the beam switch takes to settle, and store it as `beamswitch_latency`.
 
-        while trans.max() < 5.5e4:
-            ref_integration_time += 1
-            self.spectrometer.set_integration_time_ms(ref_integration_time)
-            trans = self.spectrometer.read()[self._wv_filter]
+        The switch is toggled `repeats` times in each direction, and the
+        longest adaptive settling time is stored in the DEFAULT section of
+        the config, or in the session's section if it has one.
 
-        self.beam_switch.sample_cell()
-        time.sleep(0.1)
+        Returns
+        -------
+        dict : settling times (s) for switching to each cell.
+        """
+        times = {'reference': [], 'sample': []}
+        for _ in range(repeats):
+            for cell in times:
+                times[cell].append(self._switch_to(cell, mode='adaptive'))
+        
+        latency = max(max(t) for t in times.values())
+        print(f'  > Beam switch latency: {latency * 1e3:.0f} ms')
+        
+        self.setConfig('beamswitch_latency', f'{latency:.3f}', section=self.calibration_section)
+        if write:
+            self.writeConfig()
+        
+        return times
+    
+    def find_max_integration_time(self, maintain_total_collection_time=True, target=5.5e4, max_reads=10):
+        
+        total_collection_time = self.config.getint('spec_nscans') * self.config.getint('spec_integrationtime')
+        
+        self._switch_to('reference')
+        
+        ref_integration_time, ref_reads = self.find_saturation_time(target=target, max_reads=max_reads)
+        print(f'  > Reference cell: {ref_integration_time} ms ({ref_reads} reads)')
 
-        self.spectrometer.set_integration_time_ms(sample_integration_time)
-        trans = self.spectrometer.read()[self._wv_filter]
+        self._switch_to('sample')
 
-        while trans.max() < 5.5e4:
-            sample_integration_time += 1
-            self.spectrometer.set_integration_time_ms(sample_integration_time)
-            trans = self.spectrometer.read()[self._wv_filter]
+        sample_integration_time, sample_reads = self.find_saturation_time(target=target, max_reads=max_reads)
+        print(f'  > Sample cell: {sample_integration_time} ms ({sample_reads} reads)')
 
         max_integration_time = min(ref_integration_time, sample_integration_time)
         
@@ -194,11 +596,43 @@ class pHMeasurementSession:
         new_total_collection_time = max_integration_time * self.config.getint('spec_nscans')
         
         if new_total_collection_time < total_collection_time and maintain_total_collection_time:
-            self.updateConfig('spec_nscans', int(total_collection_time / max_integration_time), section='DEFAULT')
+            self.updateConfig('spec_nscans', int(total_collection_time / max_integration_time), section=self.calibration_section, write=False)
+        
+        self.updateConfig('spec_integrationtime', max_integration_time, section=self.calibration_section)
+        
+        if self.dark_model is not None:
+            self.update_dark()
+        elif self.dark is not None:
+            print('  > Warning: integration time changed. The Dark spectrum must be re-collected.')
         
-        self.updateConfig('spec_integrationtime', max_integration_time, section='DEFAULT')
+        return {'reference': ref_integration_time, 'sample': sample_integration_time}
                 
-    def read_spectrometer(self):
+    def read_spectrometer(self, bulk=None, return_var=False):
+        """
+        Read the average of `spec_nscans` spectra.
+
+        If return_var is True, returns (spectrum, variance), where variance
+        is the variance of the averaged spectrum from the scan-to-scan
+        scatter, or None if it is not available.
+
+        With `bulk` (`spec_bulkread`, default False), the spectrometer's
+        read_averaged is used, which averages on the device if it can.
+        """
+        if bulk is None:
+            bulk = self.config.getboolean('spec_bulkread', fallback=False)
+        
+        if bulk:
+            # on-board averaging if available (unless the variance is wanted), otherwise accumulate over the wavelength range in place
+            return self.spectrometer.read_averaged(self.config.getint('spec_nscans'), boxcar_width=self.boxcar_width, roi=self._wv_filter, return_var=return_var)
+        
+        if return_var:
+            # the scan-to-scan scatter is kept for weighting fits
+            acc = ScanAccumulator(self._wv.size, boxcar_width=self.boxcar_width)
+            for i in range(self.config.getint('spec_nscans')):
+                acc.add(self.spectrometer.read())
+            var = acc.var()
+            return acc.mean()[self._wv_filter], None if var is None else var[self._wv_filter]
+        
         spec = np.zeros_like(self._wv)
         for i in range(self.config.getint('spec_nscans')):
             spec += self.spectrometer.read()
@@ -208,7 +642,26 @@ class pHMeasurementSession:
             spec = np.convolve(spec, np.ones(self.boxcar_width) / self.boxcar_width, mode='same')
 
         return spec[self._wv_filter]
+    
+    def compare_read_methods(self, repeats=3):
+        """
+        Time read_spectrometer with and without bulk reading.
+
+        Returns
+        -------
+        dict : mean time per read_spectrometer call (s) for each method.
+        """
+        timings = {}
+        for method, bulk in [('python', False), ('bulk', True)]:
+            start = self.clock.perf_counter()
+            for _ in range(repeats):
+                self.read_spectrometer(bulk=bulk)
+            timings[method] = (self.clock.perf_counter() - start) / repeats
+            print(f'  > {method}: {timings[method] * 1e3:.1f} ms per spectrum ({self.config.getint("spec_nscans")} scans)')
+        
+        return timings
 
+    @profiled()
     def collect_dark(self):
         if self.dark is not None:
             response = input('You have already collected a Dark spectrum. Do you want to collect a new one? Y/[N]:')
@@ -217,13 +670,123 @@ class pHMeasurementSession:
                 return
 
         input('Ensure the light is off and the reference cell is in the beam path. Press enter to continue.')
-        self.dark = self.read_spectrometer()
+        self._timing = timing = self.timer.sample()
+        timing.label(self.timestamp, 'dark')
+        with timing.stage('spectrometer'):
+            self.dark, self.dark_var = self.read_spectrometer(return_var=True)
         self.spectrum = Spectrum(
             sample='dark', timestamp=self.timestamp, temp=self.temp, sal=self.sal, dye=self.dye, splines=self.splines, config_file=self.config_file,
-            wv=self.wv, dark=self.dark)        
+            wv=self.wv, dark=self.dark, dark_var=self.dark_var)        
         if self.plotting:
-            plot_spectrum(self.spectrum, include=['raw'])
+            with timing.stage('plot'):
+                plot_spectrum(self.spectrum, include=['raw'])
+        timing.finish()
     
+    @profiled()
+    def collect_dark_model(self, integration_times=None):
+        """
+        Collect darks at several integration times, and fit a DarkModel to them.
+
+        The Dark spectrum is then synthesized from the model for the current
+        integration time, and updated whenever the integration time changes,
+        so it does not have to be re-collected. The model is saved alongside
+        the setup file.
+
+        Parameters
+        ----------
+        integration_times : list of int
+            Integration times (ms). Defaults to 1/4, 1/2, 1 and 2 times 
+            `spec_integrationtime`.
+        """
+        current = self.config.getint('spec_integrationtime')
+        if integration_times is None:
+            integration_times = sorted({max(1, current // 4), max(1, current // 2), current, 2 * current})
+        
+        input('Ensure the light is off and the reference cell is in the beam path. Press enter to continue.')
+        self._timing = timing = self.timer.sample()
+        timing.label(self.timestamp, 'dark')
+        darks, dark_vars = [], []
+        for t in integration_times:
+            self.spectrometer.set_integration_time_ms(t)
+            with timing.stage('spectrometer'):
+                dark, dark_var = self.read_spectrometer(return_var=True)
+            darks.append(dark)
+            dark_vars.append(dark_var)
+        self.spectrometer.set_integration_time_ms(current)
+        
+        self.dark_model = DarkModel.fit(self.wv, integration_times, darks, dark_vars)
+        if self.setup_file is not None:
+            self.dark_model.save(self.dark_model_file(self.setup_file))
+        
+        self.update_dark()
+        
+        self.spectrum = Spectrum(
+            sample='dark', timestamp=self.timestamp, temp=self.temp, sal=self.sal, dye=self.dye, splines=self.splines, config_file=self.config_file,
+            wv=self.wv, dark=self.dark, dark_var=self.dark_var)
+        if self.plotting:
+            with timing.stage('plot'):
+                plot_spectrum(self.spectrum, include=['raw'])
+        timing.finish()
+    
+    def update_dark(self):
+        """
+        Synthesize the Dark spectrum for the current integration time from the dark model.
+        """
+        t = self.config.getint('spec_integrationtime')
+        self.dark = self.dark_model.predict(t)
+        self.dark_var = self.dark_model.predict_var(t)
+    
+    def start_drift_monitor(self, setup):
+        """
+        Monitor the reference channel of subsequent measurements for drift from a setup spectrum.
+        """
+        self.drift_monitor = DriftMonitor(
+            setup.light_reference, setup.light_reference_var, 
+            tolerance=self.config.getfloat('drift_tolerance', fallback=1e-3),
+            alpha=self.config.getfloat('drift_smoothing', fallback=0.2))
+    
+    def update_drift(self, light_reference, light_reference_var=None):
+        """
+        Add a reference spectrum to the drift monitor, and warn if the scale factor is stale.
+
+        Returns
+        -------
+        float : the drift in absorbance units, or NaN if there is no drift monitor.
+        """
+        if self.drift_monitor is None:
+            return np.nan
+        
+        was_stale = self.drift_monitor.stale
+        drift = self.drift_monitor.update(light_reference, light_reference_var)
+        if self.drift_monitor.stale and not was_stale:
+            print(f'  > Warning: reference channel has drifted by {drift:.4f} absorbance units since setup. Re-run collect_scale_factor().')
+        return drift
+    
+    def check_drift(self):
+        """
+        Read the reference cell, and return its drift from the setup.
+
+        Use this to decide whether the last setup can be re-used.
+        """
+        if self.drift_monitor is None:
+            raise ValueError('No setup to compare to. Run collect_scale_factor() or load_last_dark_and_scale_factor() first.')
+        
+        self._switch_to('reference')
+        light_reference_raw, light_reference_raw_var = self.read_spectrometer(return_var=True)
+        
+        light_reference_var = None
+        if light_reference_raw_var is not None and self.dark_var is not None:
+            light_reference_var = light_reference_raw_var + self.dark_var
+        
+        drift = self.update_drift(light_reference_raw - self.dark, light_reference_var)
+        print(f'  > Reference drift: {drift:.4f} (tolerance: {self.drift_monitor.tolerance})')
+        return drift
+    
+    @staticmethod
+    def dark_model_file(setup_file):
+        return os.path.splitext(setup_file)[0] + '_dark.npz'
+    
+    @profiled()
     def collect_scale_factor(self):
         if self.scale_factor is not None:
             response = input('You have already collected a Scale Factor spectrum. Do you want to collect a new one? Y/[N]:')
@@ -233,30 +796,48 @@ class pHMeasurementSession:
         
         input('Place the reference material in both cells. Switch the light source on. Press enter to continue.')
         self.scale_factor = np.ones_like(self.wv)
-        self.collect_spectrum('setup')
+        self.drift_monitor = None
+        self.collect_spectrum('setup', adaptive=False)
         
         self.scale_factor = self.spectrum.light_sample_raw / self.spectrum.light_reference_raw
         
         self.spectrum.scale_factor = self.scale_factor
         self.spectrum.correct_channels()
 
-        self.save_spectrum()
+        with self._timing.stage('save spectrum'):
+            self.save_spectrum()
         
-        self.updateConfig('setup_file', self._pkl_outfile, section='LAST')
+        self.setup_file = self._pkl_outfile
+        self.start_drift_monitor(self.spectrum)
+        if self.dark_model is not None:
+            self.dark_model.save(self.dark_model_file(self.setup_file))
+        
+        self.setConfig('setup_file', self._pkl_outfile, section=self.last_section)
+        self.writeConfig()
 
         if self.plotting:
-            plot_spectrum(self.spectrum, include=['raw', 'scale factor', 'dark corrected'])
+            with self._timing.stage('plot'):
+                plot_spectrum(self.spectrum, include=['raw', 'scale factor', 'dark corrected'])
+        self._timing.finish()
         
     def load_last_dark_and_scale_factor(self):
         
-        file = self._config.get('LAST', 'setup_file')
+        file = self._config.get(self.last_section, 'setup_file')
         
         s = Spectrum.load(file)
         
         self.dark = s.dark
+        self.dark_var = s.dark_var
         self.scale_factor = s.scale_factor
+        self.setup_file = file
+        self.start_drift_monitor(s)
         
         print(f'  > Loaded Dark and Scale Factor from last setup ({file}).')
+        
+        if os.path.exists(self.dark_model_file(file)):
+            self.dark_model = DarkModel.load(self.dark_model_file(file))
+            self.update_dark()
+            print(f'  > Dark synthesized from dark model for {self.config.getint("spec_integrationtime")} ms.')
     
     def make_filenames(self):
         self.filename = f"{self.dye}_{self.timestamp.strftime('%Y%m%d_%H%M%S')}"
@@ -265,46 +846,208 @@ class pHMeasurementSession:
         self._pkl_outfile = os.path.join(self.savedir, 'pkl', self.filename + '.pkl')
         self._dat_outfile = os.path.join(self.savedir, 'raw', self.filename + '.csv')
     
-    def save_spectrum(self):
-        self.spectrum.save(dat_file=self._dat_outfile, pkl_file=self._pkl_outfile)
+    def save_spectrum(self, spectrum=None, dat_file=None, pkl_file=None):
+        if spectrum is None:
+            spectrum, dat_file, pkl_file = self.spectrum, self._dat_outfile, self._pkl_outfile
+        spectrum.save(dat_file=dat_file, pkl_file=pkl_file)
+
+    def read_sample_adaptive(self, light_reference_raw, light_reference_raw_var):
+        """
+        Read the sample cell in blocks of scans until the pH is precise enough.
+
+        After each block of `spec_blockscans` scans, the running mean is fitted
+        (starting from the previous fit) and acquisition stops once the pH 
+        standard error is below `spec_targetpHstd`, or `spec_maxscans` scans
+        have been collected.
+
+        Returns
+        -------
+        tuple : (light_sample_raw, light_sample_raw_var, nscans, pH_std)
+        """
+        block = self.config.getint('spec_blockscans', fallback=10)
+        max_scans = self.config.getint('spec_maxscans', fallback=4 * self.config.getint('spec_nscans'))
+        target = self.config.getfloat('spec_targetpHstd', fallback=5e-4)
+        
+        acc = ScanAccumulator(self._wv.size, roi=self._wv_filter, boxcar_width=self.boxcar_width)
+        p0 = None
+        pH_std = np.nan
+        while acc.n < max_scans:
+            for _ in range(min(block, max_scans - acc.n)):
+                acc.add(self.spectrometer.read())
+            if acc.n < 2:
+                continue
+            
+            # the pH uncertainty comes from F, so does not depend on the temperature used here
+            spectrum = Spectrum(
+                sample=self.sample, timestamp=self.timestamp, temp=25. if self.temp is None else self.temp, sal=self.sal, dye=self.dye, splines=self.splines, config_file=self.config_file,
+                wv=self.wv, dark=self.dark, scale_factor=self.scale_factor, light_sample_raw=acc.mean(), light_reference_raw=light_reference_raw,
+                dark_var=self.dark_var, light_sample_raw_var=acc.var(), light_reference_raw_var=light_reference_raw_var)
+            try:
+                _, _, pH, fit_p = self.fit_pH(spectrum, p0=p0)
+            except (ValueError, np.linalg.LinAlgError):
+                p0 = None
+                continue
+            
+            p0 = nominal_values(fit_p)
+            pH_std = pH.std_dev
+            if pH_std <= target:
+                break
+        
+        return acc.mean(), acc.var(), acc.n, pH_std
+    
+    def log_acquisition(self, **values):
+        self._acquisition_log.append(values)
+        
+        if self.save:
+            row = pd.DataFrame([values])
+            row.to_csv(self.acquisition_file, mode='a', index=False, header=not os.path.exists(self.acquisition_file))
+    
+    @property
+    def acquisition_log(self):
+        """
+        The number of scans and acquisition time of each spectrum collected in this session.
+        """
+        return pd.DataFrame(self._acquisition_log)
+    
+    @property
+    def timings(self):
+        """
+        The time (s) taken by each stage of each sample, if timing is enabled.
+
+        Stages are temperature reads, beam switching and settling, spectrometer
+        reads, fitting, saving the spectrum and summary, and plotting. Set the
+        `timing` config option (or `timer.enabled`) to record them, and
+        `timing_log` to also write them to {dye}_timings.jsonl in `savedir`.
+        """
+        return self.timer.to_frame()
+    
+    def _read_cell(self, cell):
+        """
+        Switch to `cell` (unless the beam is already there) and read the spectrometer.
+        """
+        if self.cell != cell:
+            with self._timing.stage('switch'):
+                self._switch_to(cell)
+        with self._timing.stage('spectrometer'):
+            return self.read_spectrometer(return_var=True)
+    
+    def _read_sample_cell(self, adaptive, light_reference_raw, light_reference_raw_var):
+        """
+        Switch to the sample cell and read the sample.
 
-    def collect_spectrum(self, sample_name=None):
+        Returns (light_sample_raw, light_sample_raw_var, sample_scans, pH_std).
+        """
+        with self._timing.stage('switch'):
+            self._switch_to('sample')
+        
+        if adaptive:
+            with self._timing.stage('spectrometer'):
+                return self.read_sample_adaptive(light_reference_raw, light_reference_raw_var)
+        
+        with self._timing.stage('spectrometer'):
+            light_sample_raw, light_sample_raw_var = self.read_spectrometer(return_var=True)
+        return light_sample_raw, light_sample_raw_var, self.config.getint('spec_nscans'), np.nan
+    
+    def _set_temperature(self, temps=None, t_start=None):
+        """
+        Set the sample temperature from individual reads (`temps`), or from
+        the background sampler since `t_start`.
+        """
+        temp = None
+        if temps is None:
+            # mean temperature over the acquisition, from the background sampler
+            temp = self.temp_probe.sampler.mean_between(t_start, self.clock.monotonic())
+        
+        if temp is not None:
+            self.temp, self.temp_std, _ = temp
+        elif temps is None:
+            # no background readings yet
+            self.temp, self.temp_std = self.temp_probe.read(), np.nan
+        else:
+            self.temp = np.mean(temps)
+            self.temp_std = np.std(temps, ddof=1)
+    
+    @profiled()
+    def collect_spectrum(self, sample_name=None, adaptive=None):
         self.sample = sample_name
         
-        temp_start = self.temp_probe.read()
+        if adaptive is None:
+            adaptive = self.config.getboolean('spec_adaptive', fallback=False)
         
-        self.beam_switch.reference_cell()
-        if dummy:
-            self.spectrometer.reference_cell()  # for dummy
-        time.sleep(0.1)
-        light_reference_raw = self.read_spectrometer()
+        self._timing = timing = self.timer.sample()
+        acquisition_start = self.clock.perf_counter()
+        
+        sampling = getattr(self.temp_probe, 'sampling', False)
+        if sampling:
+            t_start = self.clock.monotonic()
+        else:
+            with timing.stage('temperature'):
+                temps = [self.temp_probe.read()]
         
-        temp_mid = self.temp_probe.read()
-        time.sleep(0.1)
+        with timing.stage('switch'):
+            self._switch_to('reference')
+        with timing.stage('spectrometer'):
+            light_reference_raw, light_reference_raw_var = self.read_spectrometer(return_var=True)
         
-        self.beam_switch.sample_cell()
-        if dummy:
-            self.spectrometer.sample_cell()  # for dummy
-        time.sleep(0.1)
+        if not sampling:
+            with timing.stage('temperature'):
+                temps.append(self.temp_probe.read())
         
         # self.light_sample_raw = self.read_spectrometer()
-        light_sample_raw = self.read_spectrometer()
+        light_sample_raw, light_sample_raw_var, sample_scans, pH_std = self._read_sample_cell(adaptive, light_reference_raw, light_reference_raw_var)
         
-        temp_end = self.temp_probe.read()
+        acquisition_time = self.clock.perf_counter() - acquisition_start
         
-        self.temp = (temp_start + temp_mid + temp_end) / 3.
+        if sampling:
+            self._set_temperature(t_start=t_start)
+        else:
+            with timing.stage('temperature'):
+                temps.append(self.temp_probe.read())
+            self._set_temperature(temps)
         
-        self.timestamp = dt.datetime.now().replace(microsecond=0)
+        self._store_spectrum(light_reference_raw, light_reference_raw_var, light_sample_raw, light_sample_raw_var, adaptive, sample_scans, pH_std, acquisition_time)
+    
+    def _store_spectrum(self, light_reference_raw, light_reference_raw_var, light_sample_raw, light_sample_raw_var, adaptive, sample_scans, pH_std, acquisition_time):
+        self.timestamp = self.clock.now().replace(microsecond=0)
+        self._timing.label(self.timestamp, self.sample)
 
         self.make_filenames()
         
         self.spectrum = Spectrum(
             sample=self.sample, timestamp=self.timestamp, temp=self.temp, sal=self.sal, dye=self.dye, splines=self.splines, config_file=self.config_file,
-            wv=self.wv, dark=self.dark, scale_factor=self.scale_factor, light_sample_raw=light_sample_raw, light_reference_raw=light_reference_raw)
-        
-        self.data_table.loc[self.timestamp, ['sample', 'sal', 'temp', 'spectra', 'dat_file', 'pkl_file']] = self.sample, self.sal, self.temp, self.spectrum, self._dat_outfile, self._pkl_outfile
+            wv=self.wv, dark=self.dark, scale_factor=self.scale_factor, light_sample_raw=light_sample_raw, light_reference_raw=light_reference_raw,
+            dark_var=self.dark_var, light_sample_raw_var=light_sample_raw_var, light_reference_raw_var=light_reference_raw_var)
+        
+        drift = self.update_drift(self.spectrum.light_reference, self.spectrum.light_reference_var)
+        
+        self.log_acquisition(
+            timestamp=self.timestamp, sample=self.sample, adaptive=adaptive, 
+            reference_scans=self.config.getint('spec_nscans'), sample_scans=sample_scans, 
+            integration_time=self.config.getint('spec_integrationtime'), acquisition_time=acquisition_time, pH_std=pH_std, drift=drift)
+        if adaptive:
+            print(f'  > {sample_scans} sample scans in {acquisition_time:.2f} s (pH std: {pH_std:.5f})')
+        
+        row = dict(sample=self.sample, sal=self.sal, temp=self.temp, temp_std=self.temp_std, spectra=self.spectrum, dat_file=self._dat_outfile, pkl_file=self._pkl_outfile)
+        if self.timestamp in self.results:
+            # a sample in the same second as the last replaces it, as do its files
+            self.results.update(self.timestamp, **row)
+        else:
+            self.results.append(self.timestamp, **row)
     
-    def measure_sample(self, sample_name=None, salinity=None, plot_vars=['absorbance', 'residuals', 'dark corrected']):
+    @profiled()
+    def measure_sample(self, sample_name=None, salinity=None, plot_vars=['absorbance', 'residuals', 'dark corrected'], callback=None):
+        """
+        Measure a sample, then calculate and save its pH.
+
+        If the session is pipelined, this returns as soon as the spectra
+        are acquired, and the pH is calculated and saved on a background
+        worker. A concurrent.futures.Future is returned, and `callback` is
+        called with the result once it is available.
+
+        Returns
+        -------
+        tuple or Future : (F, K, pH, fit_p)
+        """
         if self.dark is None:
             raise ValueError('Dark spectrum not collected. Run collect_dark() first.')
         if self.scale_factor is None:
@@ -312,33 +1055,202 @@ class pHMeasurementSession:
 
         if salinity is not None:
             self.sal = salinity
+        
+        self.show_plots()
             
         self.collect_spectrum(sample_name=sample_name)
         # self.spectrum.calc_absorbance()
         
-        F, K, pH, fit_p = calc_pH(self.spectrum)
+        args = (self.spectrum, self.timestamp, self._dat_outfile, self._pkl_outfile, plot_vars, self._timing)
+        
+        if not self.pipeline:
+            result = self.process_sample(*args)
+            if callback is not None:
+                callback(result)
+            return result
+        
+        # blocks if the worker is already `pipeline_depth` samples behind
+        self._pipeline_slots.acquire()
+        future = self._executor.submit(self.process_sample, *args)
+        future.add_done_callback(lambda f: self._pipeline_slots.release())
+        future.add_done_callback(self._report_failure)
+        if callback is not None:
+            def deliver(f):
+                if f.exception() is None:
+                    callback(f.result())
+            future.add_done_callback(deliver)
+        
+        self._pending = [f for f in self._pending if not f.done()] + [future]
+        
+        return future
+    
+    @profiled()
+    def process_sample(self, spectrum, timestamp, dat_file, pkl_file, plot_vars, timing=no_timings):
+        with timing.stage('fit'):
+            F, K, pH, fit_p = self.fit_pH(spectrum)
                 
-        self.data_table.loc[self.timestamp, ['F', 'K', 'pH']] = F, K, pH
+        self.results.update(timestamp, F=F, K=K, pH=pH)
 
-        self.save_spectrum()
-        self.save_summary()
-        
-        print(sample_name)
+        # samples may be processed concurrently by a shared executor
+        with self._save_lock:
+            with timing.stage('save spectrum'):
+                self.save_spectrum(spectrum, dat_file, pkl_file)
+            with timing.stage('save summary'):
+                self.save_summary(timestamp)
+        
+        print(spectrum.sample)
         print(f'  > pH: {pH:.4f}')
                 
         if self.plotting:
-            plot_spectrum(self.spectrum, fit_p, include=plot_vars)
+            if threading.current_thread() is threading.main_thread():
+                with timing.stage('plot'):
+                    plot_spectrum(spectrum, fit_p, include=plot_vars)
+            else:
+                # matplotlib is not thread safe: plot on the main thread later
+                self._plot_queue.put((spectrum, fit_p, plot_vars, timing))
+                return F, K, pH, fit_p
+        
+        timing.finish()
+        
+        return F, K, pH, fit_p
+    
+    @staticmethod
+    def _report_failure(future):
+        if future.exception() is not None:
+            print(f'  > Error processing sample: {future.exception()!r}')
+    
+    def show_plots(self):
+        """
+        Draw any plots deferred by the pipeline worker.
+        """
+        while not self._plot_queue.empty():
+            spectrum, fit_p, plot_vars, timing = self._plot_queue.get()
+            with timing.stage('plot'):
+                plot_spectrum(spectrum, fit_p, include=plot_vars)
+            timing.finish()
+    
+    def flush_pipeline(self):
+        """
+        Wait for all pipelined samples to be processed, and draw their plots.
+
+        Returns
+        -------
+        list : the results of the pending samples.
+        """
+        pending, self._pending = self._pending, []
+        results = [f.result() for f in pending]
+        self.show_plots()
+        return results
             
-    def save_summary(self):
+    async def collect_spectrum_async(self, sample_name=None, adaptive=None):
+        """
+        Collect a spectrum as collect_spectrum, issuing independent instrument I/O concurrently.
+
+        Without a background temperature sampler, the temperature is read
+        while the spectrometer integrates, rather than between spectrometer
+        reads. If the beam is already on the reference cell (e.g. after
+        measure_sample_async), the reference is read without switching.
+        """
+        self.sample = sample_name
+        
+        if adaptive is None:
+            adaptive = self.config.getboolean('spec_adaptive', fallback=False)
+        
+        aio = self.async_instruments
+        self._timing = timing = self.timer.sample()
+        
+        async def read_temperature(n):
+            temps = []
+            for _ in range(n):
+                start = self.clock.perf_counter()
+                temps.append(await aio.temp_probe.read())
+                timing.record('temperature', start, self.clock.perf_counter() - start)
+            return temps
+        
+        acquisition_start = self.clock.perf_counter()
+        
+        # switching and reading the spectrometer run on the spectrometer's I/O thread
+        sampling = getattr(self.temp_probe, 'sampling', False)
+        if sampling:
+            t_start = self.clock.monotonic()
+            reference = await aio.spectrometer.run(self._read_cell, 'reference')
+            sample = await aio.spectrometer.run(self._read_sample_cell, adaptive, *reference)
+        else:
+            temps, reference = await asyncio.gather(read_temperature(1), aio.spectrometer.run(self._read_cell, 'reference'))
+            more_temps, sample = await asyncio.gather(read_temperature(2), aio.spectrometer.run(self._read_sample_cell, adaptive, *reference))
+            temps += more_temps
+        
+        acquisition_time = self.clock.perf_counter() - acquisition_start
+        
+        if sampling:
+            self._set_temperature(t_start=t_start)
+        else:
+            self._set_temperature(temps)
+        
+        self._store_spectrum(*reference, sample[0], sample[1], adaptive, sample[2], sample[3], acquisition_time)
+    
+    async def measure_sample_async(self, sample_name=None, salinity=None, plot_vars=['absorbance', 'residuals', 'dark corrected']):
+        """
+        Measure a sample, then calculate and save its pH, as measure_sample.
+
+        The spectra are collected with collect_spectrum_async. While the
+        sample is fitted and saved, the beam switch is returned to the
+        reference cell and left to settle, ready for the next sample.
+
+        Returns
+        -------
+        tuple : (F, K, pH, fit_p)
+        """
+        if self.dark is None:
+            raise ValueError('Dark spectrum not collected. Run collect_dark() first.')
+        if self.scale_factor is None:
+            raise ValueError('Scale factor not calculated. Run collect_scale_factor() first.')
+
+        if salinity is not None:
+            self.sal = salinity
+        
+        self.show_plots()
+        
+        await self.collect_spectrum_async(sample_name=sample_name)
+        
+        args = (self.spectrum, self.timestamp, self._dat_outfile, self._pkl_outfile, plot_vars, self._timing)
+        executor = self._executor if self.pipeline else None
+        
+        result, _ = await asyncio.gather(
+            asyncio.get_running_loop().run_in_executor(executor, self.process_sample, *args),
+            self.async_instruments.spectrometer.run(self._switch_to, 'reference'))
+        
+        self.show_plots()
+        
+        return result
+    
+    @profiled()
+    def save_summary(self, timestamp=None):
+        if timestamp is None:
+            timestamp = self.timestamp
+        
         exclude = ['spectra']
-        cols = [c for c in self.data_table.columns if c not in exclude]
+        cols = [c for c in self.results.columns if c not in exclude]
+        row = self.results.row(timestamp)
+        row = {c: row[c] for c in cols}
 
-        if not os.path.exists(self.summary_dat):
-            header = ','.join(cols) + '\n'
-            with open(self.summary_dat, 'w+') as f:
-                f.write(header)
+        header = ','.join(cols) + '\n'
+        if os.path.exists(self.summary_dat):
+            with open(self.summary_dat) as f:
+                current = f.readline()
+        else:
+            current = None
         
-        self.data_table.loc[[self.timestamp], cols].to_csv(self.summary_dat, header=False, index=False, mode='a')
+        if current is not None and current != header:
+            # the result columns have changed (e.g. temp_std was added): rewrite with the current columns
+            self.data_table.loc[:, cols].to_csv(self.summary_dat, index=False)
+        else:
+            if current is None:
+                with open(self.summary_dat, 'w+') as f:
+                    f.write(header)
+            pd.DataFrame([row], columns=cols).to_csv(self.summary_dat, header=False, index=False, mode='a')
+        
+        self.summary_store.append(timestamp, row)
         
         # if not os.path.exists(self.summary_dat):
         #     header = 'datetime,sample,dye,sal,temp,K,F,pH\n'
@@ -349,49 +1261,63 @@ class pHMeasurementSession:
         
         # with open(self.summary_dat, 'a') as f:
         #     f.write(data)
-        
-        self.data_table.to_pickle(self.summary_pkl)
+    
+    def compact_summary(self):
+        # spectra are already saved individually, so only their locations are pickled
+        snapshot = self.data_table
+        snapshot['spectra'] = [LazySpectrum(f) for f in snapshot['pkl_file']]
+        self.summary_store.compact(snapshot, self.summary_pkl)
     
     def end_session(self):
+        if self.pipeline:
+            self.flush_pipeline()
+            if self._owns_executor:
+                self._executor.shutdown()
         self.disconnect_Instruments()
+        if self.fit_client is not None:
+            self.fit_client.close()
+        self.compact_summary()
+        self.summary_store.close()
+        print(f'  > Summary saved to {self.summary_pkl}')
         if self._pkl_outfile is not None:
-            print(f'  > Last analysis: {self.self._pkl_outfile}')
+            print(f'  > Last analysis: {self._pkl_outfile}')
         print('Ready to end session. Please now run `exit` to close the session.')
 
 class TAMeasurementSession(pHMeasurementSession):
-    def __init__(self, dye='BPB', config_file=None, save=True, plotting=True, use_last_setup=False):
-        super().__init__(dye=dye, config_file=config_file, save=save, plotting=plotting, use_last_setup=use_last_setup)
+    result_columns = {
+        'sample': 'object',
+        'temp': 'float',
+        'temp_std': 'float',
+        'sal': 'float',
+        'F': 'ufloat',
+        'K': 'ufloat',
+        'pH': 'ufloat',
+        'm_sample': 'float',
+        'm_acid': 'float',
+        'C_acid': 'ufloat',
+        'TA': 'ufloat',
+        'spectra': 'object',
+        'dat_file': 'object',
+        'pkl_file': 'object',
+    }
+    
+    def __init__(self, dye='BPB', config_file=None, save=True, plotting=True, use_last_setup=False, instruments=None, section=None):
+        super().__init__(dye=dye, config_file=config_file, save=save, plotting=plotting, use_last_setup=use_last_setup, instruments=instruments, section=section)
         
         self.sample_weight_spreadsheet = self.config.get('sample_weight_spreadsheet')
+        self.sample_weights = SampleWeights(self.sample_weight_spreadsheet)
         
         print(f'  > Sample weight spreadsheet: {self.sample_weight_spreadsheet}')
         
         if self._new_data_table:
             self.make_data_table()
 
-    def make_data_table(self):
-        dat = pd.DataFrame(index=None, columns=['sample', 'temp', 'sal', 'F', 'K', 'pH', 'm_sample', 'm_acid', 'C_acid', 'TA', 'spectra', 'dat_file', 'pkl_file'])
-        dat = dat.astype({
-                'temp': float, 
-                'sal': float, 
-                'K': float, 
-                'm_sample': float, 
-                'm_acid': float, 
-                'C_acid': float,
-            })
-        dat.index.name = 'timestamp'
-        
-        self.data_table = dat
-        
     def get_sample_weights(self, crm=False, all=False):
-        valid_input = False
-        while not valid_input:
-            all_weights = pd.read_excel(self.sample_weight_spreadsheet, parse_dates=['timestamp'])
-            all_weights.set_index('timestamp', inplace=True)
-            
-            weights = all_weights.loc[self.timestamp, :]
+        while True:
+            # the spreadsheet is only re-read if it has changed since the last call
+            weights = self.sample_weights.get(self.timestamp)
             
-            if weights.empty:
+            if weights is None:
                 input(f'Sample {self.sample} at {self.timestamp} is not in the weight spreadsheet.\n Check the spreadsheet, resave it, then press Enter to continue.')
                 continue
             
@@ -407,11 +1333,9 @@ class TAMeasurementSession(pHMeasurementSession):
                 if np.isnan(weights['C_acid']):
                     input('No acid concentration present. Please check the spreadsheet, resave it, then press Enter to continue.')
                     continue
-
-            valid_input = True
             
             if all:
-                return all_weights
+                return self.sample_weights.read()
             
             return weights
 
@@ -430,6 +1354,7 @@ class TAMeasurementSession(pHMeasurementSession):
             
     #     self.data_table.to_pickle(self.summary_pkl)
     
+    @profiled()
     def measure_CRM(self, crm_alk, salinity, plot_vars=['absorbance', 'residuals', 'dark corrected']):
         
         sample_name = 'CRM'
@@ -445,10 +1370,11 @@ class TAMeasurementSession(pHMeasurementSession):
             self.sal = salinity
         
         self.collect_spectrum(sample_name=sample_name)
-                
-        F, K, pH, fit_p = calc_pH(self.spectrum)
+        
+        with self._timing.stage('fit'):
+            F, K, pH, fit_p = self.fit_pH(self.spectrum)
 
-        self.data_table.loc[self.timestamp, ['F', 'K', 'pH']] = F, K, pH
+        self.results.update(self.timestamp, F=F, K=K, pH=pH)
 
         sample_info = f'{self.timestamp}'
         pyperclip.copy(sample_info)
@@ -463,22 +1389,28 @@ class TAMeasurementSession(pHMeasurementSession):
         
         C_acid = calc_acid_strength(crm_alk=crm_alk, pH=pH, m0=m_sample, m=m_acid, sal=self.spectrum.sal, temp=self.spectrum.temp)
         
-        self.data_table.loc[self.timestamp, ['m_sample', 'm_acid', 'C_acid', 'TA']] = [m_sample, m_acid, C_acid, crm_alk]
+        self.results.update(self.timestamp, m_sample=m_sample, m_acid=m_acid, C_acid=C_acid, TA=crm_alk)
         
         print(f'Calibrated acid strength: {C_acid} (copied to clipboard)')
         acid_strength = f'{C_acid}'
         pyperclip.copy(acid_strength)
         
-        self.save_spectrum()
-        self.save_summary()
+        with self._timing.stage('save spectrum'):
+            self.save_spectrum()
+        with self._timing.stage('save summary'):
+            self.save_summary()
                 
         print(f'  > Acid Strength: {acid_strength:8f} M')
         
         if self.plotting:
-            plot_spectrum(self.spectrum, fit_p, include=plot_vars)
+            with self._timing.stage('plot'):
+                plot_spectrum(self.spectrum, fit_p, include=plot_vars)
+        
+        self._timing.finish()
             
         self.sal = self.config.getfloat('salinity')
             
+    @profiled()
     def measure_sample(self, sample_name=None, salinity=None, plot_vars=['absorbance', 'residuals', 'dark corrected']):
         
         if self.dark is None:
@@ -491,9 +1423,10 @@ class TAMeasurementSession(pHMeasurementSession):
         
         self.collect_spectrum(sample_name=sample_name)
         
-        F, K, pH, fit_p = calc_pH(self.spectrum)
+        with self._timing.stage('fit'):
+            F, K, pH, fit_p = self.fit_pH(self.spectrum)
 
-        self.data_table.loc[self.timestamp, ['F', 'K', 'pH']] = [F, K, pH]
+        self.results.update(self.timestamp, F=F, K=K, pH=pH)
 
         sample_info = f'{self.timestamp}'
         pyperclip.copy(sample_info)
@@ -504,14 +1437,19 @@ class TAMeasurementSession(pHMeasurementSession):
         weights = self.get_sample_weights()
         TA = TA_from_pH(pH=pH, m_sample=weights['m_sample'], m_acid=weights['m_acid'], C_acid=weights['C_acid'], sal=self.spectrum.sal, temp=self.spectrum.temp) * 1e6
                 
-        self.data_table.loc[self.timestamp, ['m_sample', 'm_acid', 'C_acid', 'TA']] = weights['m_sample'], weights['m_acid'], weights['C_acid'], TA
+        self.results.update(self.timestamp, m_sample=weights['m_sample'], m_acid=weights['m_acid'], C_acid=weights['C_acid'], TA=TA)
         
-        self.save_spectrum()
-        self.save_summary()
+        with self._timing.stage('save spectrum'):
+            self.save_spectrum()
+        with self._timing.stage('save summary'):
+            self.save_summary()
         
         print(sample_name)
         print(f'  > pH: {pH:.4f}')
         print(f'  > TA: {TA:.2f} µmol/kg')
                 
         if self.plotting:
-            plot_spectrum(self.spectrum, fit_p, include=plot_vars)
+            with self._timing.stage('plot'):
+                plot_spectrum(self.spectrum, fit_p, include=plot_vars)
+        
+        self._timing.finish()
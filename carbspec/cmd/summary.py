@@ -0,0 +1,150 @@
+import pickle
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+import uncertainties as un
+
+_std_suffix = '__std'
+
+def _to_sql(value):
+    """
+    Convert a summary value into something sqlite can store.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (np.floating, np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, int, str)):
+        return value
+    return str(value)
+
+class SummaryStore:
+    """
+    Append-only store for the summary of a measurement session.
+
+    Each measurement is written as a single row of an SQLite database
+    in WAL mode, so the cost of saving a measurement does not depend
+    on the length of the session. Spectra are stored by reference
+    (`pkl_file`) rather than by value. Values with uncertainties are
+    stored as separate nominal and standard deviation columns.
+
+    The table is keyed on timestamp, which provides the index used
+    for loading. Writes may come from any thread.
+
+    Parameters
+    ----------
+    file : str
+        The location of the database file.
+    """
+    def __init__(self, file):
+        self.file = file
+
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.file, check_same_thread=False)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        self._con.execute('PRAGMA synchronous=NORMAL')
+        self._con.execute('CREATE TABLE IF NOT EXISTS summary (timestamp TEXT PRIMARY KEY)')
+        self._con.commit()
+
+        self._columns = [r[1] for r in self._con.execute('PRAGMA table_info(summary)')]
+
+    def __len__(self):
+        with self._lock:
+            return self._con.execute('SELECT COUNT(*) FROM summary').fetchone()[0]
+
+    def _add_column(self, column):
+        self._con.execute(f'ALTER TABLE summary ADD COLUMN "{column}"')
+        self._columns.append(column)
+
+    def _flatten(self, row):
+        flat = {}
+        for k, v in row.items():
+            if isinstance(v, un.UFloat):
+                flat[k] = v.nominal_value
+                flat[k + _std_suffix] = v.std_dev
+            else:
+                flat[k] = _to_sql(v)
+        return flat
+
+    def append(self, timestamp, row, commit=True):
+        """
+        Write a single measurement to the store.
+
+        Parameters
+        ----------
+        timestamp : datetime-like
+            The timestamp of the measurement.
+        row : dict
+            Column names and values of the measurement. Values with
+            uncertainties are split into nominal and std columns.
+        commit : bool
+            Whether to commit the write immediately.
+        """
+        flat = self._flatten(row)
+
+        cols = ['timestamp'] + list(flat.keys())
+        colnames = ', '.join([f'"{c}"' for c in cols])
+        placeholders = ', '.join(['?'] * len(cols))
+
+        with self._lock:
+            for k in flat:
+                if k not in self._columns:
+                    self._add_column(k)
+
+            self._con.execute(
+                f'INSERT OR REPLACE INTO summary ({colnames}) VALUES ({placeholders})',
+                [str(pd.Timestamp(timestamp))] + list(flat.values())
+                )
+            if commit:
+                self._con.commit()
+
+    def extend(self, data_table, exclude=['spectra']):
+        """
+        Write all rows of an existing data table to the store.
+        """
+        cols = [c for c in data_table.columns if c not in exclude]
+        for timestamp, r in data_table.loc[:, cols].iterrows():
+            self.append(timestamp, r.to_dict(), commit=False)
+        with self._lock:
+            self._con.commit()
+
+    def load(self):
+        """
+        Load the stored summary as a DataFrame indexed by timestamp.
+        """
+        with self._lock:
+            dat = pd.read_sql_query('SELECT * FROM summary ORDER BY timestamp', self._con)
+        dat['timestamp'] = pd.to_datetime(dat['timestamp'])
+        dat.set_index('timestamp', inplace=True)
+
+        for c in [c for c in dat.columns if c.endswith(_std_suffix)]:
+            nom = c[:-len(_std_suffix)]
+            dat[nom] = [v if np.isnan(s) else un.ufloat(v, s) for v, s in zip(dat[nom].astype(float), dat[c].astype(float))]
+            dat.drop(columns=c, inplace=True)
+
+        return dat
+
+    def compact(self, data_table=None, pkl_file=None):
+        """
+        Checkpoint the journal into the database and vacuum it.
+
+        Parameters
+        ----------
+        data_table : pandas.DataFrame
+            If given alongside pkl_file, a complete snapshot of the
+            data table is pickled to pkl_file.
+        pkl_file : str
+            The location of the snapshot.
+        """
+        with self._lock:
+            self._con.commit()
+            self._con.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            self._con.execute('VACUUM')
+
+        if data_table is not None and pkl_file is not None:
+            data_table.to_pickle(pkl_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        with self._lock:
+            self._con.close()
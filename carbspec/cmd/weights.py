@@ -0,0 +1,141 @@
+import io
+import os
+import time
+import hashlib
+import pandas as pd
+
+class SampleWeights:
+    """
+    Cached reader for the sample weight spreadsheet.
+
+    The parsed sheet is kept in memory, and the file is only re-read when
+    its modification time or size changes. Spreadsheets (.ods, .xlsx, .xls)
+    are re-read in full. If a CSV file has only had lines appended (the
+    bytes read last time are unchanged), just the new lines are parsed.
+    Any other edit, such as filling in a missing weight, re-reads it all.
+
+    Parameters
+    ----------
+    file : str
+        The location of the weights file. Must contain a 'timestamp' column.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.csv = os.path.splitext(file)[-1].lower() == '.csv'
+
+        self._weights = None
+        self._signature = None
+        self._csv_offset = 0
+        self._csv_digest = None
+        self._csv_columns = None
+
+    def signature(self):
+        """
+        Return the (mtime, size) of the file, or None if it does not exist.
+        """
+        try:
+            st = os.stat(self.file)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def changed(self):
+        return self.signature() != self._signature
+
+    def wait_for_change(self, timeout=None, interval=0.5):
+        """
+        Poll the file until it changes.
+
+        Parameters
+        ----------
+        timeout : float
+            The maximum time to wait in seconds. Waits indefinitely if None.
+        interval : float
+            The time between checks in seconds.
+
+        Returns
+        -------
+        bool : whether the file changed.
+        """
+        start = time.monotonic()
+        while not self.changed():
+            if timeout is not None and time.monotonic() - start > timeout:
+                return False
+            time.sleep(interval)
+        return True
+
+    def _read_excel(self):
+        weights = pd.read_excel(self.file, parse_dates=['timestamp'])
+        return weights.set_index('timestamp')
+
+    @staticmethod
+    def _digest(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def _read_csv(self):
+        with open(self.file, 'rb') as f:
+            data = f.read()
+
+        offset = self._csv_offset
+        appended = self._weights is not None and len(data) >= offset and self._digest(data[:offset]) == self._csv_digest
+
+        if not appended:
+            # new or edited file: read everything
+            weights = pd.read_csv(io.BytesIO(data), parse_dates=['timestamp'])
+            self._csv_columns = list(weights.columns)
+            weights = weights.set_index('timestamp')
+        elif len(data) > offset:
+            # only parse lines appended since the last read
+            new = pd.read_csv(io.BytesIO(data[offset:]), names=self._csv_columns, header=None, parse_dates=['timestamp'])
+            weights = pd.concat([self._weights, new.set_index('timestamp')])
+        else:
+            weights = self._weights
+
+        self._csv_offset = len(data)
+        self._csv_digest = self._digest(data)
+        return weights
+
+    def read(self, force=False):
+        """
+        Return the weights table, re-reading the file only if it has changed.
+
+        Returns
+        -------
+        pandas.DataFrame : indexed by timestamp.
+        """
+        signature = self.signature()
+        if signature is None:
+            raise FileNotFoundError(f'Sample weight file {self.file} does not exist.')
+
+        if force:
+            self._weights = None
+
+        if self._weights is None or signature != self._signature:
+            if self.csv:
+                self._weights = self._read_csv()
+            else:
+                self._weights = self._read_excel()
+            self._signature = signature
+
+        return self._weights
+
+    def get(self, timestamp):
+        """
+        Return the weights recorded for a timestamp.
+
+        Returns
+        -------
+        pandas.Series : or None if the file or the timestamp are not present.
+        """
+        if self.signature() is None:
+            return None
+
+        weights = self.read()
+        if timestamp not in weights.index:
+            return None
+
+        row = weights.loc[timestamp, :]
+        if isinstance(row, pd.DataFrame):
+            # repeated timestamp: use the most recent entry
+            row = row.iloc[-1]
+        return row
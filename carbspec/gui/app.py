@@ -65,6 +65,7 @@ class MainWindow(qt.QMainWindow):
         
         # keyboard shortcuts
         qt.QShortcut(QtGui.QKeySequence('Ctrl+Q'), self, self.exit)
+        qt.QShortcut(QtGui.QKeySequence('Esc'), self, self.program.cancelTask)
 
         # # settings tab
         # self.optionsTab = qt.QWidget()
@@ -78,6 +79,7 @@ class MainWindow(qt.QMainWindow):
         self.setStyleSheet(styleSheet)
     
     def closeEvent(self, event):
+        self.program.waitForTask()
         self.program.writeConfig()
 
         if self.program.spectrometer is not None:
@@ -23,6 +23,9 @@ class GraphWidget(qt.QWidget):
 
         self.graph = pg.PlotItem(background=None)
         self.graphLayout.addItem(self.graph)
+        # only draw what is visible, at screen resolution
+        self.graph.setDownsampling(auto=True, mode='peak')
+        self.graph.setClipToView(True)
 
         self.lines = {}
         self.pens = {}
@@ -41,6 +44,9 @@ class GraphWidget(qt.QWidget):
 class GraphItem(pg.PlotItem):
     def __init__(self, nlines=1):
         super().__init__()
+        # only draw what is visible, at screen resolution
+        self.setDownsampling(auto=True, mode='peak')
+        self.setClipToView(True)
     
         self.lines = {}
         self.pens = {}
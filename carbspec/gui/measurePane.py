@@ -7,6 +7,7 @@ from functools import partial
 
 import styles
 from graph import GraphItem
+from resultsModel import ResultsTableModel
 
 def dummyConnect(*args, **kwargs):
     """
@@ -104,15 +105,19 @@ class measurePane:
         self.modeTabs.addTab(alkPane, 'Alkalinity (BPB)')
         self.setupAlkPane(alkLayout)
 
-        self.last5Table = qt.QTableWidget()
-        self.last5Table.horizontalHeader().setSectionResizeMode(qt.QHeaderView.Stretch)
+        # all results, newest first. Only the visible rows are drawn.
         self.tableColumns = ['Sample', 'pH', 'Temp', 'Sal']
         self.tableFmts = ['s', '.3f', '.1f', '.1f']
-        self.last5Table.setColumnCount(len(self.tableColumns))
-        self.last5Table.setHorizontalHeaderLabels(self.tableColumns)
-        self.updateTable()
+        self.resultsModel = ResultsTableModel(self.program.results, self.tableColumns, self.tableFmts)
+        self.resultsTable = qt.QTableView()
+        self.resultsTable.setModel(self.resultsModel)
+        self.resultsTable.horizontalHeader().setSectionResizeMode(qt.QHeaderView.Stretch)
+        self.resultsTable.verticalHeader().setSectionResizeMode(qt.QHeaderView.Fixed)
 
-        self.measLayout.addWidget(self.last5Table)
+        self.measLayout.addWidget(self.resultsTable)
+
+        self.exportResults = qt.QPushButton('Export Results')
+        self.measLayout.addWidget(self.exportResults)
 
         self.layout.addWidget(self.measPane, *pos)
 
@@ -131,12 +136,12 @@ class measurePane:
         layout.addWidget(self.alkControls['refit'])
 
     def updateTable(self):
-        last5Table = self.program.df.tail(5).loc[:, self.tableColumns]
-        self.last5Table.setRowCount(len(last5Table.index))
-        self.last5Table.setVerticalHeaderLabels([f'{v:.0f}' for v in last5Table.index[::-1]])
-        for i, ind in enumerate(last5Table.index):
-            for j, col in enumerate(last5Table.columns):
-                self.last5Table.setItem(len(last5Table.index) - i - 1, j, qt.QTableWidgetItem(f'{last5Table.loc[ind,col]:{self.tableFmts[j]}}'))
+        self.resultsModel.refresh()
+
+    def chooseExportFile(self):
+        file, _ = qt.QFileDialog.getSaveFileName(self.mainWindow.measureTab, 'Export Results', self.program.config.get('saveDir'), 'CSV files (*.csv)')
+        if file:
+            self.program.exportResults(file)
     
     def setupGraphs(self, *pos):
         self.graphPane = qt.QWidget()
@@ -174,16 +179,16 @@ class measurePane:
         self.layout.addWidget(self.graphPane, *pos)
 
     def connections(self):
-        # measure and display spectrum
+        # measure and display spectrum (the table is updated by the program once the fit is done)
         self.collectSpectrum.clicked.connect(partial(self.program.collectSpectrum, self.graphRaw.lines, 'incremental'))
-        self.collectSpectrum.clicked.connect(self.updateTable)
         
         # Re-fit data
         self.phControls['refit'].clicked.connect(self.program.refitSpectrum)
-        self.phControls['refit'].clicked.connect(self.updateTable)
 
         self.alkControls['refit'].clicked.connect(self.program.refitSpectrum)
-        self.alkControls['refit'].clicked.connect(self.updateTable)
+
+        # export results
+        self.exportResults.clicked.connect(self.chooseExportFile)
 
         # Sample name changed
         self.sampleName.textChanged.connect(partial(self.program.update_parameter, 'Sample', 'Sample', str))
@@ -0,0 +1,74 @@
+import time
+import numpy as np
+from PyQt5 import QtCore
+
+class PlotScheduler(QtCore.QObject):
+    """
+    Coalesces plot updates, drawing the latest data for each line at most `fps` times a second.
+
+    Data submitted for a line that has not yet been drawn replaces the pending
+    data, and is counted as dropped. Data are copied into a preallocated array
+    for each line, which is reused while the number of points is unchanged.
+    After each frame, `stats` is emitted with the measured frame rate and the
+    total number of dropped updates.
+    """
+    stats = QtCore.pyqtSignal(float, int)
+
+    def __init__(self, fps=30):
+        super().__init__()
+
+        self.pending = {}
+        self.buffers = {}
+
+        self.frames = 0
+        self.dropped = 0
+        self.fps = 0.
+        self._last_frame = None
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.setTargetFPS(fps)
+        self.timer.start()
+
+    def setTargetFPS(self, fps):
+        self.timer.setInterval(int(1000 / fps))
+
+    def submit(self, line, x, y):
+        if line in self.pending:
+            self.dropped += 1
+        self.pending[line] = (x, y)
+
+    def discard(self, lines):
+        for line in lines:
+            self.pending.pop(line, None)
+
+    def buffer(self, line, y):
+        buf = self.buffers.get(line)
+        if buf is None or buf.shape != np.shape(y):
+            buf = np.empty(np.shape(y))
+            self.buffers[line] = buf
+        np.copyto(buf, y)
+        return buf
+
+    def flush(self):
+        now = time.monotonic()
+
+        if len(self.pending) == 0:
+            # report 0 fps once plotting stops, and don't count the gap as a slow frame
+            if self._last_frame is not None and now - self._last_frame > 1:
+                self.fps = 0.
+                self._last_frame = None
+                self.stats.emit(self.fps, self.dropped)
+            return
+
+        pending, self.pending = self.pending, {}
+        for line, (x, y) in pending.items():
+            line.setData(x=x, y=self.buffer(line, y))
+
+        if self._last_frame is not None and now > self._last_frame:
+            fps = 1 / (now - self._last_frame)
+            self.fps = fps if self.fps == 0 else 0.8 * self.fps + 0.2 * fps
+        self._last_frame = now
+        self.frames += 1
+
+        self.stats.emit(self.fps, self.dropped)
@@ -1,4 +1,5 @@
 import numpy as np
+from functools import partial
 import pandas as pd
 from PyQt5 import QtGui, QtCore
 import pyqtgraph as pg
@@ -13,6 +14,14 @@ from carbspec.instruments.spectrometer import Spectrometer
 from carbspec.spectro.mixture import unmix_spectra, make_mix_spectra, pH_from_F
 from carbspec.dye import K_handler
 from carbspec.dye.splines import load_splines
+from carbspec.results import ResultBuffer
+from carbspec.spectro.spectrum import absorbance_sigma, valid_sigma
+from carbspec.spectro.dark import DarkModel
+from carbspec.instruments.acquisition import ScanAccumulator
+from carbspec.timing import StageTimer, no_timings
+from carbspec.spectro.fitserver import FitClient, FitServerError
+from worker import Worker, startWorker
+from plotting import PlotScheduler
 
 class Program:
     def __init__(self, mainWindow):
@@ -26,6 +35,15 @@ class Program:
         self.darkCollected = False
         self.scaleCollected = False
         
+        # darks at each integration time, used to model the dark at other integration times
+        self.darks = {}
+        self.darkModel = None
+        
+        # the running acquisition or fitting task
+        self.worker = None
+        self.workerThread = None
+        self.plotTargets = None
+        
         # data placeholder
         dataColumns = ['Sample', 'dye', 'a', 'b', 'bkg', 'c', 'm', 'F', 'Temp', 'Sal', 'K', 'pH']
         self.data = {k: None for k in dataColumns}
@@ -34,7 +52,20 @@ class Program:
         self.data['Temp'] = 25
         self.data['dye'] = 'MCP'
 
-        self.df = pd.DataFrame(columns=dataColumns)
+        self.results = ResultBuffer({
+            'Sample': 'object',
+            'dye': 'object',
+            'a': 'ufloat',
+            'b': 'ufloat',
+            'bkg': 'ufloat',
+            'c': 'ufloat',
+            'm': 'ufloat',
+            'F': 'ufloat',
+            'Temp': 'float',
+            'Sal': 'float',
+            'K': 'ufloat',
+            'pH': 'ufloat',
+        })
 
         self.live = {}
         self.live['wv'] = []
@@ -54,8 +85,44 @@ class Program:
         
         self.spectrometer = None
 
+        # splines and mixture functions for each dye used
+        self.dyeModels = {}
+
+        # fits are done on a fit server, if configured
+        self.fitClient = None
+        self.connectFitServer()
+
+        # draws live spectra at up to plotFPS frames per second
+        self.plotScheduler = PlotScheduler(fps=self.config.getfloat('plotFPS', fallback=30))
+
+        # time taken by each stage of each sample, if `timing` is set
+        self.timer = StageTimer(enabled=self.config.getboolean('timing', fallback=False), jsonl=self.config.get('timingLog', fallback='') or None)
+        self.timing = no_timings
+
         self.dyeSet(self.config.get('dye'))
 
+    @property
+    def timings(self):
+        return self.timer.to_frame()
+
+    @property
+    def df(self):
+        """
+        The results as a DataFrame, built from `results` on each access.
+
+        Changes to the DataFrame are not kept. Change a result with
+        `results.update(i, column=value)`, or assign a changed DataFrame
+        to `df` to replace all results.
+        """
+        return self.results.to_dataframe()
+
+    @df.setter
+    def df(self, df):
+        with self.results._lock:
+            self.results.clear()
+            self.results.extend(df)
+        self.mainWindow.measurePane.updateTable()
+
     def readConfig(self):
         self._config = ConfigParser()
         self._config.read(self._cfgfile)
@@ -96,28 +163,86 @@ class Program:
                 
         self.mainWindow.setupPane.spectro['statusLED'].setChecked(False)
 
-    def readSpectrometer(self, line=None, plot_mode='incremental', pbar=None, pbar_0=0):
-        self.incremental['wv'] = self.spectrometer.wv
+    @property
+    def busy(self):
+        return self.workerThread is not None and self.workerThread.isRunning()
 
-        for i in range(self.config.getint('nScans')):
+    def runTask(self, task, onFinished, lines=None, plot_mode='incremental', pbar=None):
+        """
+        Run task(worker) in a worker thread, and call onFinished with its result in the GUI thread.
+        
+        Partial spectra reported by the task are drawn on `lines`, and progress shown on `pbar`.
+        """
+        if self.busy:
+            print('  > Busy - wait for the current task to finish, or cancel it (Esc).')
+            return None
+
+        self.plotTargets = {'lines': lines, 'plot_mode': plot_mode, 'pbar': pbar}
+
+        self.worker = Worker(task, interval=self.config.getfloat('plotInterval', fallback=0.05))
+        self.worker.partial.connect(self.showPartial)
+        self.worker.finished.connect(onFinished)
+        self.worker.failed.connect(self.taskFailed)
+        self.worker.cancelled.connect(self.taskCancelled)
+        self.workerThread = startWorker(self.worker)
+        return self.worker
+
+    def cancelTask(self):
+        if self.busy:
+            self.worker.cancel()
+
+    def waitForTask(self):
+        if self.busy:
+            self.worker.cancel()
+            self.workerThread.wait()
+
+    def showPartial(self, update):
+        targets = self.plotTargets
+        if targets['lines'] is not None and update.get('step') is not None:
+            line = targets['lines'][update['step']]
+            if targets['plot_mode'] == 'incremental':
+                self.plotScheduler.submit(line, update['wv'], update['signal'])
+            elif targets['plot_mode'] == 'live':
+                self.plotScheduler.submit(line, update['wv'], update['scan'])
+
+        if targets['pbar'] is not None and update.get('progress') is not None:
+            targets['pbar'].setValue(update['progress'])
+
+    def taskFailed(self, error):
+        print(f'  > Task failed: {error}')
+        self.mainWindow.measurePane.collectSpectrum.setDisabled(not self.scaleCollected)
+
+    def taskCancelled(self):
+        print('  > Task cancelled.')
+        for pbar in [self.mainWindow.setupPane.spectro['darkProgress'], self.mainWindow.setupPane.spectro['scaleProgress'], self.mainWindow.measurePane.collectionPBar]:
+            pbar.reset()
+        self.mainWindow.measurePane.collectSpectrum.setDisabled(not self.scaleCollected)
+
+    def readSpectrometer(self, worker, step=0, pbar_0=0):
+        """
+        Average nScans spectra, reporting the running mean to the worker. Runs in the worker thread.
+
+        Returns
+        -------
+        tuple : (mean, variance of the mean)
+        """
+        wv = self.spectrometer.wv
+        nScans = self.config.getint('nScans')
+
+        # running mean and variance of the scans
+        acc = ScanAccumulator(wv.size)
+        for i in range(nScans):
+            worker.check()
             meas = self.spectrometer.read()
 
-            if i == 0:
-                self.incremental['signal'] = meas
-            else:
-                self.incremental['signal'] *= i / (i + 1)
-                self.incremental['signal'] += meas / (i + 1)
+            acc.add(meas)
+            worker.report({'step': step, 'wv': wv, 'signal': acc.mean(), 'scan': meas, 'progress': i + 1 + pbar_0}, force=i + 1 == nScans)
         
-            if line is not None:
-                if plot_mode == 'incremental':
-                    line.setData(x=self.spectrometer.wv, y=self.incremental['signal'])
-                elif plot_mode == 'live':
-                    line.setData(x=self.spectrometer.wv, y=meas)
-
-            if pbar is not None:
-                pbar.setValue(i + 1 + pbar_0)
-
-            QtGui.QApplication.processEvents()  # required to update plot
+        self.incremental['wv'] = wv
+        self.incremental['signal'] = acc.mean()
+        self.incremental['var'] = acc.var()
+        
+        return self.incremental['signal'], self.incremental['var']
 
     def readTemp(self):
         return np.random.uniform(22,27)
@@ -126,37 +251,68 @@ class Program:
     #     print(self.mainWindow.measurePane.sampleName.)
 
     def collectDark(self, line, plot_mode):
+        if self.busy:
+            return
         
         self.specChanged()
-        self.spectrometer.light_off()
         # set pbar bar max
-        self.mainWindow.setupPane.spectro['darkProgress'].setMaximum(self.config.getint('nScans'))
+        pbar = self.mainWindow.setupPane.spectro['darkProgress']
+        pbar.setMaximum(self.config.getint('nScans'))
         # measure
-        self.readSpectrometer(line=line, plot_mode=plot_mode, pbar=self.mainWindow.setupPane.spectro['darkProgress'])
+        self.runTask(self.acquireDark, self.darkCollectedCallback, lines=[line], plot_mode=plot_mode, pbar=pbar)
+
+    def acquireDark(self, worker):
+        self.spectrometer.light_off()
+        return self.readSpectrometer(worker)
+
+    def darkCollectedCallback(self, result):
+        self.data['dark'], self.data['dark_var'] = result
+
+        self.darks[self.config.getint('integrationTime')] = (self.data['dark'], self.data['dark_var'])
+        if len(self.darks) > 1:
+            times = list(self.darks)
+            self.darkModel = DarkModel.fit(self.spectrometer.wv, times, [self.darks[t][0] for t in times], [self.darks[t][1] for t in times])
+
         self.mainWindow.setupPane.spectro['scaleFactor'].setDisabled(False)
+        self.darkCollected = True
 
-        self.data['dark'] = self.incremental['signal']
+    def synthesizeDark(self):
+        """
+        Replace the dark with one predicted by the dark model for the current integration time.
+        """
+        t = self.config.getint('integrationTime')
+        self.data['dark'] = self.darkModel.predict(t)
+        self.data['dark_var'] = self.darkModel.predict_var(t)
+        self.mainWindow.setupPane.graphDark.lines[0].setData(x=self.spectrometer.wv, y=self.data['dark'])
 
         self.mainWindow.setupPane.spectro['scaleFactor'].setDisabled(False)
         self.darkCollected = True
 
     def collectScaleFactor(self, lines, plot_mode):
-        self.spectrometer.light_on()
-        self.spectrometer.sample_absent()
-
+        if self.busy:
+            return
         self.clearGraph(self.mainWindow.setupPane.graphChannels)
         self.clearGraph(self.mainWindow.setupPane.graphScale)
 
         pbar = self.mainWindow.setupPane.spectro['scaleProgress']
         pbar.setMaximum(2 * self.config.getint('nScans'))
 
+        self.runTask(self.acquireScaleFactor, self.scaleFactorCollected, lines=lines, plot_mode=plot_mode, pbar=pbar)
+
+    def acquireScaleFactor(self, worker):
+        self.spectrometer.light_on()
+        self.spectrometer.sample_absent()
+
         self.spectrometer.channel_0()
-        self.readSpectrometer(line=lines[0], plot_mode=plot_mode, pbar=pbar, pbar_0=0)
-        self.data['channel0'] = self.incremental['signal']
+        channel0, _ = self.readSpectrometer(worker, step=0, pbar_0=0)
 
         self.spectrometer.channel_1()
-        self.readSpectrometer(line=lines[1], plot_mode=plot_mode, pbar=pbar, pbar_0=self.config.getint('nScans'))
-        self.data['channel1'] = self.incremental['signal']
+        channel1, _ = self.readSpectrometer(worker, step=1, pbar_0=self.config.getint('nScans'))
+
+        return channel0, channel1
+
+    def scaleFactorCollected(self, result):
+        self.data['channel0'], self.data['channel1'] = result
 
         self.data['scaleFactor'] = self.data['channel1'] / self.data['channel0']
         self.mainWindow.setupPane.graphScale.lines[0].setData(x=self.spectrometer.wv, y=self.data['scaleFactor'])
@@ -191,6 +347,8 @@ class Program:
 
         # if any spectro parameter is changed, update the dark
         if parameter in ['integrationTime', 'nScans', 'wvMin', 'wvMax']:
+            # stop any acquisition using the old settings
+            self.waitForTask()
             self.specChanged()
         
         if parameter == 'integrationTime' and val is not None:
@@ -202,6 +360,14 @@ class Program:
         if parameter == 'wvMax':
             self.spectrometer.set_wavelength_range(wvMax=val)
         
+        if parameter in ['wvMin', 'wvMax']:
+            # the dark model is only valid for the wavelength range it was collected over
+            self.darks = {}
+            self.darkModel = None
+        
+        if parameter in ['integrationTime', 'nScans'] and val is not None and self.darkModel is not None:
+            self.synthesizeDark()
+        
         if parameter in self.data:
             self.data[parameter] = val
             
@@ -210,10 +376,9 @@ class Program:
         self.connectSpectrometer()
 
     def collectSpectrum(self, lines, plot_mode):
+        if self.busy:
+            return
         self.mainWindow.measurePane.collectSpectrum.setDisabled(True)
-        self.spectrometer.light_on()
-        self.spectrometer.sample_present()
-        # self.spectrometer.newSample()
 
         self.clearGraph(self.mainWindow.measurePane.graphAbs)
         self.clearGraph(self.mainWindow.measurePane.graphRaw)
@@ -222,88 +387,184 @@ class Program:
         pbar = self.mainWindow.measurePane.collectionPBar
         pbar.setMaximum(2 * self.config.getint('nScans'))
         
-        self.spectrometer.channel_0()
-        self.readSpectrometer(line=lines[0], plot_mode=plot_mode,
-                              pbar=pbar, pbar_0=0)
-        self.data['channel0_unscaled'] = self.incremental['signal']
-        self.data['channel0'] = self.data['channel0_unscaled'] * self.data['scaleFactor']
+        # copies of the setup, so the task is unaffected by changes in the GUI thread
+        setup = {k: self.data[k] for k in ['dark', 'dark_var', 'scaleFactor', 'dye', 'Sal']}
+
+        self.timing = self.timer.sample()
+        self.runTask(partial(self.acquireSpectrum, setup=setup, timing=self.timing), self.spectrumCollected, lines=lines, plot_mode=plot_mode, pbar=pbar)
 
-        t0 = self.readTemp()
+    def acquireSpectrum(self, worker, setup, timing=no_timings):
+        self.spectrometer.light_on()
+        self.spectrometer.sample_present()
+        # self.spectrometer.newSample()
+
+        data = {}
+
+        self.spectrometer.channel_0()
+        with timing.stage('spectrometer'):
+            data['channel0_unscaled'], channel0_var = self.readSpectrometer(worker, step=0, pbar_0=0)
+        data['channel0'] = data['channel0_unscaled'] * setup['scaleFactor']
+        # no variance from a single scan
+        data['channel0_var'] = None if channel0_var is None else channel0_var * setup['scaleFactor']**2
+
+        with timing.stage('temperature'):
+            t0 = self.readTemp()
         self.spectrometer.channel_1()
-        self.readSpectrometer(line=lines[1], plot_mode=plot_mode,
-                              pbar=pbar, pbar_0=self.config.getint('nScans'))
-        self.data['channel1'] = self.incremental['signal']
-        t1 = self.readTemp()
+        with timing.stage('spectrometer'):
+            data['channel1'], data['channel1_var'] = self.readSpectrometer(worker, step=1, pbar_0=self.config.getint('nScans'))
+        with timing.stage('temperature'):
+            t1 = self.readTemp()
+
+        dark, dark_var = setup['dark'], setup['dark_var']
+        data['absorption'] = np.log10((data['channel0'] - dark) / (data['channel1'] - dark))
+        
+        if dark_var is not None and data['channel0_var'] is not None and data['channel1_var'] is not None:
+            data['absorption_sigma'] = absorbance_sigma(
+                data['channel1'] - dark, data['channel0'] - dark,
+                data['channel1_var'] + dark_var, data['channel0_var'] + dark_var,
+                dark_var)
+        else:
+            data['absorption_sigma'] = None
+
+        data['Temp'] = np.mean([t0, t1])
 
-        self.data['absorption'] = np.log10((self.data['channel0'] - self.data['dark']) / (self.data['channel1'] - self.data['dark']))
-        self.mainWindow.measurePane.graphAbs.lines[0].setData(x=self.spectrometer.wv, y=self.data['absorption'])
+        worker.check()
+        with timing.stage('fit'):
+            data.update(self.fit(self.spectrometer.wv, data['absorption'], data['absorption_sigma'], setup['dye'], data['Temp'], setup['Sal']))
 
-        self.data['Temp'] = np.mean([t0, t1])
+        return data
 
-        self.fitSpectrum()
+    def spectrumCollected(self, data):
+        with self.timing.stage('display'):
+            self.fitted(data)
+            self.mainWindow.measurePane.graphAbs.lines[0].setData(x=self.spectrometer.wv, y=self.data['absorption'])
+        self.timing.label(sample=self.data['Sample'])
+        self.timing.finish()
 
         self.mainWindow.measurePane.collectSpectrum.setDisabled(False)
 
+    def fit(self, wv, absorption, absorption_sigma, dye, temp, sal):
+        """
+        Fit an absorption spectrum. Touches no widgets, so can run in the worker thread.
 
-    def fitSpectrum(self):
-        
-        self.data['K'] = K_handler(self.data['dye'], self.data['Temp'], self.data['Sal'])
+        Returns
+        -------
+        dict : the fitted parameters, K, F and pH.
+        """
+        result = {'K': K_handler(dye, temp, sal)}
         
         try:
-            p, cov = unmix_spectra(self.spectrometer.wv, self.data['absorption'], self.data['dye'])
-
-            self.p = un.correlated_values(p, cov)
-            self.data.update({k: v for k, v in zip(['a', 'b', 'bkg', 'c', 'm'], self.p)})
+            sigma = valid_sigma(absorption_sigma, absorption.size)
+            p, cov = self.unmix(wv, absorption, dye, temp, sal, sigma)
 
-            self.data['F'] = self.p[1] / self.p[0]
+            result['p'] = un.correlated_values(p, cov)
+            result.update({k: v for k, v in zip(['a', 'b', 'bkg', 'c', 'm'], result['p'])})
 
-            self.data['pH'] = pH_from_F(self.data['F'], self.data['K'])
+            result['F'] = result['p'][1] / result['p'][0]
 
-            self.updateFitGraph()
+            result['pH'] = pH_from_F(result['F'], result['K'])
 
-        except ValueError:
+        except (ValueError, FitServerError):
             for k in ['a', 'b', 'bkg', 'c', 'm', 'F', 'pH']:
-                self.data[k] = np.nan
-            self.p = np.full(5, np.nan)
+                result[k] = np.nan
+            result['p'] = np.full(5, np.nan)
+        
+        return result
+
+    def unmix(self, wv, absorption, dye, temp, sal, sigma=None):
+        client = self.fitClient
+        if client is not None:
+            try:
+                p, cov, _ = client.fit(wv, absorption, dye, temp, sal, sigma=sigma)
+                return p, cov
+            except OSError as e:
+                print(f'  > Lost fit server ({e!r}), fitting locally.')
+                self.fitClient = None
+                client.close()
+        
+        splines, _ = self.dyeModel(dye)
+        return unmix_spectra(wv, absorption, splines, sigma=sigma)
+
+    def connectFitServer(self, address=None):
+        """
+        Fit spectra on a fit server (see carbspec.spectro.fitserver), if one is running at `address`.
+        """
+        if address is None:
+            address = self.config.get('fitServer', fallback='')
+        if not address:
+            return
+        try:
+            self.fitClient = FitClient(address)
+            print(f'  > Fitting on server at {address}')
+        except OSError:
+            self.fitClient = None
+            print(f'  > No fit server at {address}, fitting locally.')
+
+    def fitSpectrum(self, onFinished=None):
+        args = (self.spectrometer.wv, self.data['absorption'], self.data.get('absorption_sigma'), self.data['dye'], self.data['Temp'], self.data['Sal'])
+        self.runTask(lambda worker: self.fit(*args), self.fitted if onFinished is None else onFinished)
+
+    def fitted(self, result):
+        self.p = result['p']
+        self.data.update({k: v for k, v in result.items() if k != 'p'})
+
+        if np.isfinite(nominal_values(self.p)).all():
+            self.updateFitGraph()
         
         # self.storeResult(K, F, pH)
         self.storeResult()
+        self.mainWindow.measurePane.updateTable()
 
     # def storeResult(self, K, F, pH):
     def storeResult(self):
-        i = int(np.nanmax([0, self.df.index.max() + 1]))
+        result = dict(zip(['a', 'b', 'bkg', 'c', 'm'], self.p))
+        result.update({k: self.data[k] for k in ['Sample', 'dye', 'F', 'Temp', 'Sal', 'K', 'pH']})
 
-        self.df.loc[i, ['a', 'b', 'bkg', 'c', 'm']] = self.p
-        for k in ['Sample', 'dye', 'F', 'Temp', 'Sal', 'K', 'pH']:
-            self.df.loc[i, k] = self.data[k]
+        self.results.append(len(self.results), **result)
 
     def refitSpectrum(self):
-        self.df.drop(self.df.index.max(), inplace=True)
+        if self.busy:
+            return
         self.clearFitGraph()
-        self.fitSpectrum()
+        self.fitSpectrum(onFinished=self.refitted)
+
+    def refitted(self, result):
+        # replace the last result
+        self.results.pop()
+        self.fitted(result)
+
+    def addFitOverlays(self, graph):
+        """
+        Create the fit overlay items on a graph. They are reused for every fit.
+        """
+        graph.lines['pred'] = pg.PlotDataItem([], [], pen=pg.mkPen(color=styles.colour_main, width=2, style=QtCore.Qt.DashLine))
+        graph.addItem(graph.lines['pred'])
+
+        acid_color = list(styles.colour_acid) + [100]
+        graph.lines['acid'] = pg.PlotCurveItem([], [], brush=pg.mkBrush(*acid_color), fillLevel=0.0, pen=(0,0,0,100))
+        graph.addItem(graph.lines['acid'])
+
+        base_color = list(styles.colour_base) + [100]
+        graph.lines['base'] = pg.PlotCurveItem([], [], brush=pg.mkBrush(*base_color), fillLevel=0.0, pen=(0,0,0,100))
+        graph.addItem(graph.lines['base'])
 
     def updateFitGraph(self):
         p = nominal_values(self.p)
         # draw curves
         graph = self.mainWindow.measurePane.graphAbs
-        mixture = make_mix_spectra(self.data['dye'])
+        if 'pred' not in graph.lines:
+            self.addFitOverlays(graph)
+        
         x = self.spectrometer.wv
-        pred = mixture(x, *p)
+        pred = self.mixture(x, *p)
         baseline = np.full(x.size, p[2])
         xm = p[-2] + x * p[-1]
         acid = baseline + self.splines['acid'](xm) * p[0]
         base = baseline + self.splines['base'](xm) * p[1]
 
-        graph.lines['pred'] = pg.PlotDataItem(x=x, y=pred, pen=pg.mkPen(color=styles.colour_main, width=2, style=QtCore.Qt.DashLine))
-        graph.addItem(graph.lines['pred'])
-
-        acid_color = list(styles.colour_acid) + [100]
-        graph.lines['acid'] = pg.PlotCurveItem(x=x, y=acid, brush=pg.mkBrush(*acid_color), fillLevel=0.0, pen=(0,0,0,100))
-        graph.addItem(graph.lines['acid'])
-
-        base_color = list(styles.colour_base) + [100]
-        graph.lines['base'] = pg.PlotCurveItem(x=x, y=base, brush=pg.mkBrush(*base_color), fillLevel=0.0, pen=(0,0,0,100))
-        graph.addItem(graph.lines['base'])
+        graph.lines['pred'].setData(x=x, y=pred)
+        graph.lines['acid'].setData(x=x, y=acid)
+        graph.lines['base'].setData(x=x, y=base)
 
         # plot residual
         rgraph = self.mainWindow.measurePane.graphResid
@@ -326,7 +587,7 @@ class Program:
         else:
             ValueError('i must be an integer or a string')
 
-        self.splines = load_splines(self.data['dye'])
+        self.splines, self.mixture = self.dyeModel(self.data['dye'])
 
         if 'absorption' in self.data:
             self.clearFitGraph()
@@ -334,10 +595,24 @@ class Program:
 
         print(self.data['dye'])
     
+    def dyeModel(self, dye):
+        """
+        The splines and mixture function of a dye, loaded once per dye.
+        """
+        if dye not in self.dyeModels:
+            splines = load_splines(dye)
+            self.dyeModels[dye] = (splines, make_mix_spectra(splines))
+        return self.dyeModels[dye]
+
     def clearGraph(self, graph):
+        self.plotScheduler.discard(graph.lines.values())
         for line in graph.lines.values():
             line.setData(y = [])
     
+    def exportResults(self, file):
+        self.results.to_csv(file)
+        print(f'  > Results exported to {file}')
+
     def writeSpectra(self, parameter_list):
         pass
 
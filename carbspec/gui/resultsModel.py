@@ -0,0 +1,74 @@
+from PyQt5 import QtCore
+
+class ResultsTableModel(QtCore.QAbstractTableModel):
+    """
+    A table model over a ResultBuffer, showing the newest result first.
+
+    Views only request the cells they display, so the cost of drawing the
+    table does not grow with the number of results. Call refresh() after
+    the buffer changes: new rows are inserted, removed rows are removed, and
+    the newest row is updated (e.g. after a refit).
+
+    Parameters
+    ----------
+    buffer : carbspec.results.ResultBuffer
+        The results.
+    columns : list of str
+        The buffer columns shown.
+    fmts : list of str
+        The format spec of each column.
+    """
+    def __init__(self, buffer, columns, fmts, parent=None):
+        super().__init__(parent)
+        self.buffer = buffer
+        self.columns = list(columns)
+        self.fmts = list(fmts)
+        self._n = len(buffer)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._n
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.columns)
+
+    def bufferRow(self, row):
+        # newest first
+        return self._n - row - 1
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+
+        value = self.buffer.value(self.bufferRow(index.row()), self.columns[index.column()])
+        if value is None:
+            return ''
+        try:
+            return f'{value:{self.fmts[index.column()]}}'
+        except (ValueError, TypeError):
+            return str(value)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.columns[section]
+        return f'{self.buffer.index[self.bufferRow(section)]:.0f}'
+
+    def refresh(self):
+        n = len(self.buffer)
+        if n > self._n:
+            self.beginInsertRows(QtCore.QModelIndex(), 0, n - self._n - 1)
+            self._n = n
+            self.endInsertRows()
+        elif n < self._n:
+            self.beginRemoveRows(QtCore.QModelIndex(), 0, self._n - n - 1)
+            self._n = n
+            self.endRemoveRows()
+
+        if n > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(0, len(self.columns) - 1))
+            self.headerDataChanged.emit(QtCore.Qt.Vertical, 0, 0)
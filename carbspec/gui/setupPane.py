@@ -61,6 +61,9 @@ class setupPane:
         self.connections()
         self.setLastConfig()
         
+    def showPlotStats(self, fps, dropped):
+        self.spectro['plotStats'].setText(f'Plotting: {fps:.0f} fps, {dropped} dropped')
+
     def refreshSpectrometers(self):
         print('refreshing spectrometers')
         self.spectro['commLink'].clear()
@@ -158,6 +161,12 @@ class setupPane:
         scaleProgress.setTextVisible(False)
         self.spectro['scaleProgress'] = scaleProgress
         optGrid.addWidget(scaleProgress, current_row, 2, 1, 2)
+        current_row += 1
+
+        # live plotting performance
+        plotStats = qt.QLabel('Plotting: 0 fps, 0 dropped')
+        self.spectro['plotStats'] = plotStats
+        optGrid.addWidget(plotStats, current_row, 0, 1, 4, alignment=QtCore.Qt.AlignRight)
 
         self.spectroLayout.addWidget(optPane)
         self.spectroLayout.addStretch()
@@ -295,6 +304,9 @@ class setupPane:
         self.temp['temp_c'].textChanged.connect(partial(self.program.update_parameter, 'temp', 'temp_c', float))
         self.temp['temp_m'].textChanged.connect(partial(self.program.update_parameter, 'temp', 'temp_m', float))
 
+        # live plotting performance
+        self.program.plotScheduler.stats.connect(self.showPlotStats)
+
         # measure and display dark spectrum
         self.spectro['darkSpectrum'].clicked.connect(partial(self.program.collectDark, self.graphDark.lines[0], 'incremental'))
 
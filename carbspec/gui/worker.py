@@ -0,0 +1,69 @@
+import time
+import traceback
+from PyQt5 import QtCore
+
+class Cancelled(Exception):
+    pass
+
+class Worker(QtCore.QObject):
+    """
+    Runs a task in a QThread, so that acquisition and fitting don't block the GUI.
+
+    The task is called as task(worker), and can report partial results with
+    worker.report(), which emits `partial` at most once every `interval`
+    seconds. worker.check() raises Cancelled if cancel() has been called, and
+    should be called regularly by the task.
+
+    Exactly one of `finished` (with the return value of the task), `failed`
+    (with the exception) or `cancelled` is emitted, followed by `done`.
+    """
+    partial = QtCore.pyqtSignal(object)
+    finished = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(object)
+    cancelled = QtCore.pyqtSignal()
+    done = QtCore.pyqtSignal()
+
+    def __init__(self, task, interval=0.05):
+        super().__init__()
+        self.task = task
+        self.interval = interval
+
+        self._cancel = False
+        self._last_report = -float('inf')
+
+    def report(self, update, force=False):
+        now = time.monotonic()
+        if force or now - self._last_report >= self.interval:
+            self._last_report = now
+            self.partial.emit(update)
+
+    def check(self):
+        if self._cancel:
+            raise Cancelled()
+
+    def cancel(self):
+        self._cancel = True
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        try:
+            result = self.task(self)
+        except Cancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.failed.emit(e)
+        else:
+            self.finished.emit(result)
+        self.done.emit()
+
+def startWorker(worker):
+    """
+    Move a worker to a new QThread and start it. Returns the thread.
+    """
+    thread = QtCore.QThread()
+    worker.moveToThread(thread)
+    thread.started.connect(worker.run)
+    worker.done.connect(thread.quit)
+    thread.start()
+    return thread
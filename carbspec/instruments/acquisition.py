@@ -0,0 +1,107 @@
+import numpy as np
+
+def boxcar(spec, width):
+    """
+    Apply a boxcar (running mean) filter of `width` pixels to a spectrum.
+    """
+    if width is None or width <= 1:
+        return spec
+    return np.convolve(spec, np.ones(width) / width, mode='same')
+
+def roi_bounds(roi, npix, pad=0):
+    """
+    Convert a boolean wavelength mask into slice bounds.
+
+    Parameters
+    ----------
+    roi : array-like of bool or None
+        Mask selecting a contiguous region of interest. If None, the
+        whole spectrum is used.
+    npix : int
+        The number of pixels in the spectrum.
+    pad : int
+        The number of additional pixels to include either side of the roi.
+
+    Returns
+    -------
+    tuple : (start, stop) of the padded region, and (start, stop) of the roi within it.
+    """
+    if roi is None:
+        start, stop = 0, npix
+    else:
+        idx = np.flatnonzero(roi)
+        start, stop = idx[0], idx[-1] + 1
+
+    pstart = max(start - pad, 0)
+    pstop = min(stop + pad, npix)
+
+    return (pstart, pstop), (start - pstart, stop - pstart)
+
+class ScanAccumulator:
+    """
+    Average repeated scans in place, over a wavelength region of interest.
+
+    Scans are sliced to the region of interest (padded by half the boxcar
+    width, so the boxcar filter gives the same result as filtering the
+    whole spectrum) before being accumulated. The per-pixel mean and
+    variance are updated with Welford's algorithm, so the scan-to-scan
+    scatter is available without storing individual scans.
+
+    Parameters
+    ----------
+    npix : int
+        The number of pixels in each scan.
+    roi : array-like of bool
+        Mask selecting a contiguous region of interest.
+    boxcar_width : int
+        The width of the boxcar filter applied to the mean.
+    """
+    def __init__(self, npix, roi=None, boxcar_width=None):
+        self.npix = npix
+        self.boxcar_width = boxcar_width
+
+        pad = 0 if boxcar_width is None else boxcar_width // 2
+        (self._pstart, self._pstop), (self._start, self._stop) = roi_bounds(roi, npix, pad)
+
+        size = self._pstop - self._pstart
+        self._mean = np.zeros(size)
+        self._m2 = np.zeros(size)
+        self._delta = np.empty(size)
+        self.n = 0
+
+    def reset(self):
+        self._mean[:] = 0
+        self._m2[:] = 0
+        self.n = 0
+
+    def add(self, scan):
+        scan = scan[self._pstart:self._pstop]
+        self.n += 1
+
+        # delta = x - mean_(n-1); mean_n = mean_(n-1) + delta / n; M2 += delta * (x - mean_n)
+        np.subtract(scan, self._mean, out=self._delta)
+        self._mean += self._delta / self.n
+        self._delta *= scan - self._mean
+        self._m2 += self._delta
+
+    def mean(self):
+        """
+        The boxcar-filtered mean of the accumulated scans over the roi.
+        """
+        return boxcar(self._mean, self.boxcar_width)[self._start:self._stop].copy()
+
+    def var(self):
+        """
+        The variance of the boxcar-filtered mean over the roi.
+
+        This is the per-pixel scan variance divided by the number of scans,
+        propagated through the boxcar filter assuming independent pixels.
+        Returns None if fewer than two scans have been accumulated.
+        """
+        if self.n < 2:
+            return None
+
+        var = self._m2 / (self.n - 1) / self.n
+        if self.boxcar_width is not None and self.boxcar_width > 1:
+            var = np.convolve(var, np.ones(self.boxcar_width) / self.boxcar_width**2, mode='same')
+        return var[self._start:self._stop].copy()
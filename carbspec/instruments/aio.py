@@ -0,0 +1,100 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncInstrument:
+    """
+    Asynchronous access to a blocking instrument.
+
+    Each instrument gets its own I/O thread, so calls to one instrument run
+    one at a time and in order, while calls to different instruments (and
+    to the background sampler) overlap. Every method of the instrument is
+    available as a coroutine function, e.g. `await probe.read()`.
+
+    Parameters
+    ----------
+    instrument : object
+        The connected instrument.
+    executor : concurrent.futures.Executor
+        Where the instrument's methods run. Defaults to a new single thread.
+    """
+    def __init__(self, instrument, executor=None):
+        self.instrument = instrument
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'carbspec-{type(instrument).__name__}')
+        self.executor = executor
+
+    @classmethod
+    async def open(cls, factory, *args, **kwargs):
+        """
+        Construct (and so connect to) an instrument on its own I/O thread.
+
+        Not to be confused with `connect`, which (like every other method of
+        the instrument) is forwarded to the wrapped instrument.
+
+        Parameters
+        ----------
+        factory : callable
+            Returns a connected instrument, e.g. the instrument class.
+        *args, **kwargs
+            Passed to `factory`.
+
+        Returns
+        -------
+        AsyncInstrument
+        """
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'carbspec-{getattr(factory, "__name__", "instrument")}')
+        try:
+            instrument = await asyncio.get_running_loop().run_in_executor(executor, functools.partial(factory, *args, **kwargs))
+        except BaseException:
+            executor.shutdown(wait=False)
+            raise
+
+        aio = cls(instrument, executor)
+        aio._owns_executor = True
+        return aio
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Call `function` on the instrument's I/O thread.
+
+        Use this for operations that involve several calls to the
+        instrument, so they are not interleaved with other calls.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def read(self, *args, **kwargs):
+        return await self.run(self.instrument.read, *args, **kwargs)
+
+    async def disconnect(self):
+        """
+        Disconnect the instrument, if it can be disconnected, and stop its I/O thread.
+        """
+        try:
+            if hasattr(self.instrument, 'disconnect'):
+                await self.run(self.instrument.disconnect)
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop the I/O thread, leaving the instrument connected.
+        """
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    def __getattr__(self, name):
+        if name == 'instrument':
+            raise AttributeError(name)
+        attr = getattr(self.instrument, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return method
+
+    def __repr__(self):
+        return f'AsyncInstrument({self.instrument!r})'
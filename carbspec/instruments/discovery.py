@@ -0,0 +1,91 @@
+import os
+import json
+import threading
+from types import SimpleNamespace
+
+class DeviceCache:
+    """
+    A persisted record of where instruments were last found.
+
+    Finding an instrument can mean scanning every serial port or
+    enumerating every USB device. The cache records the port path and serial
+    number of each instrument found, so that the next session can try that
+    device first and only scan again if it has gone.
+
+    Parameters
+    ----------
+    file : str
+        The JSON file the cache is kept in. It is created when the first
+        device is recorded.
+    """
+    def __init__(self, file):
+        self.file = file
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(file):
+            try:
+                with open(file) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                # a damaged cache is rebuilt as devices are found
+                self._entries = {}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        The cached entry for `key`, or None.
+        """
+        entry = self._entries.get(key)
+        return None if entry is None else dict(entry)
+
+    def set(self, key, **entry):
+        """
+        Record an entry for `key`, and write the cache if it changed.
+        """
+        with self._lock:
+            if self._entries.get(key) == entry:
+                return
+            self._entries[key] = entry
+            self._write()
+
+    def forget(self, key):
+        """
+        Remove the entry for `key`, e.g. because the device was not found where it was cached.
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._write()
+
+    def port(self, key):
+        """
+        The cached serial port for `key`, if the port still exists.
+
+        Only the existence of the port path is checked, which is fast. The
+        caller should confirm the device responds, and `forget` the entry if
+        it does not. Ports without a path in the filesystem (e.g. COM ports
+        on Windows) are never returned.
+
+        Returns
+        -------
+        SimpleNamespace or None : with `device`, `serial_number` and `product`.
+        """
+        entry = self.get(key)
+        if entry is None or not os.path.exists(entry.get('device', '')):
+            return None
+        return SimpleNamespace(device=entry['device'], serial_number=entry.get('serial_number'), product=entry.get('product'))
+
+    def record_port(self, key, port):
+        """
+        Record a serial port (e.g. from serial.tools.list_ports) for `key`.
+        """
+        self.set(key, device=port.device, serial_number=port.serial_number, product=port.product)
+
+    def _write(self):
+        directory = os.path.dirname(os.path.abspath(self.file))
+        os.makedirs(directory, exist_ok=True)
+        tmp = f'{self.file}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp, self.file)
@@ -2,8 +2,9 @@ import numpy as np
 from scipy.stats import norm
 from carbspec.dye.splines import load_splines
 from carbspec.spectro.mixture import make_mix_spectra
-
-import time
+from carbspec.instruments.acquisition import ScanAccumulator
+from carbspec.instruments.sampler import Sampled
+from carbspec.clock import get_clock
 
 default_splines = 'MCP_Cam1'
  
@@ -85,7 +86,7 @@ class Spectrometer:
         self.Abs = self.mixture(self.wv, a, a * f)
 
     def read(self):
-        time.sleep(self.integration_time / 1000)
+        get_clock().sleep(self.integration_time / 1000)
         bkg = np.random.normal(self.bkg, self.noise / self.integration_time, self.wv.size)
         if self.light:
             I0 = self.light_only * self.integration_time
@@ -100,13 +101,29 @@ class Spectrometer:
         else:
             return bkg
 
-class TempProbe:
-    def __init__(self, **kwargs):
+    def read_averaged(self, nscans, boxcar_width=None, roi=None, return_var=False, **kwargs):
+        acc = ScanAccumulator(self.wv.size, roi=roi, boxcar_width=boxcar_width)
+        for _ in range(nscans):
+            acc.add(self.read())
+        if return_var:
+            return acc.mean(), acc.var()
+        return acc.mean()
+
+class TempProbe(Sampled):
+    def __init__(self, read_time=0., **kwargs):
+        # simulated time taken by each read (s)
+        self.read_time = read_time
         self.lastTemp = self.read()
         self.connected = True
         print('  > Connected to dummy TempProbe')
 
+    def disconnect(self):
+        self.stop_sampling()
+        self.connected = False
+
     def read(self):
+        if self.read_time:
+            get_clock().sleep(self.read_time)
         return np.random.normal(25, 2)
 
 class BeamSwitch:
@@ -16,7 +16,19 @@ class Instrument:
         self._com_grep = 'test'
         self._com_params = {}
     
-    def find_port(self):
+    def find_port(self, cache=None):
+        """
+        Find the serial port of the instrument, matching `_com_grep`.
+
+        If `cache` (an instruments.discovery.DeviceCache) has a port for the
+        instrument that still exists, it is returned without scanning the
+        ports. Otherwise the port found is recorded in the cache.
+        """
+        if cache is not None:
+            port = cache.port(self._com_grep)
+            if port is not None:
+                return port
+        
         found_ports = []
         for p in list_ports.grep(self._com_grep):
             found_ports.append(p)
@@ -25,7 +37,10 @@ class Instrument:
             raise ValueError(f'No port found containing {self._com_grep}. Is the sensor connected?')
 
         if len(found_ports) > 1:
-            raise ValueError('\n'.join([f'Multiple ports found containing {self._com_grep}:'] + found_ports + ['Please disconnect one of them and try again.']))
+            raise ValueError('\n'.join([f'Multiple ports found containing {self._com_grep}:'] + [p.device for p in found_ports] + ['Please disconnect one of them and try again.']))
+        
+        if cache is not None:
+            cache.record_port(self._com_grep, found_ports[0])
         
         return found_ports[0]
 
@@ -0,0 +1,281 @@
+import os
+from glob import glob
+import numpy as np
+import pandas as pd
+
+from carbspec.clock import get_clock
+from carbspec.instruments.acquisition import ScanAccumulator
+from carbspec.instruments.sampler import Sampled
+from carbspec.spectro.spectrum import Spectrum
+
+# columns of the SI/data .dat files
+dat_columns = {
+    'dark': 'dark',
+    'blank_reference': 'Cell 1',
+    'blank_sample': 'Cell 2',
+    'reference': 'Background',
+    'sample': 'Sample',
+}
+
+def load_dat_record(file):
+    """
+    Load a recorded measurement from a tab-separated .dat file.
+
+    The file must contain 'wavelength', 'dark', 'Cell 1', 'Cell 2',
+    'Background' and 'Sample' columns. 'Cell 1' and 'Cell 2' are the
+    reference and sample cells with the blank in both, and 'Background'
+    and 'Sample' are the reference and sample cells during the measurement.
+    If present, the first row of 'Temperature' and 'Salinity' are used.
+
+    Returns
+    -------
+    dict : containing 'name', 'wv', 'temp', 'sal' and the spectra.
+    """
+    dat = pd.read_csv(file, sep='\t')
+
+    record = {k: dat[c].values.astype(float) for k, c in dat_columns.items()}
+    record['name'] = os.path.splitext(os.path.basename(file))[0]
+    record['wv'] = dat['wavelength'].values.astype(float)
+    record['temp'] = dat['Temperature'].iloc[0] if 'Temperature' in dat.columns and dat['Temperature'].iloc[0] != 0 else None
+    record['sal'] = dat['Salinity'].iloc[0] if 'Salinity' in dat.columns and dat['Salinity'].iloc[0] != 0 else None
+
+    return record
+
+class ReplaySource:
+    """
+    Play back recorded spectra through instruments with the same interface as the hardware.
+
+    The Spectrometer, BeamSwitch and TempProbe methods create instruments
+    that share the state of this source, so that the spectrum returned
+    depends on the beam switch position, whether the light is on, and
+    whether a sample is present. Pass the source as `instruments` to a
+    measurement session to run it on recorded data.
+
+    Parameters
+    ----------
+    records : list of dict
+        Recorded measurements (see load_dat_record).
+    speed : float or None
+        Playback speed. 1 sleeps for the integration time of each scan (real
+        time), larger values are accelerated, and None returns immediately.
+    noise : float
+        Standard deviation of random noise added to each scan (counts).
+    loop : bool
+        Whether to return to the first record after the last.
+    """
+    dummy = False
+
+    def __init__(self, records, speed=None, noise=0, loop=True, seed=None):
+        if len(records) == 0:
+            raise ValueError('No records to replay.')
+
+        self.records = records
+        self.speed = speed
+        self.noise = noise
+        self.loop = loop
+        self.rng = np.random.default_rng(seed)
+
+        self.wv = records[0]['wv']
+
+        self.index = 0
+        self.cell = 'reference'
+        self.light = True
+        self.sample = True
+        self.integration_time = None
+        self.recorded_integration_time = None
+
+    @classmethod
+    def from_dat(cls, files, **kwargs):
+        """
+        Replay .dat files, given as a list or a glob pattern.
+        """
+        if isinstance(files, str):
+            files = sorted(glob(files))
+        return cls([load_dat_record(f) for f in files], **kwargs)
+
+    @classmethod
+    def from_session(cls, savedir, **kwargs):
+        """
+        Replay the spectra saved by a measurement session in `savedir`.
+
+        The blank spectra of each sample are taken from the most recent
+        preceding 'setup' spectrum.
+        """
+        files = sorted(glob(os.path.join(savedir, 'pkl', '*.pkl')))
+        spectra = [Spectrum.from_pickle(f) for f in files]
+        spectra = sorted([s for s in spectra if s.light_sample_raw is not None], key=lambda s: s.timestamp)
+
+        records = []
+        setup = None
+        for s in spectra:
+            if s.sample == 'setup':
+                setup = s
+                continue
+            if setup is None:
+                setup = s
+            records.append({
+                'name': s.sample,
+                'wv': np.asanyarray(s.wv, dtype=float),
+                'temp': s.temp,
+                'sal': s.sal,
+                'dark': np.asanyarray(s.dark, dtype=float),
+                'blank_reference': np.asanyarray(setup.light_reference_raw, dtype=float),
+                'blank_sample': np.asanyarray(setup.light_sample_raw, dtype=float),
+                'reference': np.asanyarray(s.light_reference_raw, dtype=float),
+                'sample': np.asanyarray(s.light_sample_raw, dtype=float),
+            })
+        return cls(records, **kwargs)
+
+    @property
+    def record(self):
+        return self.records[self.index]
+
+    def next_record(self):
+        """
+        Move on to the next recorded measurement.
+        """
+        if self.index + 1 < len(self.records):
+            self.index += 1
+        elif self.loop:
+            self.index = 0
+        else:
+            raise IndexError('No more records to replay.')
+
+    def scan(self):
+        """
+        Return the recorded scan for the current state.
+        """
+        record = self.record
+        if not self.light:
+            key = 'dark'
+        elif self.sample:
+            key = self.cell
+        else:
+            key = 'blank_' + self.cell
+
+        spec = record[key]
+        if key != 'dark' and self.integration_time is not None and self.recorded_integration_time is not None:
+            # signal above dark scales with integration time
+            spec = record['dark'] + (spec - record['dark']) * self.integration_time / self.recorded_integration_time
+        if record['wv'] is not self.wv and not np.array_equal(record['wv'], self.wv):
+            spec = np.interp(self.wv, record['wv'], spec)
+
+        if self.noise:
+            spec = spec + self.rng.normal(0, self.noise, spec.size)
+
+        if self.speed is not None and self.integration_time is not None:
+            get_clock().sleep(self.integration_time / 1000 / self.speed)
+
+        return spec
+
+    # instrument factories
+    def Spectrometer(self, **kwargs):
+        return ReplaySpectrometer(self)
+
+    def BeamSwitch(self, **kwargs):
+        return ReplayBeamSwitch(self)
+
+    def TempProbe(self, **kwargs):
+        return ReplayTempProbe(self)
+
+class ReplaySpectrometer:
+    def __init__(self, source):
+        self.source = source
+        self.connected = True
+
+        self.wvMin = -np.inf
+        self.wvMax = np.inf
+        self.update_wv()
+
+        print(f'  > Connected to replay Spectrometer ({len(source.records)} records)')
+
+    def set_wavelength_range(self, wvMin=None, wvMax=None):
+        if wvMin is not None:
+            self.wvMin = wvMin
+        if wvMax is not None:
+            self.wvMax = wvMax
+        self.update_wv()
+
+    def update_wv(self):
+        wv = self.source.wv
+        self.filter = (wv >= self.wvMin) & (wv <= self.wvMax)
+        self.wv = wv[self.filter]
+
+    def set_integration_time_ms(self, integration_time):
+        # recordings are played back as recorded at the first integration time set
+        if self.source.recorded_integration_time is None:
+            self.source.recorded_integration_time = integration_time
+        self.source.integration_time = integration_time
+
+    @property
+    def integration_time(self):
+        return self.source.integration_time
+
+    def read(self):
+        return self.source.scan()[self.filter]
+
+    def read_averaged(self, nscans, boxcar_width=None, roi=None, return_var=False, **kwargs):
+        acc = ScanAccumulator(self.wv.size, roi=roi, boxcar_width=boxcar_width)
+        for _ in range(nscans):
+            acc.add(self.read())
+        if return_var:
+            return acc.mean(), acc.var()
+        return acc.mean()
+
+    # state changes made by the operator in a real session
+    def light_on(self):
+        self.source.light = True
+
+    def light_off(self):
+        self.source.light = False
+
+    def sample_present(self):
+        self.source.sample = True
+
+    def sample_absent(self):
+        self.source.sample = False
+
+    def newSample(self, *args, **kwargs):
+        self.source.next_record()
+
+    def reference_cell(self):
+        self.source.cell = 'reference'
+
+    def sample_cell(self):
+        self.source.cell = 'sample'
+
+    def disconnect(self):
+        self.connected = False
+
+class ReplayBeamSwitch:
+    def __init__(self, source):
+        self.source = source
+        self.connected = True
+        print('  > Connected to replay BeamSwitch')
+
+    def reference_cell(self):
+        self.source.cell = 'reference'
+
+    def sample_cell(self):
+        self.source.cell = 'sample'
+
+    def toggle_cells(self):
+        self.source.cell = 'sample' if self.source.cell == 'reference' else 'reference'
+
+    def disconnect(self):
+        self.connected = False
+
+class ReplayTempProbe(Sampled):
+    def __init__(self, source, default=25.):
+        self.source = source
+        self.default = default
+        self.connected = True
+        print('  > Connected to replay TempProbe')
+
+    def read(self):
+        temp = self.source.record['temp']
+        return self.default if temp is None else temp
+
+    def disconnect(self):
+        self.stop_sampling()
+        self.connected = False
@@ -0,0 +1,133 @@
+import threading
+from collections import deque
+import numpy as np
+
+from carbspec.clock import get_clock
+
+class Sampler:
+    """
+    Poll an instrument in a background thread, keeping a timestamped ring buffer of readings.
+
+    Readings are stamped with the monotonic time of the clock (see
+    carbspec.clock). Errors raised while reading
+    are counted and kept in `last_error`, rather than stopping the thread.
+
+    The thread waits `interval` in real time, so sampling is not supported
+    with a SimulatedClock, whose time only passes when the session waits.
+
+    Parameters
+    ----------
+    read : callable
+        Returns a single reading.
+    interval : float
+        The time between readings in seconds.
+    maxlen : int
+        The maximum number of readings kept.
+    """
+    def __init__(self, read, interval=0.5, maxlen=1024):
+        self.read = read
+        self.interval = interval
+
+        self.buffer = deque(maxlen=maxlen)
+        self.errors = 0
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        if not get_clock().realtime:
+            raise RuntimeError('Background sampling is not supported with a simulated clock.')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                value = self.read()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+            else:
+                with self._lock:
+                    self.buffer.append((get_clock().monotonic(), value))
+            self._stop.wait(self.interval)
+
+    def readings(self):
+        """
+        Return the buffered (time, value) readings as two arrays.
+        """
+        with self._lock:
+            readings = list(self.buffer)
+        if len(readings) == 0:
+            return np.empty(0), np.empty(0)
+        t, v = zip(*readings)
+        return np.array(t), np.array(v, dtype=float)
+
+    def latest(self):
+        with self._lock:
+            if len(self.buffer) == 0:
+                return None
+            return self.buffer[-1][1]
+
+    def mean_between(self, t0, t1):
+        """
+        The mean and standard deviation of readings between two times.
+
+        If there are no readings in the window, the most recent reading
+        before t1 is used.
+
+        Parameters
+        ----------
+        t0, t1 : float
+            The start and end of the window, from the clock's monotonic().
+
+        Returns
+        -------
+        tuple : (mean, std, n), or None if no readings are available.
+        """
+        t, v = self.readings()
+
+        window = (t >= t0) & (t <= t1)
+        if window.any():
+            v = v[window]
+            std = v.std(ddof=1) if v.size > 1 else np.nan
+            return v.mean(), std, v.size
+
+        before = t <= t1
+        if before.any():
+            return v[before][-1], np.nan, 1
+        return None
+
+class Sampled:
+    """
+    Mixin giving an instrument with a `read` method background sampling.
+    """
+    sampler = None
+
+    def start_sampling(self, interval=0.5, maxlen=1024):
+        if self.sampler is None:
+            self.sampler = Sampler(self.read, interval=interval, maxlen=maxlen)
+        self.sampler.start()
+
+    def stop_sampling(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    @property
+    def sampling(self):
+        return self.sampler is not None and self.sampler.running
@@ -1,9 +1,12 @@
+from typing import Optional
 import numpy as np
 import seabreeze
 seabreeze.use('cseabreeze')
 from seabreeze.spectrometers import Spectrometer as sbSpectrometer
 from seabreeze.spectrometers import list_devices
 
+from .acquisition import ScanAccumulator, boxcar, roi_bounds
+
 def list_spectrometers():
     devices = list_devices()
     return [f'{s.model} : SN-{s.serial_number}' for s in devices]
@@ -23,6 +26,9 @@ class Spectrometer(sbSpectrometer):
         self.wvMin = -np.inf
         self.wvMax = np.inf
         
+        # (scans_to_average, boxcar half-width) currently set on the device
+        self._onboard = None
+        
         self.update_wv()
         
         print(f'  > Connected to {self.model} Spectrometer (S/N {self.serial_number}) using `seabreeze`')
@@ -43,17 +49,101 @@ class Spectrometer(sbSpectrometer):
         wv = self.wavelengths()
         self.filter = (wv > self.wvMin) & (wv < self.wvMax)
         self.wv = wv[self.filter]     
+        # the filter is contiguous, so can be applied as a view
+        self._filter_slice = slice(*roi_bounds(self.filter, wv.size)[0])
+        
+    @property
+    def spectrum_processing(self):
+        """
+        The on-board spectrum processing feature, or None if the device does not support it.
+        """
+        features = self.features.get('spectrum_processing', [])
+        return features[0] if features else None
+    
+    def _set_onboard_processing(self, nscans: int, boxcar_half_width: int):
+        if self._onboard != (nscans, boxcar_half_width):
+            self.spectrum_processing.set_scans_to_average(nscans)
+            self.spectrum_processing.set_boxcar_width(boxcar_half_width)
+            self._onboard = (nscans, boxcar_half_width)
         
     def read(self, 
              correct_dark_counts: bool = False, 
              correct_nonlinearity: bool = False
     ):
+        if self._onboard not in (None, (1, 0)):
+            self._set_onboard_processing(1, 0)
+        
         intensities = self.intensities(
             correct_dark_counts=correct_dark_counts,
             correct_nonlinearity=correct_nonlinearity
         )
                 
         return intensities[self.filter]
+    
+    def read_averaged(self,
+                      nscans: int,
+                      boxcar_width: Optional[int] = None,
+                      roi: Optional[np.ndarray] = None,
+                      onboard: bool = True,
+                      correct_dark_counts: bool = False,
+                      correct_nonlinearity: bool = False,
+                      return_var: bool = False
+    ):
+        """
+        Read the mean of `nscans` spectra, optionally boxcar filtered.
+
+        If the device supports on-board spectrum processing, averaging 
+        (and odd-width boxcar filtering) is done by the spectrometer, so 
+        only one spectrum is transferred. Otherwise, or if the variance is
+        wanted (e.g. to weight fits), scans are accumulated in place over
+        the region of interest.
+
+        Parameters
+        ----------
+        nscans : int
+            The number of scans to average.
+        boxcar_width : int
+            The width of the boxcar filter, in pixels.
+        roi : array-like of bool
+            Mask selecting a contiguous region of `self.wv` to return.
+        onboard : bool
+            Whether to use on-board processing, if available.
+        return_var : bool
+            If True, also return the variance of the averaged spectrum,
+            estimated from the scan-to-scan scatter. The scatter is not
+            available from on-board averaging, so scans are accumulated
+            on the host.
+
+        Returns
+        -------
+        array-like : the averaged spectrum in the roi, or (spectrum, variance)
+            if return_var is True.
+        """
+        kwargs = dict(correct_dark_counts=correct_dark_counts, correct_nonlinearity=correct_nonlinearity)
+        
+        if onboard and not return_var and self.spectrum_processing is not None:
+            # the device boxcar is specified as pixels either side of the centre
+            if boxcar_width is not None and boxcar_width % 2 == 1:
+                self._set_onboard_processing(nscans, boxcar_width // 2)
+                boxcar_width = None
+            else:
+                self._set_onboard_processing(nscans, 0)
+            
+            spec = boxcar(self.intensities(**kwargs)[self._filter_slice], boxcar_width)
+            if roi is not None:
+                spec = spec[roi]
+            return spec
+        
+        if self._onboard not in (None, (1, 0)):
+            self._set_onboard_processing(1, 0)
+        
+        acc = ScanAccumulator(self.wv.size, roi=roi, boxcar_width=boxcar_width)
+        for _ in range(nscans):
+            acc.add(self.intensities(**kwargs)[self._filter_slice])
+        
+        if return_var:
+            return acc.mean(), acc.var()
+        return acc.mean()
 
         
     def disconnect(self):
@@ -1,22 +1,61 @@
 import numpy as np
 # from pymodbus.client import ModbusSerialClient
 import minimalmodbus
+import threading
 import time
 
 from .instrument import Instrument
+from .sampler import Sampled
 
-class TempProbe(Instrument):
-    def __init__(self, averaging_period=2, m=1, c=0):
+class TempProbe(Instrument, Sampled):
+    def __init__(self, averaging_period=2, m=1, c=0, cache=None):
+        """
+        Connect to the IR temperature probe.
+
+        If `cache` (an instruments.discovery.DeviceCache) has the port the
+        probe was last found on, that port is tried first, with a short
+        timeout. If the probe does not respond there, the ports are scanned.
+        """
         super().__init__()
         
+        # serial access is shared with the background sampler
+        self._serial_lock = threading.Lock()
+        
         self._com_grep = 'OS-MINIUSB'
-        self._com_port = self.find_port()
         self._com_unit = 255  # communicates with any connected sensor
 
         self.m = m
         self.c = c
 
         self.instrument_type = 'IR Temperature Probe'
+        
+        cached = cache is not None and cache.port(self._com_grep) is not None
+        self._use_port(self.find_port(cache))
+        
+        try:
+            self.connect(timeout=1 if cached else None)
+            self.read()
+        except Exception:
+            if not cached:
+                raise
+            # the cached port is stale: scan the ports
+            print(f'  > No {self.instrument_type} on {self._com_port.device}, searching ports.')
+            if hasattr(self, 'sensor'):
+                self.sensor.serial.close()
+            cache.forget(self._com_grep)
+            self._use_port(self.find_port(cache))
+            self.connect()
+            self.read()
+        
+        self.sensor.serial.timeout = self._com_params['timeout']
+        
+        # the averaging period is kept by the sensor, so is often already set
+        if self.get_averaging_period() != averaging_period:
+            self.set_averaging_period(averaging_period)
+        self.averaging_period = self.get_averaging_period()
+    
+    def _use_port(self, port):
+        self._com_port = port
         self.instrument_info = f'{self._com_port.product} {self.instrument_type} (SN: {self._com_port.serial_number}) on {self._com_port.device}'
 
         self._com_params = {
@@ -28,17 +67,12 @@ class TempProbe(Instrument):
             "stopbit": 1,
             "bytesize": 8    
         }
-
-        self.connect()
-        self.set_averaging_period(averaging_period)
-        self.averaging_period = self.get_averaging_period()
-        self.read()
    
-    def connect(self):
+    def connect(self, timeout=None):
         self.sensor = minimalmodbus.Instrument(self._com_params['port'], self._com_unit)
         
         self.sensor.serial.baudrate = self._com_params['baudrate']
-        self.sensor.serial.timeout = self._com_params['timeout']
+        self.sensor.serial.timeout = self._com_params['timeout'] if timeout is None else timeout
         self.sensor.serial.parity = self._com_params['parity']
         self.sensor.serial.stopbits = self._com_params['stopbit']
         self.sensor.serial.bytesize = self._com_params['bytesize']
@@ -48,6 +82,7 @@ class TempProbe(Instrument):
         print(f'  > Connected to {self.instrument_info}')
 
     def disconnect(self):
+        self.stop_sampling()
         self.sensor.serial.close()
         self.connected = False
 
@@ -59,7 +94,9 @@ class TempProbe(Instrument):
         """
         self._check_connected()
         
-        return np.round(self.sensor.read_register(0x0B, number_of_decimals=1) * self.m + self.c, 2)
+        with self._serial_lock:
+            value = self.sensor.read_register(0x0B, number_of_decimals=1)
+        return np.round(value * self.m + self.c, 2)
 
     # sensor-specific functions
     def set_averaging_period(self, seconds=0.1):
@@ -67,15 +104,17 @@ class TempProbe(Instrument):
         Set sensor averaging period in seconds.
         """
         self._check_connected()
-        response = self.sensor.write_register(registeraddress=0x0A, value=seconds, number_of_decimals=1)
+        with self._serial_lock:
+            response = self.sensor.write_register(registeraddress=0x0A, value=seconds, number_of_decimals=1)
+            time.sleep(0.1)
         self.averaging_period = seconds
-        time.sleep(0.1)
     
     def get_averaging_period(self):
         """
         Returns sensor averaging period in seconds.
         """
-        return self.sensor.read_register(registeraddress=0x0A, number_of_decimals=1)
+        with self._serial_lock:
+            return self.sensor.read_register(registeraddress=0x0A, number_of_decimals=1)
     
 
 # class TempProbe(Instrument):
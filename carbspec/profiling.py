@@ -0,0 +1,269 @@
+"""
+Opt-in profiling of fits, pH calculations, saving and measurement sessions.
+
+Functions decorated with `profiled` (e.g. fit_spectrum, calc_pH,
+TA_from_pH, Spectrum.save and the main session methods) are profiled with
+cProfile while profiling is enabled, and optionally have their memory use
+traced with tracemalloc. Results are written to a directory, one set of
+files per stage:
+
+ - `{stage}.prof` : cProfile stats of every call, for pstats or snakeviz.
+ - `{stage}.txt` : the same stats as text, sorted by cumulative time.
+ - `{stage}-{n}.snapshot` : tracemalloc snapshots (with `memory=True`),
+   taken after the first call and every `snapshot_interval` calls after it.
+ - `calls.jsonl` : the duration and traced memory after every call.
+
+Enable profiling with the context manager
+
+    with carbspec.profiling.profile('profile_dir', memory=True):
+        session.measure_sample('sample1')
+
+or with `enable(...)` and `disable()`, or for a whole run by setting the
+CARBSPEC_PROFILE environment variable to the output directory (and
+CARBSPEC_PROFILE_MEMORY=1 to trace memory). Use `compare_snapshots` to
+find memory growth between two snapshots.
+
+cProfile only runs one profile at a time in each thread, so when a
+profiled function calls another (e.g. measure_sample calls calc_pH), the
+outer profile is paused and the inner call is profiled as its own stage.
+The inner stats are then added to the outer stage, so its profile still
+covers everything it called, but the cumulative times of the functions
+that were in progress when it was paused are incomplete (see the duration
+of each call in `calls.jsonl`). When profiling is disabled, a profiled
+function costs one extra function call.
+"""
+import os
+import json
+import time
+import atexit
+import cProfile
+import pstats
+import threading
+import tracemalloc
+import functools
+from contextlib import contextmanager
+
+_profiler = None
+
+class Profiler:
+    """
+    Collects the profiles of each stage. Made by `enable`.
+
+    Parameters
+    ----------
+    directory : str
+        Where profiles are written.
+    memory : bool
+        Whether to trace memory allocations with tracemalloc.
+    snapshot_interval : int
+        Take a tracemalloc snapshot of a stage after its first call, and
+        then every `snapshot_interval` calls.
+    frames : int
+        The number of frames tracemalloc stores for each allocation.
+    """
+    def __init__(self, directory, memory=False, snapshot_interval=50, frames=1):
+        self.directory = directory
+        self.memory = memory
+        self.snapshot_interval = snapshot_interval
+        self.frames = frames
+
+        self.stats = {}
+        self.calls = {}
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._log = open(os.path.join(directory, 'calls.jsonl'), 'a')
+
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._started_tracemalloc = True
+
+    def call(self, stage, function, *args, **kwargs):
+        """
+        Call `function`, profiling it as `stage`.
+        """
+        # the profiles of the profiled calls in progress in this thread, innermost last
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+
+        if parent is not None and parent.profile is not None:
+            parent.profile.disable()
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active in this thread
+            profile = None
+
+        frame = _Frame(profile)
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            if profile is not None:
+                profile.disable()
+            self._record(stage, duration, frame, outer=parent is None)
+            if parent is not None:
+                # the inner stats are part of the outer stage too
+                parent.children.append(frame)
+                if parent.profile is not None:
+                    parent.profile.enable()
+
+    def _record(self, stage, duration, frame, outer):
+        with self._lock:
+            n = self.calls.get(stage, 0)
+            self.calls[stage] = n + 1
+
+            for profile in frame.profiles():
+                if stage in self.stats:
+                    self.stats[stage].add(profile)
+                else:
+                    self.stats[stage] = pstats.Stats(profile)
+
+            entry = {'stage': stage, 'call': n, 'time': time.time(), 'duration': duration, 'profiled': frame.profile is not None}
+            if self.memory and tracemalloc.is_tracing():
+                entry['memory'], entry['peak_memory'] = tracemalloc.get_traced_memory()
+                if outer and n % self.snapshot_interval == 0:
+                    tracemalloc.take_snapshot().dump(self.path(f'{stage}-{n:06d}.snapshot'))
+                    entry['snapshot'] = True
+
+            self._log.write(json.dumps(entry) + '\n')
+            self._log.flush()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def dump(self):
+        """
+        Write the profiles collected so far.
+        """
+        with self._lock:
+            for stage, stats in self.stats.items():
+                stats.dump_stats(self.path(f'{stage}.prof'))
+                with open(self.path(f'{stage}.txt'), 'w') as f:
+                    pstats.Stats(self.path(f'{stage}.prof'), stream=f).sort_stats('cumulative').print_stats(50)
+
+    def close(self):
+        """
+        Write the profiles, and stop tracing memory.
+        """
+        self.dump()
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.take_snapshot().dump(self.path('final.snapshot'))
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        self._log.close()
+
+class _Frame:
+    """
+    A profiled call in progress: its profile, and those of the profiled calls it made.
+    """
+    __slots__ = ('profile', 'children')
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.children = []
+
+    def profiles(self):
+        if self.profile is not None:
+            yield self.profile
+        for child in self.children:
+            yield from child.profiles()
+
+def enable(directory, memory=False, snapshot_interval=50, frames=1):
+    """
+    Start profiling functions decorated with `profiled`.
+
+    Parameters are those of Profiler. If profiling is already enabled, it
+    is disabled (and written) first.
+
+    Returns
+    -------
+    Profiler
+    """
+    global _profiler
+    disable()
+    _profiler = Profiler(directory, memory=memory, snapshot_interval=snapshot_interval, frames=frames)
+    return _profiler
+
+def disable():
+    """
+    Stop profiling, and write the profiles.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.close()
+
+def is_enabled():
+    return _profiler is not None
+
+@contextmanager
+def profile(directory, memory=False, snapshot_interval=50, frames=1):
+    """
+    Profile within a `with` block. Parameters are those of Profiler.
+    """
+    profiler = enable(directory, memory=memory, snapshot_interval=snapshot_interval, frames=frames)
+    try:
+        yield profiler
+    finally:
+        if _profiler is profiler:
+            disable()
+
+def profiled(stage=None):
+    """
+    Decorate a function, so it is profiled while profiling is enabled.
+
+    Parameters
+    ----------
+    stage : str
+        The name its profiles are kept under. Defaults to the qualified
+        name of the function, e.g. 'pHMeasurementSession.measure_sample'.
+    """
+    def decorator(function):
+        name = function.__qualname__ if stage is None else stage
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return function(*args, **kwargs)
+            return profiler.call(name, function, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def compare_snapshots(old, new, key_type='lineno', limit=10):
+    """
+    The largest changes in memory allocated between two tracemalloc snapshots.
+
+    Parameters
+    ----------
+    old, new : str or tracemalloc.Snapshot
+        Snapshots, or the files they were written to.
+    key_type : str
+        How allocations are grouped: 'filename', 'lineno' or 'traceback'.
+    limit : int
+        The number of changes returned.
+
+    Returns
+    -------
+    list of tracemalloc.StatisticDiff : largest first.
+    """
+    if isinstance(old, str):
+        old = tracemalloc.Snapshot.load(old)
+    if isinstance(new, str):
+        new = tracemalloc.Snapshot.load(new)
+    return new.compare_to(old, key_type)[:limit]
+
+if os.environ.get('CARBSPEC_PROFILE'):
+    enable(os.environ['CARBSPEC_PROFILE'], memory=os.environ.get('CARBSPEC_PROFILE_MEMORY', '') not in ('', '0'))
+    atexit.register(disable)
@@ -0,0 +1,346 @@
+import threading
+import numpy as np
+import pandas as pd
+import uncertainties as un
+
+class ResultBuffer:
+    """
+    A columnar buffer for measurement results.
+
+    Results are stored in preallocated arrays that grow in chunks, so
+    adding a row does not copy the whole table. Numeric columns are held
+    as typed arrays, with a separate array of standard errors for columns
+    that carry uncertainties. A DataFrame is only built when requested.
+
+    Parameters
+    ----------
+    columns : dict
+        Column names and their kind. Kinds are:
+         - 'float' : a float64 array.
+         - 'ufloat' : float64 arrays of nominal values and standard errors.
+           Accepts floats or uncertainties.UFloat values.
+         - 'object' : any python object (e.g. sample names, spectra).
+    index_name : str
+        The name of the index in the DataFrame view.
+    chunk_size : int
+        The minimum number of rows added when the buffer grows.
+    """
+    kinds = ('float', 'ufloat', 'object')
+
+    def __init__(self, columns, index_name=None, chunk_size=256):
+        for c, kind in columns.items():
+            if kind not in self.kinds:
+                raise ValueError(f'Column {c} has unknown kind {kind}. Must be one of [' + ', '.join(self.kinds) + '].')
+
+        self.columns = dict(columns)
+        self.index_name = index_name
+        self.chunk_size = chunk_size
+
+        self._lock = threading.RLock()
+        self._n = 0
+        self._capacity = 0
+        self._keys = np.empty(0, dtype=object)
+        self._rows = {}
+        self._nom = {}
+        self._std = {}
+        self._obj = {}
+
+        for c, kind in self.columns.items():
+            self._allocate(c, kind)
+
+        self._grow(chunk_size)
+
+    def _allocate(self, column, kind):
+        if kind == 'object':
+            self._obj[column] = np.full(self._capacity, None, dtype=object)
+        else:
+            self._nom[column] = np.full(self._capacity, np.nan)
+            if kind == 'ufloat':
+                self._std[column] = np.full(self._capacity, np.nan)
+
+    def _grow(self, n=None):
+        if n is None:
+            n = max(self._capacity, self.chunk_size)
+
+        def extend(a, fill):
+            new = np.full(self._capacity + n, fill, dtype=a.dtype)
+            new[:self._n] = a[:self._n]
+            return new
+
+        self._keys = extend(self._keys, None)
+        for d, fill in [(self._nom, np.nan), (self._std, np.nan), (self._obj, None)]:
+            for c in d:
+                d[c] = extend(d[c], fill)
+
+        self._capacity += n
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    @property
+    def index(self):
+        return self._keys[:self._n]
+
+    def _set(self, i, column, value):
+        kind = self.columns[column]
+        if kind == 'object':
+            self._obj[column][i] = value
+        elif kind == 'ufloat' and isinstance(value, un.UFloat):
+            self._nom[column][i] = value.nominal_value
+            self._std[column][i] = value.std_dev
+        elif kind == 'ufloat' and isinstance(value, str):
+            self._set(i, column, un.ufloat_fromstr(value))
+        else:
+            self._nom[column][i] = np.nan if value is None else float(value)
+            if kind == 'ufloat':
+                self._std[column][i] = np.nan
+
+    def add_column(self, column, kind='object'):
+        """
+        Add a new, empty column to the buffer.
+        """
+        with self._lock:
+            if column in self.columns:
+                return
+            if kind not in self.kinds:
+                raise ValueError(f'Unknown column kind {kind}')
+
+            self.columns[column] = kind
+            self._allocate(column, kind)
+
+    def append(self, key, **values):
+        """
+        Add a new row.
+
+        Parameters
+        ----------
+        key : hashable
+            The index value of the row (e.g. timestamp).
+        **values
+            Column values. Columns not given are left empty.
+
+        Returns
+        -------
+        int : the row number
+
+        Raises
+        ------
+        KeyError : if there is already a row with this key. Use `update`
+        to change it.
+        """
+        with self._lock:
+            if key in self._rows:
+                raise KeyError(f'ResultBuffer already has a row {key!r}. Use update() to change it.')
+
+            if self._n == self._capacity:
+                self._grow()
+
+            i = self._n
+            self._keys[i] = key
+            self._rows[key] = i
+            self._n += 1
+
+            for c, v in values.items():
+                self._set(i, c, v)
+
+            return i
+
+    def update(self, key, **values):
+        """
+        Update the values in an existing row.
+
+        Returns
+        -------
+        int : the row number
+        """
+        with self._lock:
+            i = self._rows[key]
+            for c, v in values.items():
+                self._set(i, c, v)
+            return i
+
+    def extend(self, df):
+        """
+        Add the rows of a DataFrame, keyed by its index.
+
+        Columns that are not in the buffer are added as 'object' columns.
+        Rows whose key is already in the buffer (or repeated in `df`)
+        update that row, so that the last value is kept.
+        """
+        with self._lock:
+            for c in df.columns:
+                self.add_column(c)
+
+            for key, r in zip(df.index, df.to_dict('records')):
+                if key in self._rows:
+                    self.update(key, **r)
+                else:
+                    self.append(key, **r)
+
+    def clear(self):
+        """
+        Remove all rows.
+        """
+        with self._lock:
+            self._n = 0
+            self._rows.clear()
+            self._keys[:] = None
+            for d, fill in [(self._nom, np.nan), (self._std, np.nan), (self._obj, None)]:
+                for c in d:
+                    d[c][:] = fill
+
+    def pop(self):
+        """
+        Remove the last row, and return its values.
+        """
+        with self._lock:
+            if self._n == 0:
+                raise IndexError('pop from empty ResultBuffer')
+
+            row = self.row(self._keys[self._n - 1])
+
+            self._n -= 1
+            key = self._keys[self._n]
+            del self._rows[key]
+            self._keys[self._n] = None
+
+            for d, fill in [(self._nom, np.nan), (self._std, np.nan), (self._obj, None)]:
+                for c in d:
+                    d[c][self._n] = fill
+
+            return row
+
+    def _value(self, i, column):
+        kind = self.columns[column]
+        if kind == 'object':
+            return self._obj[column][i]
+
+        nom = self._nom[column][i]
+        if kind == 'ufloat' and not np.isnan(self._std[column][i]):
+            return un.ufloat(nom, self._std[column][i])
+        return nom
+
+    def value(self, i, column):
+        """
+        Return the value in row number `i` of a column.
+        """
+        with self._lock:
+            if not -self._n <= i < self._n:
+                raise IndexError(f'row {i} out of range for ResultBuffer of length {self._n}')
+            return self._value(i % self._n, column)
+
+    def row(self, key):
+        """
+        Return the values of a single row as a dict.
+        """
+        with self._lock:
+            i = self._rows[key]
+            return {c: self._value(i, c) for c in self.columns}
+
+    def nominal_values(self, column):
+        """
+        Return a read-only view of the nominal values of a numeric column.
+        """
+        v = self._nom[column][:self._n]
+        v.flags.writeable = False
+        return v
+
+    def std_devs(self, column):
+        """
+        Return a read-only view of the standard errors of a ufloat column.
+        """
+        v = self._std[column][:self._n]
+        v.flags.writeable = False
+        return v
+
+    def to_dataframe(self, start=None, stop=None, uncertainties=True):
+        """
+        Build a DataFrame from the buffer.
+
+        Parameters
+        ----------
+        start, stop : int
+            The rows to include, as in a slice.
+        uncertainties : bool
+            If True, ufloat columns contain uncertainties.UFloat values
+            where a standard error is present. If False, the standard
+            errors are returned in separate '{column}_std' columns.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        with self._lock:
+            rows = slice(*slice(start, stop).indices(self._n))
+
+            data = {}
+            for c, kind in self.columns.items():
+                if kind == 'object':
+                    data[c] = self._obj[c][rows]
+                elif kind == 'float':
+                    data[c] = self._nom[c][rows]
+                else:
+                    nom = self._nom[c][rows]
+                    std = self._std[c][rows]
+                    if not uncertainties:
+                        data[c] = nom
+                        data[c + '_std'] = std
+                    elif np.isnan(std).all():
+                        data[c] = nom
+                    else:
+                        data[c] = np.array([n if np.isnan(s) else un.ufloat(n, s) for n, s in zip(nom, std)], dtype=object)
+
+            index = pd.Index(list(self._keys[rows]), name=self.index_name)
+
+            return pd.DataFrame(data, index=index)
+
+    def to_csv(self, path_or_buf, chunk_size=1024, uncertainties=False, **kwargs):
+        """
+        Write the buffer to a csv file, building at most `chunk_size` rows of DataFrame at a time.
+
+        Parameters
+        ----------
+        path_or_buf : str or file-like
+            Where to write the csv.
+        chunk_size : int
+            The number of rows converted and written at once.
+        uncertainties : bool
+            Passed to to_dataframe. By default, standard errors are
+            written in separate '{column}_std' columns.
+        **kwargs
+            Passed to pandas.DataFrame.to_csv.
+        """
+        if isinstance(path_or_buf, str):
+            with open(path_or_buf, 'w', newline='') as f:
+                return self.to_csv(f, chunk_size=chunk_size, uncertainties=uncertainties, **kwargs)
+
+        with self._lock:
+            n = self._n
+            for start in range(0, max(n, 1), chunk_size):
+                chunk = self.to_dataframe(start, min(start + chunk_size, n), uncertainties=uncertainties)
+                chunk.to_csv(path_or_buf, header=start == 0, **kwargs)
+
+    @classmethod
+    def from_dataframe(cls, df, columns, chunk_size=256):
+        """
+        Create a buffer containing the rows of a DataFrame.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The data. The index is used as row keys.
+        columns : dict
+            Column names and kinds (see ResultBuffer). Columns in df
+            that are not in `columns` are stored as 'object'.
+        """
+        columns = dict(columns)
+        for c in df.columns:
+            if c not in columns:
+                columns[c] = 'object'
+
+        buffer = cls(columns, index_name=df.index.name, chunk_size=max(chunk_size, len(df)))
+        buffer.extend(df)
+        return buffer
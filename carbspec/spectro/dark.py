@@ -0,0 +1,108 @@
+import numpy as np
+
+class DarkModel:
+    """
+    A per-pixel linear model of dark counts with integration time.
+
+    Equation: dark = offset + rate * integration_time
+
+    Parameters
+    ----------
+    wv : array-like
+        The wavelength of each pixel.
+    offset, rate : array-like
+        The dark counts at zero integration time, and their rate of
+        increase per ms of integration time.
+    var_offset, var_rate, cov : array-like
+        The variances of offset and rate, and their covariance. Optional.
+    """
+    def __init__(self, wv, offset, rate, var_offset=None, var_rate=None, cov=None):
+        self.wv = np.asanyarray(wv)
+        self.offset = np.asanyarray(offset)
+        self.rate = np.asanyarray(rate)
+        self.var_offset = var_offset
+        self.var_rate = var_rate
+        self.cov = cov
+
+    @classmethod
+    def fit(cls, wv, integration_times, darks, dark_vars=None):
+        """
+        Fit the model to darks collected at two or more integration times.
+
+        Parameters
+        ----------
+        wv : array-like
+            The wavelength of each pixel.
+        integration_times : array-like
+            The integration time (ms) of each dark, shape (n,).
+        darks : array-like
+            The dark spectra, shape (n, npix).
+        dark_vars : array-like
+            The variance of each dark spectrum, shape (n, npix). If given,
+            the fit is weighted by these. Otherwise, parameter variances are
+            estimated from the residuals, which requires at least three darks.
+
+        Returns
+        -------
+        DarkModel
+        """
+        t = np.asanyarray(integration_times, dtype=float).reshape(-1, 1)
+        y = np.asanyarray(darks, dtype=float)
+
+        if np.unique(t).size < 2:
+            raise ValueError('Darks must be collected at two or more different integration times.')
+
+        if dark_vars is None or any(v is None for v in dark_vars):
+            w = np.ones_like(y)
+        else:
+            w = 1 / np.asanyarray(dark_vars, dtype=float)
+
+        # weighted least squares for each pixel
+        S = w.sum(0)
+        St = (w * t).sum(0)
+        Stt = (w * t**2).sum(0)
+        Sy = (w * y).sum(0)
+        Sty = (w * t * y).sum(0)
+        D = S * Stt - St**2
+
+        rate = (S * Sty - St * Sy) / D
+        offset = (Stt * Sy - St * Sty) / D
+
+        var_offset, var_rate, cov = Stt / D, S / D, -St / D
+        if dark_vars is None or any(v is None for v in dark_vars):
+            n = t.size
+            if n > 2:
+                s_sq = ((y - offset - rate * t)**2).sum(0) / (n - 2)
+                var_offset, var_rate, cov = var_offset * s_sq, var_rate * s_sq, cov * s_sq
+            else:
+                var_offset, var_rate, cov = None, None, None
+
+        return cls(wv, offset, rate, var_offset, var_rate, cov)
+
+    def predict(self, integration_time):
+        """
+        The dark spectrum at an integration time (ms).
+        """
+        return self.offset + self.rate * integration_time
+
+    def predict_var(self, integration_time):
+        """
+        The variance of the predicted dark spectrum, or None if the model has no variances.
+        """
+        if self.var_offset is None:
+            return None
+        return self.var_offset + integration_time**2 * self.var_rate + 2 * integration_time * self.cov
+
+    def save(self, file):
+        arrays = {'wv': self.wv, 'offset': self.offset, 'rate': self.rate}
+        if self.var_offset is not None:
+            arrays.update(var_offset=self.var_offset, var_rate=self.var_rate, cov=self.cov)
+        np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as f:
+            return cls(**{k: f[k] for k in f.files})
+
+    def __repr__(self):
+        return f'DarkModel of {self.wv.size} pixels from {self.wv.min():.0f}-{self.wv.max():.0f} nm'
@@ -0,0 +1,81 @@
+import numpy as np
+
+class DriftMonitor:
+    """
+    Track changes in the reference channel relative to the setup.
+
+    Each reference spectrum is divided by the setup reference, and normalised
+    by its median so that changes in overall intensity (which cancel in
+    absorbance) are ignored. An exponentially weighted moving average of this
+    ratio is kept for each pixel. Drift is the RMS deviation of the average
+    from 1, corrected for measurement noise where variances are available,
+    expressed in absorbance units. The scale factor is flagged as stale when
+    drift exceeds `tolerance`.
+
+    Parameters
+    ----------
+    reference : array-like
+        The dark-corrected reference channel from the setup.
+    reference_var : array-like
+        The variance of the setup reference. Optional.
+    tolerance : float
+        The acceptable absorbance bias from changes in the reference.
+    alpha : float
+        The weight of each new spectrum in the moving average.
+    """
+    def __init__(self, reference, reference_var=None, tolerance=1e-3, alpha=0.2):
+        self.reference = np.asanyarray(reference, dtype=float)
+        self.reference_var = reference_var
+        self.tolerance = tolerance
+        self.alpha = alpha
+
+        self.n = 0
+        self.ratio = None
+        self.ratio_var = None
+        self.drift = 0.
+        self.scale = 1.
+        self.history = []
+
+    @property
+    def stale(self):
+        return self.drift > self.tolerance
+
+    def update(self, reference, reference_var=None):
+        """
+        Add a reference spectrum.
+
+        Returns
+        -------
+        float : the current drift, in absorbance units.
+        """
+        reference = np.asanyarray(reference, dtype=float)
+        ratio = reference / self.reference
+
+        self.scale = np.median(ratio)
+        ratio = ratio / self.scale
+
+        if reference_var is not None and self.reference_var is not None:
+            var = ratio**2 * (reference_var / reference**2 + self.reference_var / self.reference**2)
+        else:
+            var = None
+
+        if self.ratio is None:
+            self.ratio = ratio
+            self.ratio_var = var
+        else:
+            self.ratio = (1 - self.alpha) * self.ratio + self.alpha * ratio
+            if var is not None and self.ratio_var is not None:
+                self.ratio_var = (1 - self.alpha)**2 * self.ratio_var + self.alpha**2 * var
+            else:
+                self.ratio_var = None
+        self.n += 1
+
+        msd = np.mean((self.ratio - 1)**2)
+        if self.ratio_var is not None:
+            # remove the expected contribution of measurement noise
+            msd = max(msd - np.mean(self.ratio_var), 0)
+
+        self.drift = np.sqrt(msd) / np.log(10)
+        self.history.append(self.drift)
+
+        return self.drift
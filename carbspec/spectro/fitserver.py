@@ -0,0 +1,551 @@
+"""
+A local fit server, which keeps a FitPlan warm for each dye and wavelength grid.
+
+Clients (sessions, the GUI, notebooks) send absorbance spectra over a Unix
+socket or localhost TCP, and receive the fitted parameters, their covariance
+and K. Run a server with
+
+    python -m carbspec.spectro.fitserver [address] [--workers N]
+
+where address is 'host:port' or the path of a Unix socket, and use it with
+FitClient, e.g. calc_pH(spectrum, client=FitClient(address)).
+
+Messages are length-prefixed binary frames. A request is a header
+(magic, flags, dye name length, temperature, salinity, number of pixels)
+followed by the dye name and float64 arrays of wavelength, absorbance, and
+optionally sigma and p0. A response is a header (magic, status) followed by
+p (5), cov (5 x 5) and K as float64, or a UTF-8 error message.
+"""
+import os
+import sys
+import time
+import queue
+import stat
+import socket
+import struct
+import hashlib
+import threading
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+
+from carbspec.dye import K_handler
+from carbspec.dye.splines import spline_handler
+from carbspec.spectro.fitting import FitPlan
+
+REQUEST = b'CSFQ'
+RESPONSE = b'CSFA'
+
+HAS_SIGMA = 1
+HAS_P0 = 2
+
+OK = 0
+ERROR = 1
+
+_length = struct.Struct('<I')
+# the largest frame accepted (bytes), so a bad length prefix can't exhaust memory
+MAX_FRAME = 64 * 2**20
+_request_header = struct.Struct('<4sBHddI')
+_response_header = struct.Struct('<4sB')
+
+class FitServerError(ValueError):
+    """
+    A fit that failed on the server, or a message that is not a fit request
+    or response. It is a ValueError, as is a failed local fit.
+    """
+
+# framing
+def encode_request(wv, absorbance, dye, temp, sal, sigma=None, p0=None):
+    wv = np.ascontiguousarray(wv, dtype='<f8')
+    absorbance = np.ascontiguousarray(absorbance, dtype='<f8')
+    if absorbance.shape != wv.shape:
+        raise ValueError('wv and absorbance must be the same shape.')
+
+    flags = 0
+    arrays = [wv, absorbance]
+    if sigma is not None:
+        flags |= HAS_SIGMA
+        arrays.append(np.ascontiguousarray(np.broadcast_to(sigma, wv.shape), dtype='<f8'))
+    if p0 is not None:
+        flags |= HAS_P0
+        arrays.append(np.ascontiguousarray(p0, dtype='<f8').reshape(5))
+
+    name = dye.encode()
+    return b''.join([_request_header.pack(REQUEST, flags, len(name), temp, sal, wv.size), name] + [a.tobytes() for a in arrays])
+
+def decode_request(body):
+    magic, flags, nname, temp, sal, npix = _request_header.unpack_from(body)
+    if magic != REQUEST:
+        raise FitServerError('Not a fit request.')
+
+    offset = _request_header.size
+    dye = body[offset:offset + nname].decode()
+    offset += nname
+
+    def take(n):
+        nonlocal offset
+        a = np.frombuffer(body, dtype='<f8', count=n, offset=offset)
+        offset += 8 * n
+        return a
+
+    request = {'dye': dye, 'temp': temp, 'sal': sal, 'wv': take(npix), 'absorbance': take(npix), 'sigma': None, 'p0': None}
+    if flags & HAS_SIGMA:
+        request['sigma'] = take(npix)
+    if flags & HAS_P0:
+        request['p0'] = take(5)
+    return request
+
+def encode_response(p, cov, K):
+    values = np.concatenate([np.ravel(p), np.ravel(cov), [K]]).astype('<f8')
+    return _response_header.pack(RESPONSE, OK) + values.tobytes()
+
+def encode_error(message):
+    return _response_header.pack(RESPONSE, ERROR) + str(message).encode()
+
+def decode_response(body):
+    magic, status = _response_header.unpack_from(body)
+    if magic != RESPONSE:
+        raise FitServerError('Not a fit response.')
+    if status != OK:
+        raise FitServerError(body[_response_header.size:].decode())
+
+    values = np.frombuffer(body, dtype='<f8', offset=_response_header.size)
+    return values[:5].copy(), values[5:30].reshape(5, 5).copy(), values[30]
+
+def send_frame(sock, body):
+    sock.sendall(_length.pack(len(body)) + body)
+
+def recv_exactly(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while n > 0:
+        k = sock.recv_into(view[-n:], n)
+        if k == 0:
+            raise ConnectionError('Connection closed.')
+        n -= k
+    return bytes(buf)
+
+def recv_frame(sock):
+    n, = _length.unpack(recv_exactly(sock, _length.size))
+    if n > MAX_FRAME:
+        # the rest of the stream can't be trusted
+        raise ConnectionError(f'Frame of {n} bytes is larger than the limit of {MAX_FRAME}.')
+    return recv_exactly(sock, n)
+
+def parse_address(address):
+    """
+    Convert 'host:port' to a (host, port) tuple. Anything else is a Unix socket path.
+    """
+    if isinstance(address, str) and ':' in address and not os.path.sep in address:
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return address
+
+def get_plan(plans, dye, wv, max_plans=16):
+    """
+    Return the key and FitPlan for a dye and wavelength grid from an LRU dict of plans, creating it if needed.
+    """
+    key = (dye, hashlib.blake2b(wv.tobytes(), digest_size=16).digest())
+    if key in plans:
+        plans.move_to_end(key)
+    else:
+        aspl, bspl = spline_handler(dye)
+        plans[key] = FitPlan(wv.copy(), aspl, bspl)
+        if len(plans) > max_plans:
+            plans.popitem(last=False)
+    return key, plans[key]
+
+def fit_request(plan, request):
+    """
+    Fit a decoded request with a plan, and return the encoded response.
+    """
+    try:
+        p, cov = plan.fit(request['absorbance'], sigma=request['sigma'], p0=request['p0'])
+        K = K_handler(request['dye'], request['temp'], request['sal'])
+        return encode_response(p, cov, K)
+    except Exception as e:
+        return encode_error(e)
+
+# plans of a worker process
+_worker_plans = OrderedDict()
+
+def _fit_in_worker(requests):
+    responses = []
+    for r in requests:
+        try:
+            _, plan = get_plan(_worker_plans, r['dye'], r['wv'])
+        except Exception as e:
+            responses.append(encode_error(e))
+            continue
+        responses.append(fit_request(plan, r))
+    return responses
+
+class _Request:
+    def __init__(self, request):
+        self.request = request
+        self.response = None
+        self.done = threading.Event()
+
+class _Handler(socketserver.BaseRequestHandler):
+    def setup(self):
+        with self.server.fit_server._lock:
+            self.server.fit_server._connections.add(self.request)
+
+    def finish(self):
+        with self.server.fit_server._lock:
+            self.server.fit_server._connections.discard(self.request)
+
+    def handle(self):
+        server = self.server.fit_server
+        while True:
+            try:
+                body = recv_frame(self.request)
+            except ConnectionError:
+                return
+            try:
+                pending = _Request(decode_request(body))
+            except Exception as e:
+                send_frame(self.request, encode_error(e))
+                continue
+            server.queue.put(pending)
+            pending.done.wait()
+            send_frame(self.request, pending.response)
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+class FitServer:
+    """
+    Serve spectrum fits to local clients.
+
+    A FitPlan is kept for each (dye, wavelength grid), so splines and their
+    derivatives are loaded once rather than for every fit. Requests from all
+    connections are queued, and a dispatcher takes all waiting requests at
+    once and fits them grouped by plan. With one worker, fits run on the
+    dispatcher thread. With more, each group is split between a pool of
+    worker processes, which keep their own plans, so that concurrent clients
+    are fitted in parallel.
+
+    Parameters
+    ----------
+    address : tuple or str
+        (host, port) for TCP, or the path of a Unix socket. Port 0 picks a
+        free port (see `address`).
+    max_plans : int
+        The number of plans kept warm.
+    workers : int
+        The number of fitting processes.
+    """
+    def __init__(self, address=('127.0.0.1', 0), max_plans=16, workers=1):
+        address = parse_address(address)
+        if isinstance(address, str):
+            if os.path.lexists(address):
+                # a socket left by a server that did not stop cleanly
+                if not stat.S_ISSOCK(os.lstat(address).st_mode):
+                    raise FileExistsError(f'{address} exists, and is not a socket.')
+                os.remove(address)
+            self.server = _UnixServer(address, _Handler)
+        else:
+            self.server = _TCPServer(address, _Handler)
+        self.server.fit_server = self
+
+        self.max_plans = max_plans
+        self.plans = OrderedDict()
+        self.queue = queue.SimpleQueue()
+
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(workers) if workers > 1 else None
+
+        self.fits = 0
+        self.batches = 0
+
+        self._threads = []
+        # open client connections, closed when the server stops
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def plan(self, dye, wv):
+        return get_plan(self.plans, dye, wv, self.max_plans)
+
+    def process(self, pending):
+        """
+        Fit a batch of requests, grouped by plan.
+
+        Every request is answered, with an error if the batch fails (e.g.
+        because a worker process died).
+        """
+        try:
+            groups = {}
+            for p in pending:
+                r = p.request
+                try:
+                    key, plan = self.plan(r['dye'], r['wv'])
+                except Exception as e:
+                    p.response = encode_error(e)
+                    continue
+                groups.setdefault(key, (plan, []))[1].append(p)
+
+            for plan, group in groups.values():
+                if self.pool is None:
+                    for p in group:
+                        p.response = fit_request(plan, p.request)
+                else:
+                    chunks = [group[i::self.workers] for i in range(min(self.workers, len(group)))]
+                    futures = [self.pool.submit(_fit_in_worker, [p.request for p in chunk]) for chunk in chunks]
+                    for chunk, f in zip(chunks, futures):
+                        for p, response in zip(chunk, f.result()):
+                            p.response = response
+                self.fits += sum(p.response[4] == OK for p in group)
+        except Exception as e:
+            print(f'  > Fit server error: {e!r}')
+            if isinstance(e, BrokenProcessPool):
+                # a worker died: start a new pool for the next batch
+                self.pool.shutdown(wait=False)
+                self.pool = ProcessPoolExecutor(self.workers)
+            for p in pending:
+                if p.response is None:
+                    p.response = encode_error(e)
+        finally:
+            self.batches += 1
+            for p in pending:
+                if p.response is None:
+                    p.response = encode_error('The fit server failed to process the request.')
+                p.done.set()
+
+    def _work(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            pending = [first]
+            stop = False
+            while True:
+                try:
+                    p = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if p is None:
+                    stop = True
+                    break
+                pending.append(p)
+            self.process(pending)
+            if stop:
+                return
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever, daemon=True, name='carbspec-fitserver'),
+            threading.Thread(target=self._work, daemon=True, name='carbspec-fitworker'),
+        ]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        # so that clients see the server has gone, rather than waiting for replies
+        with self._lock:
+            for sock in self._connections:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.queue.put(None)
+        for t in self._threads:
+            t.join()
+        if self.pool is not None:
+            self.pool.shutdown()
+        if isinstance(self.address, str) and os.path.exists(self.address) and stat.S_ISSOCK(os.lstat(self.address).st_mode):
+            os.remove(self.address)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+class FitClient:
+    """
+    Fit spectra on a FitServer.
+
+    A client holds one connection, and may be shared between threads.
+
+    Parameters
+    ----------
+    address : tuple or str
+        The address of the server: (host, port), 'host:port' or the path of a Unix socket.
+    timeout : float
+        Seconds to wait for a fit.
+    """
+    def __init__(self, address, timeout=30):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.sock = None
+        self._connect()
+
+    def _connect(self):
+        family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except BaseException:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def _discard(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def fit(self, wv, absorbance, dye, temp, sal, sigma=None, p0=None):
+        """
+        Fit an absorbance spectrum.
+
+        If anything goes wrong after the request is sent (e.g. a timeout),
+        the reply may still arrive later, so the connection is closed rather
+        than reused, and the next fit reconnects.
+
+        Returns
+        -------
+        tuple : (p, cov, K), where p are the (a, b, bkg, c, m) parameters.
+        """
+        body = encode_request(wv, absorbance, dye, temp, sal, sigma=sigma, p0=p0)
+        with self._lock:
+            if self.sock is None:
+                self._connect()
+            try:
+                send_frame(self.sock, body)
+                return decode_response(recv_frame(self.sock))
+            except BaseException:
+                self._discard()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def benchmark(address=None, clients=(1, 2, 4, 8), requests=20, dye='MCP_Cam1', npix=1000, workers=None):
+    """
+    Measure fit throughput with concurrent clients, on a server and in-process.
+
+    Each client is a thread fitting `requests` synthetic spectra, either
+    through its own FitClient, or in-process with unmix_spectra (as calc_pH
+    does). If no address is given, a server with `workers` fitting processes
+    (default: one per CPU) is started in a separate process.
+
+    Returns
+    -------
+    pandas.DataFrame : fits per second for each number of clients.
+    """
+    import subprocess
+    import pandas as pd
+    from carbspec.spectro.mixture import make_mix_spectra, unmix_spectra
+
+    proc = None
+    if address is None:
+        address = ('127.0.0.1', _free_port())
+        workers = os.cpu_count() if workers is None else workers
+        proc = subprocess.Popen([sys.executable, '-m', 'carbspec.spectro.fitserver', f'{address[0]}:{address[1]}', '--workers', str(workers)])
+        _wait_for(address)
+
+    rng = np.random.default_rng(0)
+    wv = np.linspace(400, 700, npix)
+    mixture = make_mix_spectra(dye)
+    spectra = [mixture(wv, a, a * f, 0.01, 0.2, 1.) + rng.normal(0, 0.002, npix) for a, f in zip(rng.uniform(0.5, 1, requests), rng.uniform(0.3, 1.5, requests))]
+
+    def remote():
+        with FitClient(address) as client:
+            for s in spectra:
+                client.fit(wv, s, dye, 25., 35.)
+
+    def local():
+        for s in spectra:
+            unmix_spectra(wv, s, dye)
+
+    def throughput(task, n):
+        threads = [threading.Thread(target=task) for _ in range(n)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return n * requests / (time.perf_counter() - start)
+
+    try:
+        # warm the server's plan
+        with FitClient(address) as client:
+            client.fit(wv, spectra[0], dye, 25., 35.)
+
+        results = pd.DataFrame(
+            {'server': [throughput(remote, n) for n in clients],
+             'in-process': [throughput(local, n) for n in clients]},
+            index=pd.Index(clients, name='clients'))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    print('Fits per second:')
+    print(results.round(1))
+    return results
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _wait_for(address, timeout=30):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            FitClient(address).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise FitServerError(f'No fit server at {address}')
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve carbspec spectrum fits to local clients.')
+    parser.add_argument('address', nargs='?', default='127.0.0.1:8765', help="'host:port' or the path of a Unix socket.")
+    parser.add_argument('--workers', type=int, default=1, help='The number of fitting processes.')
+    parser.add_argument('--benchmark', action='store_true', help='Measure throughput with concurrent clients, and exit.')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+    else:
+        server = FitServer(args.address, workers=args.workers)
+        print(f'  > Serving fits on {server.address}')
+        server.serve_forever()
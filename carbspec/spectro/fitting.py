@@ -1,6 +1,8 @@
 import numpy as np
 from scipy.optimize import least_squares
 
+from carbspec.profiling import profiled
+
 def Jacobian(x, wv, aspl, bspl, daspl, dbspl, sigma, **kwargs):
     """
     Calculate the jacobian for the minimisation function.
@@ -80,6 +82,7 @@ def guess_p0(wv, Abs, aspl, bspl):
 
     return astart, bstart, B0start, 0, 1
 
+@profiled()
 def fit_spectrum(wv, Abs, aspl, bspl, sigma=np.array(1), p0=None,
                  bounds=((0, 0, -np.inf, -20, 0.98), (np.inf, np.inf, np.inf, 20, 1.02))):
     """
@@ -105,9 +108,46 @@ def fit_spectrum(wv, Abs, aspl, bspl, sigma=np.array(1), p0=None,
     =======
     p, cov  : the optimal values for (a, b, B0, c, m) and their covariance matrix
     """
-    if p0 is None:
-        p0 = guess_p0(wv, Abs, aspl, bspl)
-    fit = least_squares(obj_fn, p0, jac=Jacobian, 
-                        kwargs=dict(wv=wv, Abs=Abs, sigma=sigma, aspl=aspl, bspl=bspl, daspl=aspl.derivative(), dbspl=bspl.derivative()), 
-                        bounds=bounds, method='trf', x_scale='jac', loss='soft_l1', tr_solver='exact')
-    return fit.x, jac_2_cov(fit)
+    return FitPlan(wv, aspl, bspl, bounds=bounds).fit(Abs, sigma=sigma, p0=p0)
+
+class FitPlan:
+    """
+    Everything needed to fit spectra on one wavelength grid with one dye, prepared once.
+
+    Holds the end-member splines and their derivatives, so that these are
+    not rebuilt for every fit.
+
+    Parameters
+    ==========
+    wv : array-like
+        The wavelength grid of the spectra.
+    aspl, bspl : UnivariateSpline
+        Spline objects that produce the acid (aspl) or base (aspl)
+        molal absorption given a wavelength.
+    bounds : two-tuple
+        Bounds for parameters (a, b, B0, c, m) used in fitting.
+    """
+    def __init__(self, wv, aspl, bspl, bounds=((0, 0, -np.inf, -20, 0.98), (np.inf, np.inf, np.inf, 20, 1.02))):
+        self.wv = np.asanyarray(wv, dtype=float)
+        self.aspl = aspl
+        self.bspl = bspl
+        self.daspl = aspl.derivative()
+        self.dbspl = bspl.derivative()
+        self.bounds = bounds
+
+    def fit(self, Abs, sigma=np.array(1), p0=None):
+        """
+        Fit a spectrum.
+
+        Returns
+        =======
+        p, cov  : the optimal values for (a, b, B0, c, m) and their covariance matrix
+        """
+        if sigma is None:
+            sigma = np.array(1)
+        if p0 is None:
+            p0 = guess_p0(self.wv, Abs, self.aspl, self.bspl)
+        fit = least_squares(obj_fn, p0, jac=Jacobian, 
+                            kwargs=dict(wv=self.wv, Abs=Abs, sigma=sigma, aspl=self.aspl, bspl=self.bspl, daspl=self.daspl, dbspl=self.dbspl), 
+                            bounds=self.bounds, method='trf', x_scale='jac', loss='soft_l1', tr_solver='exact')
+        return fit.x, jac_2_cov(fit)
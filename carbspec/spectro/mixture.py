@@ -109,7 +109,7 @@ def make_mix_components(dye):
 
     return mix_components
 
-def unmix_spectra(wavelength, absorption, dye, sigma=None):
+def unmix_spectra(wavelength, absorption, dye, sigma=None, p0=None):
     """
     Determine the relative contribution of acid and base absorption to a measured spectrum.
     
@@ -132,6 +132,9 @@ def unmix_spectra(wavelength, absorption, dye, sigma=None):
         pKdyes.
         If array-like, an array the same length as data to use as 
         weights (sigma: larger = less weight).
+    p0 : array-like
+        Starting values for (a, b, bkg, c, m), e.g. from a previous fit of
+        a similar spectrum. If None, these are estimated from the data.
 
     Returns
     -------
@@ -146,7 +149,7 @@ def unmix_spectra(wavelength, absorption, dye, sigma=None):
         sigma = np.array(1)
     
     # re-write this to allow parameter damping and prefer zeros?
-    return fit_spectrum(x, y, aspl, bspl, sigma)
+    return fit_spectrum(x, y, aspl, bspl, sigma, p0=p0)
 
 
 
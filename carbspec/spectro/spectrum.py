@@ -1,19 +1,31 @@
 import os
+import warnings
 import numpy as np
 import pandas as pd
 import uncertainties as un
 import uncertainties.unumpy as unp
 import matplotlib.pyplot as plt
 import pickle
+from collections import OrderedDict
 
 from carbspec.spectro.mixture import unmix_spectra, pH_from_F, make_mix_spectra, make_mix_components
 from carbspec.alkalinity import TA_from_pH
 from carbspec.dye import K_handler
+from carbspec.profiling import profiled
 
 class Spectrum:
+    # variances default to None, so spectra pickled without them still load
+    dark_var = None
+    light_sample_raw_var = None
+    light_reference_raw_var = None
+    light_sample_var = None
+    light_reference_var = None
+    absorbance_sigma = None
+    
     def __init__(self, 
                  sample, timestamp, temp, sal, dye, splines, config_file, 
-                 wv, dark=None, scale_factor=None, light_sample_raw=None, light_reference_raw=None):
+                 wv, dark=None, scale_factor=None, light_sample_raw=None, light_reference_raw=None,
+                 dark_var=None, light_sample_raw_var=None, light_reference_raw_var=None):
         
         # metadata
         self.config_file = config_file
@@ -31,6 +43,11 @@ class Spectrum:
         self.light_sample_raw = light_sample_raw
         self.light_reference_raw = light_reference_raw
         
+        # variance of the averaged spectra
+        self.dark_var = dark_var
+        self.light_sample_raw_var = light_sample_raw_var
+        self.light_reference_raw_var = light_reference_raw_var
+        
         # calculated
         self.light_reference = None
         self.light_sample = None
@@ -44,9 +61,24 @@ class Spectrum:
     def correct_channels(self):
         self.light_reference = self.light_reference_raw - self.dark
         self.light_sample = self.light_sample_raw / self.scale_factor - self.dark
+        
+        if self.dark_var is not None and self.light_sample_raw_var is not None and self.light_reference_raw_var is not None:
+            self.light_reference_var = self.light_reference_raw_var + self.dark_var
+            self.light_sample_var = self.light_sample_raw_var / self.scale_factor**2 + self.dark_var
+        else:
+            self.light_reference_var = None
+            self.light_sample_var = None
     
     def calc_absorbance(self):
         self.absorbance = -1 * np.log10(self.light_sample / self.light_reference)
+        
+        if self.light_sample_var is not None and self.light_reference_var is not None:
+            # both channels share the dark correction, so covary by dark_var
+            self.absorbance_sigma = absorbance_sigma(
+                self.light_sample, self.light_reference, 
+                self.light_sample_var, self.light_reference_var, self.dark_var)
+        else:
+            self.absorbance_sigma = None
             
     # io functions
     def to_pickle(self, file):
@@ -66,6 +98,7 @@ class Spectrum:
             'light_sample_raw': self.light_sample_raw,
             'scale_factor': self.scale_factor,
             'absorbance': self.absorbance,
+            'absorbance_sigma': self.absorbance_sigma,
         }
         
         vars = [k for k in vardict if vardict[k] is not None]
@@ -120,6 +153,7 @@ class Spectrum:
         
         return Spectrum(timestamp=timestamp, sample=sample, wv=dat['wv'], config_file=config_file, dark=dat['dark'], scale_factor=dat['scale_factor'], light_sample_raw=light_sample_raw, light_reference_raw=light_reference_raw, temp=temp, sal=sal, dye=dye, splines=splines)
     
+    @profiled()
     def save(self, dat_file, pkl_file):
         self.to_dat(dat_file)
         self.to_pickle(pkl_file)
@@ -136,17 +170,165 @@ class Spectrum:
     def __repr__(self):
         return f'Spectrum from sample {self.sample} at {self.timestamp.strftime("%Y-%m-%d %H:%M:%S")}'
     
-def calc_pH(spectrum):
+class SpectrumCache:
+    """
+    A least-recently-used cache of spectra loaded from file.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of spectra held in memory.
+    """
+    def __init__(self, maxsize=50):
+        self.maxsize = maxsize
+        self._spectra = OrderedDict()
+    
+    def __len__(self):
+        return len(self._spectra)
+    
+    def __contains__(self, file):
+        return file in self._spectra
+    
+    def get(self, file):
+        if file in self._spectra:
+            self._spectra.move_to_end(file)
+            return self._spectra[file]
+        
+        spectrum = Spectrum.load(file)
+        self._spectra[file] = spectrum
+        while len(self._spectra) > self.maxsize:
+            self._spectra.popitem(last=False)
+        return spectrum
+    
+    def clear(self):
+        self._spectra.clear()
+
+spectrum_cache = SpectrumCache()
+
+class LazySpectrum:
+    """
+    A proxy for a saved Spectrum, which is only loaded when one of its
+    attributes is accessed.
+
+    Loaded spectra are held in a SpectrumCache, so only a limited number
+    stay in memory. When pickled, only the file location is stored.
+
+    The proxy is read-only, because a change to a cached spectrum would be
+    lost when it is evicted from the cache. To change a spectrum, `load`
+    it, change it and save it.
+
+    Parameters
+    ----------
+    file : str
+        The .pkl or .csv file containing the spectrum.
+    cache : SpectrumCache
+        The cache to load the spectrum through. Defaults to the module-level
+        `spectrum_cache`.
+    """
+    def __init__(self, file, cache=None):
+        object.__setattr__(self, 'file', file)
+        object.__setattr__(self, 'cache', cache)
+    
+    def _get_cache(self):
+        if self.cache is None:
+            return spectrum_cache
+        return self.cache
+    
+    @property
+    def loaded(self):
+        return self.file in self._get_cache()
+    
+    def load(self):
+        return self._get_cache().get(self.file)
+    
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+    
+    def __setattr__(self, name, value):
+        if name in ('file', 'cache'):
+            object.__setattr__(self, name, value)
+        else:
+            raise AttributeError(f"LazySpectrum is read-only: load() the spectrum to change '{name}'.")
+    
+    def __getstate__(self):
+        return {'file': self.file}
+    
+    def __setstate__(self, state):
+        object.__setattr__(self, 'file', state['file'])
+        object.__setattr__(self, 'cache', None)
+    
+    def __repr__(self):
+        return f'LazySpectrum from {self.file}'
+
+def absorbance_sigma(light_sample, light_reference, light_sample_var, light_reference_var, cov=0):
+    """
+    Propagate channel variances into the standard error of absorbance.
+
+    Parameters
+    ----------
+    light_sample, light_reference : array-like
+        The dark-corrected sample and reference intensities.
+    light_sample_var, light_reference_var : array-like
+        The variances of the sample and reference intensities.
+    cov : array-like
+        The covariance between the sample and reference intensities.
+
+    Returns
+    -------
+    array-like : the standard error of -log10(light_sample / light_reference)
+    """
+    var = (light_sample_var / light_sample**2 + light_reference_var / light_reference**2 
+           - 2 * cov / (light_sample * light_reference))
+    return np.sqrt(var) / np.log(10)
+
+def valid_sigma(sigma, size):
+    """
+    Return sigma if it is usable as fit weights, otherwise None.
+    """
+    if sigma is None:
+        return None
+    sigma = np.asanyarray(sigma, dtype=float)
+    if sigma.shape != (size,) or not np.all(np.isfinite(sigma)) or not np.all(sigma > 0):
+        return None
+    return sigma
+
+@profiled()
+def calc_pH(spectrum, p0=None, client=None):
     """Calculate pH from a spectrum
 
+    Pixels with undefined absorbance (e.g. with no light in a channel) are
+    excluded, with a RuntimeWarning. If the spectrum has a 
+    valid absorbance_sigma, the fit is weighted by it. If given, p0 is 
+    used as the starting point of the fit. If a fit server client is given
+    (see spectro.fitserver), the fit is done by the server.
+
     Returns
     -------
     tuple
         F, K, pH, fit_p
     """
-    fit_p = un.correlated_values(*unmix_spectra(spectrum.wv, spectrum.absorbance, spectrum.splines))
+    wv = np.asanyarray(spectrum.wv)
+    absorbance = np.asanyarray(spectrum.absorbance)
+    
+    # absorbance is undefined where there is no light in either channel
+    finite = np.isfinite(absorbance)
+    excluded = finite.size - finite.sum()
+    if excluded > 0:
+        warnings.warn(f'{excluded} of {finite.size} pixels of {spectrum.sample} have undefined absorbance, and are excluded from the fit.', RuntimeWarning, stacklevel=2)
+    
+    sigma = spectrum.absorbance_sigma
+    if sigma is not None:
+        sigma = valid_sigma(np.asanyarray(sigma)[finite], finite.sum())
+    
+    if client is not None:
+        p, cov, K = client.fit(wv[finite], absorbance[finite], spectrum.splines, spectrum.temp, spectrum.sal, sigma=sigma, p0=p0)
+        fit_p = un.correlated_values(p, cov)
+    else:
+        fit_p = un.correlated_values(*unmix_spectra(wv[finite], absorbance[finite], spectrum.splines, sigma=sigma, p0=p0))
+        K = K_handler(spectrum.splines, spectrum.temp, spectrum.sal)
     F = fit_p[1] / fit_p[0]
-    K = K_handler(spectrum.splines, spectrum.temp, spectrum.sal)
     pH = pH_from_F(F, K)
     
     return F, K, pH, fit_p
@@ -0,0 +1,196 @@
+import json
+import threading
+from contextlib import nullcontext
+
+import pandas as pd
+
+from carbspec.clock import get_clock
+
+class SampleTimings:
+    """
+    The stage timings of one sample. Made by StageTimer.sample().
+
+    Stages may be timed on several threads (e.g. acquisition, then fitting
+    on a pipeline worker), and a stage timed more than once (e.g. reading
+    the reference and the sample) accumulates.
+    """
+    def __init__(self, timer, id):
+        self.timer = timer
+        self.id = id
+        self.timestamp = None
+        self.sample = None
+        # (stage, start, duration, thread)
+        self.records = []
+        self.finished = False
+
+    def label(self, timestamp=None, sample=None):
+        """
+        Identify the sample, once it is known.
+        """
+        self.timestamp = timestamp
+        self.sample = sample
+
+    def stage(self, name):
+        """
+        A context manager timing the stage `name`.
+        """
+        return _Stage(self, name)
+
+    def record(self, name, start, duration):
+        self.records.append((name, start, duration, threading.current_thread().name))
+
+    def totals(self):
+        """
+        The total time of each stage (s).
+        """
+        totals = {}
+        for name, _, duration, _ in self.records:
+            totals[name] = totals.get(name, 0.) + duration
+        return totals
+
+    def finish(self):
+        """
+        Mark the sample complete, writing it to the JSON-lines file, if any.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self.timer._emit(self)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'timestamp': None if self.timestamp is None else str(self.timestamp),
+            'sample': self.sample,
+            'stages': self.totals(),
+            'records': [{'stage': name, 'start': start, 'duration': duration, 'thread': thread} for name, start, duration, thread in self.records],
+        }
+
+class _Stage:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.timings.timer.clock.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.record(self.name, self.start, self.timings.timer.clock.perf_counter() - self.start)
+        return False
+
+class _NullSampleTimings:
+    """
+    Stands in for SampleTimings when timing is disabled, doing nothing.
+    """
+    id = None
+    _stage = nullcontext()
+
+    def label(self, timestamp=None, sample=None):
+        pass
+
+    def stage(self, name):
+        return self._stage
+
+    def record(self, name, start, duration):
+        pass
+
+    def finish(self):
+        pass
+
+no_timings = _NullSampleTimings()
+
+class StageTimer:
+    """
+    Records how long each stage of handling a sample takes.
+
+    Each sample gets a SampleTimings (see `sample`), which times stages
+    with the monotonic `perf_counter` of the clock (see carbspec.clock).
+    When disabled, `sample` returns a shared object whose stages do
+    nothing, so timing costs a method call per stage.
+
+    Parameters
+    ----------
+    enabled : bool
+        Whether to record timings.
+    jsonl : str
+        If given, each finished sample is appended to this file as a line
+        of JSON.
+    maxlen : int
+        The number of samples kept in memory. All samples are written to
+        `jsonl`.
+    clock : carbspec.clock.Clock
+        Defaults to the current clock.
+    """
+    def __init__(self, enabled=True, jsonl=None, maxlen=10000, clock=None):
+        self.enabled = enabled
+        self.jsonl = jsonl
+        self.maxlen = maxlen
+        self.clock = get_clock() if clock is None else clock
+
+        self.samples = []
+        self._n = 0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """
+        Start timing a new sample.
+
+        Returns
+        -------
+        SampleTimings
+        """
+        if not self.enabled:
+            return no_timings
+
+        with self._lock:
+            timings = SampleTimings(self, self._n)
+            self._n += 1
+            self.samples.append(timings)
+            if len(self.samples) > self.maxlen:
+                del self.samples[:len(self.samples) - self.maxlen]
+        return timings
+
+    def _emit(self, timings):
+        if self.jsonl is None:
+            return
+        line = json.dumps(timings.to_dict(), default=str)
+        with self._lock:
+            with open(self.jsonl, 'a') as f:
+                f.write(line + '\n')
+
+    def to_frame(self):
+        """
+        The time of each stage of each sample, in seconds.
+
+        Returns
+        -------
+        pandas.DataFrame : one row per sample, with its timestamp and name,
+        a column per stage, and the total time of all stages. Stages that
+        overlap (e.g. in measure_sample_async) are all counted in the total.
+        """
+        with self._lock:
+            samples = list(self.samples)
+
+        rows = [{'id': s.id, 'timestamp': s.timestamp, 'sample': s.sample, **s.totals()} for s in samples]
+        frame = pd.DataFrame(rows, columns=None if rows else ['id', 'timestamp', 'sample']).set_index('id')
+        stages = [c for c in frame.columns if c not in ('timestamp', 'sample')]
+        frame['total'] = frame[stages].sum(axis=1)
+        return frame
+
+    def to_records(self):
+        """
+        Every timed stage, one row each.
+
+        Returns
+        -------
+        pandas.DataFrame : with columns id, timestamp, sample, stage, start,
+        duration (s) and thread.
+        """
+        with self._lock:
+            samples = list(self.samples)
+
+        rows = [(s.id, s.timestamp, s.sample, *record) for s in samples for record in s.records]
+        return pd.DataFrame(rows, columns=['id', 'timestamp', 'sample', 'stage', 'start', 'duration', 'thread'])
@@ -0,0 +1,11 @@
+import shutil
+import pytest
+
+@pytest.fixture
+def config_file(tmp_path):
+    """
+    A copy of the test config, so that sessions writing their setup don't change tests/carbspec.cfg.
+    """
+    file = str(tmp_path / 'carbspec.cfg')
+    shutil.copy('tests/carbspec.cfg', file)
+    return file
@@ -0,0 +1,72 @@
+import numpy as np
+from carbspec.instruments.acquisition import ScanAccumulator
+
+def test_accumulator_matches_full_spectrum():
+    rng = np.random.default_rng(0)
+    scans = rng.normal(1000, 50, size=(10, 300))
+    
+    for boxcar_width in [None, 4, 11]:
+        for roi in [None, np.arange(300) >= 3, (np.arange(300) > 20) & (np.arange(300) < 250)]:
+            acc = ScanAccumulator(300, roi=roi, boxcar_width=boxcar_width)
+            for scan in scans:
+                acc.add(scan)
+            
+            expected = scans.mean(axis=0)
+            if boxcar_width is not None:
+                expected = np.convolve(expected, np.ones(boxcar_width) / boxcar_width, mode='same')
+            if roi is not None:
+                expected = expected[roi]
+            
+            assert np.allclose(acc.mean(), expected)
+    
+    acc.reset()
+    assert acc.n == 0
+
+def test_accumulator_variance():
+    rng = np.random.default_rng(1)
+    scans = rng.normal(1000, 50, size=(20, 300))
+    
+    acc = ScanAccumulator(300)
+    for scan in scans:
+        acc.add(scan)
+    
+    assert np.allclose(acc.mean(), scans.mean(axis=0))
+    assert np.allclose(acc.var(), scans.var(axis=0, ddof=1) / scans.shape[0])
+    
+    acc = ScanAccumulator(300, boxcar_width=5)
+    assert acc.var() is None
+    for scan in scans:
+        acc.add(scan)
+    expected = np.convolve(scans.var(axis=0, ddof=1) / scans.shape[0], np.ones(5) / 25, mode='same')
+    assert np.allclose(acc.var(), expected)
+
+def test_sampler():
+    import time
+    from carbspec.instruments.sampler import Sampler
+    
+    calls = []
+    def read():
+        calls.append(1)
+        if len(calls) == 2:
+            raise IOError('serial timeout')
+        return 20. + len(calls)
+    
+    sampler = Sampler(read, interval=0.01)
+    assert sampler.mean_between(0, time.monotonic()) is None
+    
+    t0 = time.monotonic()
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    t1 = time.monotonic()
+    
+    assert not sampler.running
+    assert sampler.errors == 1
+    
+    t, v = sampler.readings()
+    mean, std, n = sampler.mean_between(t0, t1)
+    assert n == len(v) == len(calls) - 1
+    assert mean == v.mean()
+    
+    # no readings in the window: use the last one before it
+    assert sampler.mean_between(t1 + 1, t1 + 2)[0] == v[-1]
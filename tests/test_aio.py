@@ -0,0 +1,33 @@
+import asyncio
+import threading
+from carbspec.instruments.aio import AsyncInstrument
+
+class Probe:
+    def __init__(self, port):
+        self.port = port
+        self.connections = 0
+        self.thread = threading.current_thread().name
+        self.connect()
+    
+    def connect(self):
+        self.connections += 1
+    
+    def read(self):
+        return threading.current_thread().name
+
+def test_async_instrument():
+    async def run():
+        probe = await AsyncInstrument.open(Probe, 'COM1')
+        try:
+            # an instance's connect reconnects the instrument
+            await probe.connect()
+            return probe.instrument, await probe.read()
+        finally:
+            await probe.disconnect()
+    
+    instrument, thread = asyncio.run(run())
+    
+    assert instrument.port == 'COM1'
+    assert instrument.connections == 2
+    # the instrument is made and read on its own I/O thread
+    assert instrument.thread == thread != threading.current_thread().name
@@ -31,11 +31,11 @@ def user_input_TA_weights(*args, **kwargs):
     return '\n'
     
 
-def test_measurement_workflow(monkeypatch):
+def test_measurement_workflow(monkeypatch, config_file):
         
     monkeypatch.setattr('builtins.input', lambda _: '\n')
 
-    meas = TAMeasurementSession(dye='BPB', config_file='tests/carbspec.cfg')
+    meas = TAMeasurementSession(dye='BPB', config_file=config_file)
     
     meas.spectrometer.set_splines(meas.config.get('splines'))
     
@@ -57,6 +57,8 @@ def test_measurement_workflow(monkeypatch):
     
     meas.measure_sample('test1', plot_vars='absorbance')
     
+    meas.end_session()
+    
     assert True
 
 def test_reading_pkl():
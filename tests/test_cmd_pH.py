@@ -1,13 +1,16 @@
+import datetime as dt
+import asyncio
 import pytest
 import pandas as pd
 import shutil
 from carbspec.cmd.session import pHMeasurementSession
+from carbspec.clock import SimulatedClock, set_clock
 
-def test_measurement_workflow(monkeypatch):
+def test_measurement_workflow(monkeypatch, config_file):
         
     monkeypatch.setattr('builtins.input', lambda _: '\n')
 
-    meas = pHMeasurementSession(dye='MCP', config_file='tests/carbspec.cfg')
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file)
 
     meas.spectrometer.light_off()
     meas.collect_dark()
@@ -21,6 +24,16 @@ def test_measurement_workflow(monkeypatch):
 
     meas.spectrometer.newSample(f=0.6)
     meas.measure_sample('test1', plot_vars='absorbance')
+    # fits are weighted by the scan-to-scan scatter, however the spectrometer is read
+    assert meas.spectrum.absorbance_sigma is not None
+    
+    # results are changed by assigning the data table, not by writing to a copy of it
+    table = meas.data_table
+    table.loc[meas.timestamp, 'sal'] = 34.
+    meas.data_table = table
+    assert meas.data_table.loc[meas.timestamp, 'sal'] == 34.
+    
+    meas.end_session()
     
     assert True
 
@@ -30,6 +43,200 @@ def test_reading_pkl():
     
     assert True
 
+def test_pipelined_workflow(monkeypatch, config_file):
+    
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False, pipeline=True)
+    
+    meas.spectrometer.light_off()
+    meas.collect_dark()
+    
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_absent()
+    
+    meas.collect_scale_factor()
+    
+    meas.spectrometer.sample_present()
+    
+    results = []
+    for sample in ['test2', 'test3']:
+        meas.spectrometer.newSample(f=0.6)
+        meas.measure_sample(sample, callback=results.append)
+    
+    meas.end_session()
+    
+    assert len(results) == 2
+    assert meas.data_table.loc[meas.timestamp, 'sample'] == 'test3'
+
+def test_switch_settling(config_file):
+    
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False)
+    
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_present()
+    
+    times = meas.characterise_switch_latency(repeats=2, write=False)
+    assert len(times['reference']) == len(times['sample']) == 2
+    
+    # the dummy switch is instantaneous, so settles within a few probe reads
+    latency = meas.config.getfloat('beamswitch_latency')
+    assert latency < 0.1
+    assert meas._switch_to('sample', mode='fixed') >= latency
+    assert meas.spectrometer.integration_time == meas.config.getint('spec_integrationtime')
+    
+    meas.end_session()
+
+def test_adaptive_scans(monkeypatch, config_file):
+    
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+    
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False)
+    
+    meas.spectrometer.light_off()
+    meas.collect_dark()
+    
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_absent()
+    
+    meas.collect_scale_factor()
+    
+    meas.spectrometer.sample_present()
+    
+    meas._config.set('DEFAULT', 'spec_blockscans', '4')
+    meas._config.set('DEFAULT', 'spec_maxscans', '12')
+    
+    for target in ['1', '1e-9']:
+        meas._config.set('DEFAULT', 'spec_targetpHstd', target)
+        meas.spectrometer.newSample(f=0.6)
+        meas.collect_spectrum('adaptive', adaptive=True)
+    
+    log = meas.acquisition_log
+    assert list(log.loc[log.adaptive, 'sample_scans']) == [4, 12]
+    assert meas.spectrum.light_sample_raw.shape == meas.wv.shape
+    
+    meas.end_session()
+
+def test_simulated_clock(monkeypatch, config_file):
+    
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+    
+    clock = SimulatedClock(start=dt.datetime(2020, 1, 1))
+    previous = set_clock(clock)
+    try:
+        meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False)
+        
+        # the sampler waits in real time, so temperatures are read between spectra
+        assert not meas.temp_probe.sampling
+        with pytest.raises(RuntimeError):
+            meas.temp_probe.start_sampling()
+        
+        meas.spectrometer.light_off()
+        meas.collect_dark()
+        
+        meas.spectrometer.light_on()
+        meas.spectrometer.sample_absent()
+        
+        meas.collect_scale_factor()
+        
+        meas.spectrometer.sample_present()
+        
+        for i in range(5):
+            # a minute of sample handling between measurements
+            clock.advance(60)
+            meas.spectrometer.newSample(f=0.6)
+            meas.collect_spectrum(f'sim{i}')
+        
+        meas.end_session()
+    finally:
+        set_clock(previous)
+    
+    log = meas.acquisition_log
+    log = log.loc[log['sample'].str.startswith('sim')]
+    timestamps = pd.DatetimeIndex(log.timestamp)
+    assert timestamps[0] > pd.Timestamp(2020, 1, 1, 0, 1)
+    assert timestamps[-1] < pd.Timestamp(2020, 1, 1, 1)
+    assert (timestamps[1:] - timestamps[:-1] >= pd.Timedelta(60, 's')).all()
+    # acquisition takes simulated, not real, time
+    integration = 2 * meas.config.getint('spec_nscans') * meas.config.getint('spec_integrationtime') / 1000
+    assert (log.acquisition_time >= integration).all()
+    assert meas.data_table['temp_std'].iloc[-1] > 0
+
+def test_async_measurement(monkeypatch, config_file):
+    
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+    
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False)
+    
+    # individual temperature reads, each taking as long as a serial read
+    meas.temp_probe.stop_sampling()
+    meas.temp_probe.read_time = 0.05
+    
+    meas.spectrometer.light_off()
+    meas.collect_dark()
+    
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_absent()
+    
+    meas.collect_scale_factor()
+    
+    meas.spectrometer.sample_present()
+    
+    async def measure(n):
+        results = []
+        for i in range(n):
+            meas.spectrometer.newSample(f=0.6)
+            results.append(await meas.measure_sample_async(f'async{i}'))
+        return results
+    
+    # the order and overlap of instrument I/O is read from the stage timings
+    meas.timer.enabled = True
+    
+    n = 3
+    for i in range(n):
+        meas.spectrometer.newSample(f=0.6)
+        meas.measure_sample(f'sync{i}')
+    
+    results = asyncio.run(measure(n))
+    
+    meas.end_session()
+    
+    assert all(r[2].nominal_value > 0 for r in results)
+    assert meas.data_table['sample'].iloc[-1] == f'async{n - 1}'
+    assert meas.temp_std > 0
+    # the temperature scatter of each acquisition is kept with its result
+    table = meas.data_table
+    assert (table.loc[table['sample'].str.contains('sync'), 'temp_std'] > 0).all()
+    summary = pd.read_csv(meas.summary_dat)
+    assert summary['temp_std'].iloc[-1] == pytest.approx(meas.temp_std)
+    
+    records = meas.timer.to_records()
+    records['end'] = records['start'] + records['duration']
+    
+    def overlaps(sample):
+        r = records.loc[records['sample'] == sample]
+        temperature = r.loc[r.stage == 'temperature']
+        assert len(temperature) == 3 and (r.stage == 'spectrometer').sum() == 2
+        # switching and reading the spectrometer
+        acquisition = r.loc[r.stage.isin(['switch', 'spectrometer'])]
+        return [((t.start < acquisition.end) & (t.end > acquisition.start)).any() for t in temperature.itertuples()]
+    
+    def switches(sample):
+        return (records.loc[records['sample'] == sample, 'stage'] == 'switch').sum()
+    
+    for i in range(n):
+        # temperature reads run between spectrometer reads...
+        assert not any(overlaps(f'sync{i}'))
+        assert switches(f'sync{i}') == 2
+        # ...or while the spectrometer integrates, on another thread
+        assert all(overlaps(f'async{i}'))
+        async_records = records.loc[records['sample'] == f'async{i}']
+        assert set(async_records.loc[async_records.stage == 'temperature', 'thread']).isdisjoint(async_records.loc[async_records.stage == 'spectrometer', 'thread'])
+    
+    # the beam is returned to the reference cell while the previous sample is saved
+    assert switches('async0') == 2
+    assert all(switches(f'async{i}') == 1 for i in range(1, n))
+
 @pytest.fixture(scope="session", autouse=True)
 def cleanup(request):
     def remove_test_dir():
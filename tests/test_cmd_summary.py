@@ -0,0 +1,63 @@
+import datetime as dt
+import pytest
+import uncertainties as un
+from carbspec.cmd.summary import SummaryStore
+
+def test_append_and_load(tmp_path):
+    store = SummaryStore(str(tmp_path / 'summary.sqlite'))
+    
+    t0 = dt.datetime(2024, 1, 1, 12, 0, 0)
+    t1 = dt.datetime(2024, 1, 1, 12, 5, 0)
+    
+    store.append(t0, {'sample': 'a', 'temp': 25.0, 'pH': un.ufloat(8.0, 0.01), 'pkl_file': 'a.pkl'})
+    store.append(t1, {'sample': 'b', 'temp': 24.5, 'pH': un.ufloat(7.9, 0.02), 'pkl_file': 'b.pkl'})
+    
+    assert len(store) == 2
+    
+    dat = store.load()
+    
+    assert list(dat.index) == [t0, t1]
+    assert list(dat['sample']) == ['a', 'b']
+    assert dat.loc[t1, 'pH'].nominal_value == 7.9
+    assert dat.loc[t1, 'pH'].std_dev == 0.02
+    assert 'pH__std' not in dat.columns
+    
+    store.compact()
+    store.close()
+    
+    # reopening gives the same data
+    store = SummaryStore(str(tmp_path / 'summary.sqlite'))
+    assert len(store) == 2
+    store.close()
+
+def test_lazy_spectra(tmp_path):
+    import pickle
+    import numpy as np
+    from carbspec.spectro.spectrum import Spectrum, LazySpectrum, SpectrumCache
+    
+    wv = np.arange(400, 700, dtype=float)
+    files = []
+    for i in range(3):
+        s = Spectrum(sample=f's{i}', timestamp=dt.datetime(2024, 1, 1, 12, i), temp=25., sal=35., dye='MCP', splines='MCP_Cam1',
+                     config_file=None, wv=wv, dark=np.zeros_like(wv))
+        files.append(str(tmp_path / f's{i}.pkl'))
+        s.to_pickle(files[-1])
+    
+    cache = SpectrumCache(maxsize=2)
+    lazy = [LazySpectrum(f, cache) for f in files]
+    
+    assert not any(s.loaded for s in lazy)
+    
+    assert [s.sample for s in lazy] == ['s0', 's1', 's2']
+    assert len(cache) == 2
+    assert not lazy[0].loaded
+    
+    # changes would be lost when the spectrum is evicted from the cache
+    with pytest.raises(AttributeError):
+        lazy[0].sample = 'changed'
+    assert lazy[0].sample == 's0'
+    
+    # only the file location is pickled
+    restored = pickle.loads(pickle.dumps(lazy[2]))
+    assert restored.file == files[2]
+    assert restored.sample == 's2'
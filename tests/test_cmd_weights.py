@@ -0,0 +1,50 @@
+import pandas as pd
+from carbspec.cmd.weights import SampleWeights
+
+header = 'timestamp,+sample,+acid,m_sample,m_acid,C_acid\n'
+
+def test_csv_weights(tmp_path):
+    file = str(tmp_path / 'weights.csv')
+    weights = SampleWeights(file)
+    
+    t0 = pd.Timestamp('2024-01-01 12:00:00')
+    t1 = pd.Timestamp('2024-01-01 12:05:00')
+    
+    assert weights.get(t0) is None
+    
+    with open(file, 'w') as f:
+        f.write(header)
+        f.write(f'{t0},1,1,50.0,1.5,0.1\n')
+    
+    assert weights.get(t0)['m_sample'] == 50.0
+    assert weights.get(t1) is None
+    
+    cached = weights.read()
+    assert weights.read() is cached  # not re-read if unchanged
+    
+    with open(file, 'a') as f:
+        f.write(f'{t1},1,1,51.0,1.6,0.1\n')
+    
+    assert weights.changed()
+    assert weights.get(t1)['m_acid'] == 1.6
+    assert len(weights.read()) == 2
+
+def test_csv_edited_in_place(tmp_path):
+    file = str(tmp_path / 'weights.csv')
+    weights = SampleWeights(file)
+    
+    t0 = pd.Timestamp('2024-01-01 12:00:00')
+    
+    with open(file, 'w') as f:
+        f.write(header)
+        f.write(f'{t0},1,,50.0,,0.1\n')
+    
+    assert pd.isnull(weights.get(t0)['m_acid'])
+    
+    # the operator fills in the missing acid weight, and resaves
+    with open(file, 'w') as f:
+        f.write(header)
+        f.write(f'{t0},1,1.5,50.0,1.5,0.1\n')
+    
+    assert weights.get(t0)['m_acid'] == 1.5
+    assert len(weights.read()) == 1
@@ -0,0 +1,25 @@
+import numpy as np
+from carbspec.spectro.dark import DarkModel
+
+def test_dark_model(tmp_path):
+    rng = np.random.default_rng(0)
+    wv = np.arange(400, 700, dtype=float)
+    offset = rng.uniform(300, 400, wv.size)
+    rate = rng.uniform(0.1, 0.5, wv.size)
+    
+    times = [10, 20, 50, 100]
+    darks = [offset + rate * t + rng.normal(0, 1, wv.size) for t in times]
+    
+    model = DarkModel.fit(wv, times, darks)
+    assert np.allclose(model.predict(75), offset + rate * 75, atol=5)
+    assert np.all(model.predict_var(75) > 0)
+    
+    # weighted fit from two darks with known variance
+    weighted = DarkModel.fit(wv, times[:2], darks[:2], [np.ones(wv.size)] * 2)
+    assert np.allclose(weighted.predict(times[0]), darks[0])
+    
+    file = str(tmp_path / 'dark.npz')
+    model.save(file)
+    loaded = DarkModel.load(file)
+    assert np.allclose(loaded.predict(30), model.predict(30))
+    assert np.allclose(loaded.predict_var(30), model.predict_var(30))
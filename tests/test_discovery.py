@@ -0,0 +1,61 @@
+import os
+import time
+from types import SimpleNamespace
+from carbspec.instruments import dummy
+from carbspec.instruments.discovery import DeviceCache
+from carbspec.instruments.instrument import Instrument
+from carbspec.cmd.session import pHMeasurementSession
+
+def test_device_cache(tmp_path):
+    file = str(tmp_path / 'devices.json')
+    cache = DeviceCache(file)
+    assert not os.path.exists(file)
+
+    device = str(tmp_path / 'ttyUSB0')
+    open(device, 'w').close()
+    cache.record_port('OS-MINIUSB', SimpleNamespace(device=device, serial_number='A1', product='probe'))
+
+    # reloaded from the file
+    cache = DeviceCache(file)
+    assert cache.port('OS-MINIUSB').serial_number == 'A1'
+
+    # ports that have gone are not returned
+    os.remove(device)
+    assert cache.port('OS-MINIUSB') is None
+
+    cache.forget('OS-MINIUSB')
+    assert 'OS-MINIUSB' not in DeviceCache(file)
+
+def test_find_port_cached(tmp_path, monkeypatch):
+    device = str(tmp_path / 'ttyUSB0')
+    open(device, 'w').close()
+    scans = []
+
+    def grep(pattern):
+        scans.append(pattern)
+        return [SimpleNamespace(device=device, serial_number='A1', product='probe')]
+    monkeypatch.setattr('carbspec.instruments.instrument.list_ports.grep', grep)
+
+    cache = DeviceCache(str(tmp_path / 'devices.json'))
+    instrument = Instrument()
+    assert instrument.find_port(cache).device == device
+    assert instrument.find_port(cache).device == device
+    assert len(scans) == 1
+
+def test_concurrent_connection(tmp_path, config_file):
+    def slow(factory):
+        def connect(**kwargs):
+            time.sleep(0.2)
+            return factory(**kwargs)
+        return connect
+
+    instruments = SimpleNamespace(Spectrometer=slow(dummy.Spectrometer), BeamSwitch=slow(dummy.BeamSwitch), TempProbe=slow(dummy.TempProbe))
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False, instruments=instruments)
+
+    report = meas.startup_report()
+    meas.end_session()
+
+    assert {'config', 'summary', 'temp probe', 'beam switch', 'spectrometer', 'instruments', 'total'} <= set(report.index)
+    assert (report[['temp probe', 'beam switch', 'spectrometer']] >= 0.2).all()
+    # connected at the same time, not one after another
+    assert report['instruments'] < 0.5
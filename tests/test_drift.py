@@ -0,0 +1,22 @@
+import numpy as np
+from carbspec.spectro.drift import DriftMonitor
+
+def test_drift_monitor():
+    rng = np.random.default_rng(0)
+    wv = np.arange(400, 700, dtype=float)
+    setup = 20000 * np.exp(-((wv - 550) / 100)**2) + 5000
+    var = setup / 50
+    
+    monitor = DriftMonitor(setup, var, tolerance=1e-3)
+    
+    # noise and overall intensity changes are not drift
+    for scale in [1, 0.9, 1.1]:
+        monitor.update(scale * (setup + rng.normal(0, np.sqrt(var))), scale**2 * var)
+    assert not monitor.stale
+    
+    # a change in the shape of the lamp spectrum is
+    tilted = setup * (1 + 0.02 * (wv - 550) / 150)
+    for _ in range(10):
+        monitor.update(tilted + rng.normal(0, np.sqrt(var)), var)
+    assert monitor.stale
+    assert len(monitor.history) == 13
@@ -0,0 +1,191 @@
+import time
+import socket
+import pytest
+from types import SimpleNamespace
+import numpy as np
+from carbspec.dye.splines import load_splines
+from carbspec.spectro.mixture import make_mix_spectra, unmix_spectra
+from carbspec.spectro.spectrum import calc_pH
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from carbspec.spectro.fitserver import FitServer, FitClient, FitServerError, encode_request, decode_request
+
+wv = np.linspace(400, 700, 500)
+mixture = make_mix_spectra(load_splines('MCP_Cam1'))
+rng = np.random.default_rng(0)
+absorbance = mixture(wv, 0.8, 0.6, 0.01, 0.2, 1.) + rng.normal(0, 0.002, wv.size)
+
+def test_framing():
+    request = decode_request(encode_request(wv, absorbance, 'MCP_Cam1', 25., 35., sigma=0.002))
+    
+    assert request['dye'] == 'MCP_Cam1'
+    assert np.array_equal(request['absorbance'], absorbance)
+    assert np.all(request['sigma'] == 0.002)
+    assert request['p0'] is None
+
+def test_fit_server():
+    with FitServer() as server:
+        with FitClient(server.address) as client:
+            p, cov, K = client.fit(wv, absorbance, 'MCP_Cam1', 25., 35.)
+            
+            local_p, local_cov = unmix_spectra(wv, absorbance, 'MCP_Cam1')
+            assert np.allclose(p, local_p)
+            assert np.allclose(cov, local_cov)
+            
+            spectrum = SimpleNamespace(wv=wv, absorbance=absorbance, absorbance_sigma=None, splines='MCP_Cam1', temp=25., sal=35.)
+            F, K, pH, fit_p = calc_pH(spectrum, client=client)
+            assert np.isclose(pH.nominal_value, calc_pH(spectrum)[2].nominal_value)
+            
+            # one plan is kept for the dye and wavelength grid
+            assert len(server.plans) == 1
+            assert server.fits == 2
+
+def test_client_timeout():
+    other = mixture(wv, 0.5, 0.9, 0.01, 0.2, 1.) + rng.normal(0, 0.002, wv.size)
+    
+    with FitServer() as server:
+        process = server.process
+        delays = [0.5]
+        def slow(pending):
+            if delays:
+                time.sleep(delays.pop())
+            process(pending)
+        server.process = slow
+        
+        with FitClient(server.address, timeout=0.1) as client:
+            with pytest.raises(socket.timeout):
+                client.fit(wv, absorbance, 'MCP_Cam1', 25., 35.)
+            
+            # the late reply to the first request is not taken as the reply to the second
+            client.timeout = 5
+            p, _, _ = client.fit(wv, other, 'MCP_Cam1', 25., 35.)
+    
+    assert np.allclose(p, unmix_spectra(wv, other, 'MCP_Cam1')[0])
+
+def test_broken_pool(tmp_path):
+    with FitServer(str(tmp_path / 'fit.sock'), workers=2) as server:
+        class BrokenPool:
+            def submit(self, *args):
+                f = Future()
+                f.set_exception(BrokenProcessPool('A worker died.'))
+                return f
+            def shutdown(self, wait=True):
+                pass
+        server.pool = BrokenPool()
+        
+        with FitClient(server.address, timeout=5) as client:
+            # the error is reported, rather than the request waiting forever
+            with pytest.raises(FitServerError, match='worker died'):
+                client.fit(wv, absorbance, 'MCP_Cam1', 25., 35.)
+            
+            # and a new pool fits the next request
+            p, _, _ = client.fit(wv, absorbance, 'MCP_Cam1', 25., 35.)
+    
+    assert np.allclose(p[:2], unmix_spectra(wv, absorbance, 'MCP_Cam1')[0][:2], rtol=0.01)
+
+def test_oversized_frame():
+    with FitServer() as server:
+        with socket.create_connection(server.address, timeout=5) as sock:
+            # a length prefix claiming 4 GB is refused before anything is allocated
+            sock.sendall(b'\xff\xff\xff\xff')
+            assert sock.recv(1) == b''
+        
+        with FitClient(server.address) as client:
+            client.fit(wv, absorbance, 'MCP_Cam1', 25., 35.)
+    
+    assert server.fits == 1
+
+def test_socket_path_not_a_socket(tmp_path):
+    path = tmp_path / 'fit.sock'
+    path.write_text('data')
+    
+    with pytest.raises(FileExistsError):
+        FitServer(str(path))
+    assert path.read_text() == 'data'
+
+def test_unix_socket_workers(tmp_path):
+    with FitServer(str(tmp_path / 'fit.sock'), workers=2) as server:
+        with FitClient(server.address) as client:
+            p, cov, K = client.fit(wv, absorbance, 'MCP_Cam1', 25., 35., p0=[0.8, 0.6, 0.01, 0.2, 1.])
+    
+    assert np.allclose(p[:2], [0.8, 0.6], rtol=0.01)
+
+def make_session(tmp_path, server):
+    from configparser import ConfigParser
+    from carbspec.cmd.session import pHMeasurementSession
+    
+    config = ConfigParser()
+    config.read('tests/carbspec.cfg')
+    config['DEFAULT']['savedir'] = str(tmp_path)
+    config['DEFAULT']['fit_server'] = '{}:{}'.format(*server.address)
+    config_file = str(tmp_path / 'carbspec.cfg')
+    with open(config_file, 'w') as f:
+        config.write(f)
+    
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False)
+    
+    meas.spectrometer.light_off()
+    meas.collect_dark()
+    
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_absent()
+    
+    meas.collect_scale_factor()
+    
+    meas.spectrometer.sample_present()
+    meas.spectrometer.newSample(f=0.6)
+    return meas
+
+def test_session_fit_server(monkeypatch, tmp_path):
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+    
+    with FitServer() as server:
+        meas = make_session(tmp_path, server)
+        meas.measure_sample('served')
+        
+        meas.end_session()
+        
+        assert server.fits == 1
+
+def test_session_lost_fit_server(monkeypatch, tmp_path):
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+    
+    server = FitServer().start()
+    meas = make_session(tmp_path, server)
+    meas.measure_sample('served')
+    server.stop()
+    
+    # fitted locally once the server has gone
+    F, K, pH, fit_p = meas.measure_sample('local')
+    meas.end_session()
+    
+    assert meas.fit_client is None
+    assert pH.nominal_value > 0
+    assert server.fits == 1
+
+def test_session_failed_block_fit(monkeypatch, tmp_path):
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+    
+    from carbspec.spectro import fitserver
+    fit_request = fitserver.fit_request
+    failures = [1]
+    def failing(plan, request):
+        if failures:
+            failures.pop()
+            return fitserver.encode_error('The fit did not converge.')
+        return fit_request(plan, request)
+    monkeypatch.setattr(fitserver, 'fit_request', failing)
+    
+    with FitServer() as server:
+        meas = make_session(tmp_path, server)
+        meas._config.set('DEFAULT', 'spec_blockscans', '4')
+        meas._config.set('DEFAULT', 'spec_maxscans', '12')
+        meas._config.set('DEFAULT', 'spec_targetpHstd', '1e-9')
+        
+        # a block that fails to fit on the server is skipped, as it is when fitting locally
+        meas.collect_spectrum('adaptive', adaptive=True)
+        meas.end_session()
+    
+    assert not failures
+    assert meas.acquisition_log['sample_scans'].iloc[-1] == 12
+    assert server.fits == 2
@@ -0,0 +1,73 @@
+import os
+import pytest
+from configparser import ConfigParser
+from carbspec.cmd.manager import SessionManager
+from carbspec.cmd.session import TAMeasurementSession
+
+def make_config(tmp_path, benches):
+    config = ConfigParser()
+    config.read('tests/carbspec.cfg')
+    for bench in benches:
+        config[bench] = {'dye': 'MCP', 'splines': 'MCP_Cam1', 'savedir': str(tmp_path / bench), 'setup_file': ''}
+
+    file = str(tmp_path / 'carbspec.cfg')
+    with open(file, 'w') as f:
+        config.write(f)
+    return file
+
+def test_session_manager(monkeypatch, tmp_path):
+
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+
+    benches = ['bench1', 'bench2']
+    config_file = make_config(tmp_path, benches)
+
+    manager = SessionManager({b: {} for b in benches}, config_file=config_file)
+
+    for session in manager.sessions.values():
+        session.spectrometer.light_off()
+    manager.run('collect_dark')
+
+    for session in manager.sessions.values():
+        session.spectrometer.light_on()
+        session.spectrometer.sample_absent()
+    manager.run('collect_scale_factor')
+    
+    # each bench calibrates its own switch
+    manager.submit('bench1', 'characterise_switch_latency', repeats=1).result()
+
+    for session in manager.sessions.values():
+        session.spectrometer.sample_present()
+        session.spectrometer.newSample(f=0.6)
+
+    futures = {b: manager.measure(b, f'{b}_sample') for b in benches}
+    results = {b: f.result() for b, f in futures.items()}
+
+    manager.end()
+
+    for b in benches:
+        assert results[b][2].nominal_value > 0
+        assert manager[b].data_table['sample'].iloc[-1] == f'{b}_sample'
+        assert os.path.exists(os.path.join(tmp_path, b, 'MCP_summary.pkl'))
+
+    # each bench records its own setup in the shared config file
+    config = ConfigParser()
+    config.read(config_file)
+    assert config['bench1']['setup_file'] != config['bench2']['setup_file']
+    assert config['bench1']['beamswitch_latency'] == manager['bench1'].config['beamswitch_latency']
+    assert 'beamswitch_latency' not in config['bench2']
+
+def test_session_manager_rejects(tmp_path):
+    config_file = make_config(tmp_path, ['bench1', 'bench2'])
+    
+    with pytest.raises(ValueError, match='pipelined'):
+        SessionManager({'bench1': {}}, config_file=config_file, session_class=TAMeasurementSession)
+    
+    # both benches would write the same summary files
+    config = ConfigParser()
+    config.read(config_file)
+    config['bench2']['savedir'] = config['bench1']['savedir']
+    with open(config_file, 'w') as f:
+        config.write(f)
+    with pytest.raises(ValueError, match='both save to'):
+        SessionManager({'bench1': {}, 'bench2': {}}, config_file=config_file)
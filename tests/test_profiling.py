@@ -0,0 +1,50 @@
+import os
+import json
+import glob
+import pstats
+from carbspec import profiling
+from carbspec.cmd.session import pHMeasurementSession
+
+def test_profiling(monkeypatch, tmp_path, config_file):
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False)
+    meas.spectrometer.light_off()
+    meas.collect_dark()
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_absent()
+    meas.collect_scale_factor()
+    meas.spectrometer.sample_present()
+
+    directory = str(tmp_path / 'profile')
+    with profiling.profile(directory, memory=True, snapshot_interval=2):
+        assert profiling.is_enabled()
+        for i in range(3):
+            meas.measure_sample(f'profiled{i}')
+    assert not profiling.is_enabled()
+
+    # not profiled once disabled
+    meas.measure_sample('unprofiled')
+    meas.end_session()
+
+    stats = pstats.Stats(os.path.join(directory, 'pHMeasurementSession.measure_sample.prof'))
+    assert any(func[2] == 'calc_pH' for func in stats.stats)
+    assert os.path.exists(os.path.join(directory, 'pHMeasurementSession.measure_sample.txt'))
+
+    with open(os.path.join(directory, 'calls.jsonl')) as f:
+        calls = [json.loads(line) for line in f]
+    outer = [c for c in calls if c['stage'] == 'pHMeasurementSession.measure_sample']
+    assert len(outer) == 3
+    assert all(c['profiled'] for c in outer)
+    # calls within a profiled function are profiled as their own stage
+    inner = [c for c in calls if c['stage'] == 'calc_pH']
+    assert len(inner) == 3 and all(c['profiled'] for c in inner)
+    stats = pstats.Stats(os.path.join(directory, 'calc_pH.prof'))
+    assert stats.stats[next(func for func in stats.stats if func[2] == 'calc_pH')][1] == 3
+    assert not any(func[2] == 'save_summary' for func in stats.stats)
+    assert all(c['memory'] > 0 for c in calls)
+
+    # first and third calls
+    snapshots = sorted(glob.glob(os.path.join(directory, 'pHMeasurementSession.measure_sample-*.snapshot')))
+    assert len(snapshots) == 2
+    assert len(profiling.compare_snapshots(*snapshots, limit=5)) == 5
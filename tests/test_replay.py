@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from carbspec.instruments.replay import ReplaySource, load_dat_record
+from carbspec.cmd.session import pHMeasurementSession
+
+files = 'SI/data/pH/CRM1_*.dat'
+
+def test_load_dat_record():
+    record = load_dat_record('SI/data/pH/CRM1_DICKSON_D10_CRM_100211_03_12_2019.dat')
+    
+    for k in ['dark', 'blank_reference', 'blank_sample', 'reference', 'sample']:
+        assert record[k].shape == record['wv'].shape
+    assert record['temp'] == 26.311
+
+def test_replay_session(monkeypatch, config_file):
+    
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+    
+    source = ReplaySource.from_dat(files, speed=None)
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False, instruments=source)
+    
+    meas.spectrometer.light_off()
+    meas.collect_dark()
+    
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_absent()
+    
+    meas.collect_scale_factor()
+    
+    meas.spectrometer.sample_present()
+    meas.collect_spectrum('replay')
+    
+    record = source.record
+    filt = (record['wv'] >= meas.wv.min()) & (record['wv'] <= meas.wv.max())
+    
+    # spectra are played back as recorded (with boxcar smoothing)
+    assert np.allclose(meas.dark[5:-5], np.convolve(record['dark'], np.ones(meas.boxcar_width) / meas.boxcar_width, mode='same')[filt][5:-5])
+    assert meas.spectrum.light_sample_raw.shape == meas.wv.shape
+    assert meas.temp == pytest.approx(record['temp'])
+    
+    # the recording has no light in part of the blue, which is excluded from the fit
+    with pytest.warns(RuntimeWarning, match='undefined absorbance'):
+        _, _, pH, _ = meas.fit_pH(meas.spectrum)
+    assert np.isfinite(pH.nominal_value)
+    
+    meas.spectrometer.newSample()
+    assert source.index == 1
+    
+    meas.end_session()
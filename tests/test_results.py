@@ -0,0 +1,81 @@
+import io
+import pytest
+import numpy as np
+import pandas as pd
+import uncertainties as un
+from carbspec.results import ResultBuffer
+
+columns = {'sample': 'object', 'temp': 'float', 'pH': 'ufloat'}
+
+def test_append_grows():
+    buffer = ResultBuffer(columns, index_name='i', chunk_size=4)
+    
+    for i in range(10):
+        buffer.append(i, sample=f's{i}', temp=20 + i, pH=un.ufloat(8, 0.01 * (i + 1)))
+    
+    assert len(buffer) == 10
+    assert buffer._capacity >= 10
+    assert np.array_equal(buffer.nominal_values('temp'), 20 + np.arange(10))
+    assert np.allclose(buffer.std_devs('pH'), 0.01 * (np.arange(10) + 1))
+    
+    df = buffer.to_dataframe()
+    assert df.index.name == 'i'
+    assert list(df['sample']) == [f's{i}' for i in range(10)]
+    assert df.loc[3, 'pH'].std_dev == 0.04
+    
+    tail = buffer.to_dataframe(start=-2)
+    assert list(tail.index) == [8, 9]
+    
+    flat = buffer.to_dataframe(uncertainties=False)
+    assert 'pH_std' in flat.columns
+
+def test_update_and_pop():
+    buffer = ResultBuffer(columns)
+    buffer.append('a', sample='a')
+    buffer.update('a', temp=25., pH=7.5)
+    
+    row = buffer.row('a')
+    assert row['temp'] == 25.
+    assert row['pH'] == 7.5
+    
+    buffer.append('b', sample='b')
+    assert buffer.pop()['sample'] == 'b'
+    assert 'b' not in buffer
+    assert len(buffer) == 1
+
+def test_value_and_csv():
+    buffer = ResultBuffer(columns, index_name='i', chunk_size=4)
+    for i in range(10):
+        buffer.append(i, sample=f's{i}', temp=20 + i, pH=un.ufloat(8, 0.01))
+    
+    assert buffer.value(-1, 'sample') == 's9'
+    assert buffer.value(2, 'pH').std_dev == 0.01
+    
+    f = io.StringIO()
+    buffer.to_csv(f, chunk_size=3)
+    f.seek(0)
+    df = pd.read_csv(f, index_col='i')
+    
+    assert list(df.index) == list(range(10))
+    assert list(df.columns) == ['sample', 'temp', 'pH', 'pH_std']
+    assert np.allclose(df.pH_std, 0.01)
+
+def test_duplicate_keys():
+    buffer = ResultBuffer(columns)
+    buffer.append('a', sample='a', temp=20.)
+    
+    with pytest.raises(KeyError):
+        buffer.append('a', sample='b')
+    assert buffer.row('a')['sample'] == 'a'
+    
+    # extending updates existing rows, keeping the last value
+    df = pd.DataFrame({'sample': ['b', 'c', 'd'], 'temp': [21., 22., 23.]}, index=['a', 'c', 'c'])
+    buffer.extend(df)
+    assert list(buffer.index) == ['a', 'c']
+    assert buffer.row('c')['temp'] == 23.
+    
+    buffer.clear()
+    assert len(buffer) == 0
+    assert 'a' not in buffer
+    buffer.append('a', sample='e')
+    assert np.isnan(buffer.row('a')['temp'])
@@ -0,0 +1,106 @@
+import json
+from carbspec.timing import StageTimer, no_timings
+from configparser import ConfigParser
+from carbspec.cmd.session import pHMeasurementSession, TAMeasurementSession
+
+def test_stage_timer(tmp_path):
+    assert StageTimer(enabled=False).sample() is no_timings
+
+    file = str(tmp_path / 'timings.jsonl')
+    timer = StageTimer(jsonl=file)
+    for i in range(3):
+        timing = timer.sample()
+        for stage in ['read', 'read', 'fit']:
+            with timing.stage(stage):
+                pass
+        timing.label(sample=f's{i}')
+        timing.finish()
+
+    frame = timer.to_frame()
+    assert list(frame['sample']) == ['s0', 's1', 's2']
+    assert {'read', 'fit', 'total'} <= set(frame.columns)
+    assert (frame['total'] >= frame['read']).all()
+    assert len(timer.to_records()) == 9
+
+    with open(file) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['sample'] for line in lines] == ['s0', 's1', 's2']
+    assert len(lines[0]['records']) == 3
+
+def test_session_timings(monkeypatch, tmp_path, config_file):
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+
+    meas = pHMeasurementSession(dye='MCP', config_file=config_file, plotting=False)
+    assert meas.timer.enabled is False
+
+    meas.timer.enabled = True
+    meas.timer.jsonl = str(tmp_path / 'timings.jsonl')
+
+    meas.spectrometer.light_off()
+    meas.collect_dark()
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_absent()
+    meas.collect_scale_factor()
+    meas.spectrometer.sample_present()
+
+    meas.measure_sample('timed')
+    meas.end_session()
+
+    timings = meas.timings
+    assert list(timings['sample']) == ['dark', 'setup', 'timed']
+    assert all(s.finished for s in meas.timer.samples)
+    assert timings['save spectrum'].iloc[1] > 0
+    for stage in ['switch', 'spectrometer', 'fit', 'save spectrum', 'save summary']:
+        assert timings[stage].iloc[-1] > 0
+    # two reads of spec_nscans scans of spec_integrationtime ms
+    integration = 2 * meas.config.getint('spec_nscans') * meas.config.getint('spec_integrationtime') / 1000
+    assert timings['spectrometer'].iloc[-1] >= integration
+
+    with open(tmp_path / 'timings.jsonl') as f:
+        assert [json.loads(line)['sample'] for line in f] == ['dark', 'setup', 'timed']
+
+def test_TA_session_timings(monkeypatch, tmp_path):
+    monkeypatch.setattr('carbspec.cmd.session.pyperclip.copy', lambda text: None)
+    monkeypatch.setattr('builtins.input', lambda _: '\n')
+
+    weights_file = str(tmp_path / 'weights.csv')
+    config = ConfigParser()
+    config.read('tests/carbspec.cfg')
+    config['DEFAULT']['savedir'] = str(tmp_path)
+    config['DEFAULT']['timing'] = 'True'
+    config['DEFAULT']['timing_log'] = 'True'
+    config['BPB']['sample_weight_spreadsheet'] = weights_file
+    config_file = str(tmp_path / 'carbspec.cfg')
+    with open(config_file, 'w') as f:
+        config.write(f)
+
+    meas = TAMeasurementSession(dye='BPB', config_file=config_file, plotting=False)
+    meas.spectrometer.set_splines(meas.config.get('splines'))
+
+    meas.spectrometer.light_off()
+    meas.collect_dark()
+    meas.spectrometer.light_on()
+    meas.spectrometer.sample_absent()
+    meas.collect_scale_factor()
+    meas.spectrometer.sample_present()
+
+    def enter_weights(_):
+        # the operator records the weights of the sample just measured
+        with open(weights_file, 'w') as f:
+            f.write('timestamp,+sample,+acid,m_sample,m_acid,C_acid\n')
+            f.write(f'{meas.timestamp},1,1,50.0,1.5,0.1\n')
+        return '\n'
+    monkeypatch.setattr('builtins.input', enter_weights)
+
+    meas.measure_sample('TA sample')
+    meas.end_session()
+
+    timings = meas.timings
+    assert timings['sample'].iloc[-1] == 'TA sample'
+    for stage in ['spectrometer', 'fit', 'save spectrum', 'save summary']:
+        assert timings[stage].iloc[-1] > 0
+
+    with open(tmp_path / 'BPB_timings.jsonl') as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['sample'] for line in lines] == ['dark', 'setup', 'TA sample']
+    assert 'save summary' in lines[-1]['stages']